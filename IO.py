@@ -25,9 +25,12 @@
 """
 
 import errno
+import hashlib
 import logging
 import networkx as nx
+import numpy as np
 import os
+import tempfile
 import yaml
 
 import utility
@@ -37,14 +40,350 @@ __copyright__ = "E-VRP  Copyright (C)  2017"
 __license__ = "GPL3"
 
 
+fclass_whitelist = ('living_street', 'motorway', 'motorway_link', 'primary',
+                    'primary_link', 'residential', 'secondary', 'tertiary',
+                    'unclassified')
+"""OpenStreetMap classes of the roads which can be used by vehicles."""
+
+imported_attributes = ('length', 'maxspeed', 'oneway', 'osm_id', 'speed')
+"""Road attributes kept by the import (the ones of abstract graphs)."""
+
+binary_workspace = ('nodes.npy', 'edges.npy')
+"""Files with the binary form of the shapefiles of a workspace."""
+
+edges_per_chunk = 2 ** 16
+"""Roads kept in memory by the import before writing their binary form."""
+
+_geometry_attributes = ('ShpName', 'Wkb', 'Wkt', 'Json')
+"""Attributes added by networkx.read_shp() which are not stored."""
+
+
+def _edges_chunk_table(chunk):
+    """Return table of edges in chunk, a list of (src, dest, attributes)."""
+    return _attributes_table(
+        {'src': np.array([src for src, dest, data in chunk], dtype=np.int64),
+         'dest': np.array([dest for src, dest, data in chunk],
+                          dtype=np.int64)},
+        _attribute_columns([data for src, dest, data in chunk]))
+
+
+def _attribute_columns(attributes):
+    """Return dictionary {attribute: list of values} of items.
+
+       attributes is the list of attribute dictionaries of items, None
+       marks the items without an attribute.
+    """
+    fields = sorted({field for data in attributes for field in data})
+    return {field: [data.get(field) for data in attributes]
+            for field in fields}
+
+
+def _attributes_table(first_columns, attribute_columns):
+    """Return structured array of the attributes of nodes or edges.
+
+       first_columns is a dictionary {field: list} of the leading fields,
+       attribute_columns the one returned by _attribute_columns();
+       attributes which are not numbers or strings are dropped, if an
+       attribute is missing in some items a boolean field '?attribute'
+       marks where it is present.
+    """
+    columns = {field: np.array(values)
+               for field, values in first_columns.items()}
+    for field, values in attribute_columns.items():
+        if field in _geometry_attributes:
+            continue
+        kinds = {type(value) for value in values if value is not None}
+        for dtype, fill, allowed in ((bool, False, {bool}),
+                                     (np.int64, 0, {int}),
+                                     (np.float64, 0.0, {int, float}),
+                                     (str, '', {str})):
+            if kinds and kinds <= allowed:
+                columns[field] = np.array([fill if value is None else value
+                                           for value in values], dtype=dtype)
+                if None in values:
+                    columns['?' + field] = np.array([value is not None
+                                                     for value in values])
+                break
+
+    size = len(next(iter(first_columns.values())))
+    table = np.zeros(size, dtype=[(field, array.dtype)
+                                  for field, array in columns.items()])
+    for field, array in columns.items():
+        table[field] = array
+    return table
+
+
+def _attributes_rows(table, first_fields):
+    """Return iterator over attribute dictionaries of table rows.
+
+       table is an array returned by _attributes_table(), whose
+       first_fields are not attributes.
+    """
+    fields = [field for field in table.dtype.names
+              if field not in first_fields and not field.startswith('?')]
+    columns = {field: table[field].tolist() for field in fields}
+    present = {field: table['?' + field].tolist() for field in fields
+               if '?' + field in table.dtype.names}
+    for row in range(len(table)):
+        yield {field: columns[field][row] for field in fields
+               if field not in present or present[field][row]}
+
+
+def write_binary_workspace(osm_g, ws):
+    """Write to ws the binary form of the graph read from its shapefiles.
+
+       nodes.npy has the (lon, lat) coordinates and the attributes of
+       nodes, edges.npy the indices (in nodes.npy) of the endpoints and the
+       attributes of edges; both are structured arrays which can be
+       memory-mapped.
+
+       Raises OSError if ws is not writable
+    """
+    coordinates = osm_g.nodes()
+    ids = {coor: index for index, coor in enumerate(coordinates)}
+    edges = osm_g.edges(data=True)
+    _write_binary_tables(
+        ws,
+        _attributes_table({'lon': [lon for lon, lat in coordinates],
+                           'lat': [lat for lon, lat in coordinates]},
+                          _attribute_columns([osm_g.node[coor]
+                                              for coor in coordinates])),
+        _attributes_table({'src': [ids[src] for src, dest, data in edges],
+                           'dest': [ids[dest] for src, dest, data in edges]},
+                          _attribute_columns([data for src, dest, data
+                                              in edges])))
+
+
+def _write_binary_tables(ws, nodes, edges):
+    """Write nodes and edges tables to ws as nodes.npy and edges.npy.
+
+       A table can also be the list of the files of its chunks, which are
+       concatenated by _concatenate_chunks().
+    """
+    for name, table in zip(binary_workspace, (nodes, edges)):
+        # a file is never read while partially written
+        with tempfile.NamedTemporaryFile(dir=ws, prefix=f'.{name}.',
+                                         suffix='.tmp', delete=False) as f:
+            temp_name = f.name
+        try:
+            if isinstance(table, np.ndarray):
+                with open(temp_name, 'wb') as f:
+                    np.save(f, table)
+            else:
+                _concatenate_chunks(temp_name, table)
+            os.replace(temp_name, os.path.join(ws, name))
+        finally:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+
+
+def _write_chunk(ws, name, table, chunks):
+    """Save table to a temporary file of ws and append its name to chunks.
+
+       name is the one of the binary file the chunk is part of.
+    """
+    with tempfile.NamedTemporaryFile(dir=ws, prefix=f'.{name}.',
+                                     suffix='.tmp', delete=False) as f:
+        chunks.append(f.name)
+        np.save(f, table)
+
+
+def _concatenate_chunks(file_name, chunks):
+    """Save to file_name the concatenation of the tables in chunks files.
+
+       Tables are the ones returned by _attributes_table() and they are
+       copied one at a time; an attribute gets the dtype common to all the
+       chunks (it is dropped if there is not) and a boolean field
+       '?attribute' if it is missing in some items.
+    """
+    tables = [np.load(chunk, mmap_mode='r') for chunk in chunks]
+    names = dict.fromkeys(name for table in tables
+                          for name in table.dtype.names
+                          if not name.startswith('?'))
+    dtype = list()
+    for name in names:
+        try:
+            dtype.append((name, np.result_type(*(
+                table.dtype[name] for table in tables
+                if name in table.dtype.names))))
+        except TypeError:
+            continue  # numbers and strings
+        if any(name not in table.dtype.names
+               or '?' + name in table.dtype.names for table in tables):
+            dtype.append(('?' + name, bool))
+
+    # a new file is filled with zeros, which are the missing values
+    ret = np.lib.format.open_memmap(file_name, mode='w+', dtype=dtype,
+                                    shape=(sum(map(len, tables)),))
+    start = 0
+    for table in tables:
+        stop = start + len(table)
+        for name in ret.dtype.names:
+            if name in table.dtype.names:
+                ret[name][start:stop] = table[name]
+            elif name.startswith('?'):
+                ret[name][start:stop] = name[1:] in table.dtype.names
+        start = stop
+    ret.flush()
+
+
+def _is_temporary(f):
+    """Return whether f is left over by an interrupted workspace write."""
+    return f.startswith('.') and f.endswith('.tmp')
+
+
+def read_binary_workspace(ws):
+    """Return graph of the binary form of ws shapefiles.
+
+       Nodes and edges are added in the order of networkx.read_shp(), so
+       the graph is the same it would return (but for geometries);
+       None is returned if binary files are missing or older than the
+       shapefiles.
+    """
+    files = [os.path.join(ws, name) for name in binary_workspace]
+    if not all(os.path.isfile(f) for f in files):
+        return None
+    if max((os.path.getmtime(os.path.join(ws, f)) for f in os.listdir(ws)
+            if f not in binary_workspace and not _is_temporary(f)),
+           default=0) > min(os.path.getmtime(f) for f in files):
+        return None
+
+    nodes, edges = (np.load(f, mmap_mode='r') for f in files)
+    coordinates = list(zip(nodes['lon'].tolist(), nodes['lat'].tolist()))
+    ret = nx.DiGraph()
+    for coor, data in zip(coordinates, _attributes_rows(nodes,
+                                                        ('lon', 'lat'))):
+        ret.add_node(coor, data)
+    for src, dest, data in zip(edges['src'].tolist(), edges['dest'].tolist(),
+                               _attributes_rows(edges, ('src', 'dest'))):
+        ret.add_edge(coordinates[src], coordinates[dest], data)
+    return ret
+
+
+class ElevationRaster(object):
+    """Digital elevation model read from a GeoTIFF or an ESRI ASCII grid.
+
+       Cells are in a 2D array whose first row is the northern one, their
+       coordinates are in decimal degrees (like the ones of OpenStreetMap
+       shapefiles).
+    """
+
+    def __init__(self, file_name):
+        """Read raster in file_name (.asc files are ESRI ASCII grids).
+
+           GeoTIFF files are read with GDAL and memory-mapped when
+           possible, so only the cells around sampled points are read.
+
+           Raises FileNotFoundError
+        """
+        if not os.path.isfile(file_name):
+            raise FileNotFoundError(errno.ENOENT, 'Elevation raster not '
+                                    f'found ({file_name})')
+        if file_name.lower().endswith('.asc'):
+            self._read_ascii_grid(file_name)
+            return
+
+        try:
+            from osgeo import gdal
+        except ImportError:
+            raise ImportError('Reading GeoTIFF requires GDAL: '
+                              'http://www.gdal.org/')
+        gdal.UseExceptions()
+        # the dataset must live as long as its memory-mapped band
+        self._dataset = gdal.Open(file_name)
+        band = self._dataset.GetRasterBand(1)
+        try:
+            self._values = band.GetVirtualMemAutoArray()
+        except (AttributeError, RuntimeError):
+            self._values = band.ReadAsArray()
+        west, width, __, north, __, height = self._dataset.GetGeoTransform()
+        self._transform = (west, width, north, height)
+        self._nodata = band.GetNoDataValue()
+
+    def _read_ascii_grid(self, file_name):
+        """Read header and cells of an ESRI ASCII grid."""
+        header, header_lines = dict(), 0
+        with open(file_name, 'r') as f:
+            for line in f:
+                tokens = line.split()
+                if tokens and not tokens[0][0].isalpha():
+                    break
+                header_lines += 1
+                if tokens:
+                    header[tokens[0].lower()] = float(tokens[1])
+        rows, size = int(header['nrows']), header['cellsize']
+        west = header.get('xllcorner', header.get('xllcenter', 0) - size / 2)
+        south = header.get('yllcorner', header.get('yllcenter', 0) - size / 2)
+        self._values = np.loadtxt(file_name, skiprows=header_lines,
+                                  dtype=np.float64, ndmin=2)
+        self._transform = (west, size, south + rows * size, -size)
+        self._nodata = header.get('nodata_value')
+
+    def altitudes(self, lon, lat):
+        """Return array of the altitudes of points by bilinear interpolation.
+
+           lon and lat are sequences of point coordinates; the altitude is
+           NaN for points out of the raster or next to cells without data.
+        """
+        west, width, north, height = self._transform
+        rows, cols = self._values.shape
+        # coordinates in cells, whose centers have integer ones
+        u = (np.asarray(lon, dtype=np.float64) - west) / width - 0.5
+        v = (np.asarray(lat, dtype=np.float64) - north) / height - 0.5
+        invalid = ((u < -0.5) | (u > cols - 0.5)
+                   | (v < -0.5) | (v > rows - 0.5))
+        u, v = np.clip(u, 0, cols - 1), np.clip(v, 0, rows - 1)
+        j0 = np.minimum(np.floor(u).astype(np.int64), max(cols - 2, 0))
+        i0 = np.minimum(np.floor(v).astype(np.int64), max(rows - 2, 0))
+        j1, i1 = np.minimum(j0 + 1, cols - 1), np.minimum(i0 + 1, rows - 1)
+        t, s = u - j0, v - i0
+
+        ret = np.zeros_like(u)
+        for i, j, weight in ((i0, j0, (1 - s) * (1 - t)),
+                             (i0, j1, (1 - s) * t),
+                             (i1, j0, s * (1 - t)),
+                             (i1, j1, s * t)):
+            corner = np.asarray(self._values[i, j], dtype=np.float64)
+            # cells without data matter only if they weigh something
+            if self._nodata is not None:
+                missing = (np.isnan(corner) if np.isnan(self._nodata)
+                           else corner == self._nodata)
+                invalid |= missing & (weight > 0)
+                corner[missing] = 0
+            ret += weight * corner
+        ret[invalid] = np.nan
+        return ret
+
+
+def check_altitude(osm_g):
+    """Ensure each node of graph read from workspace has an altitude.
+
+       Otherwise it could raise:
+       - NameError
+       - TypeError
+    """
+    altitude = utility.CLI.args().altitude
+    for (lon, lat), data in osm_g.nodes_iter(data=True):
+        if altitude not in data:
+            raise NameError(f'Could not find \'{altitude}\' attribute in '
+                            'nodes.shp')
+
+        # check each altitude attribute is a floating point number
+        if not isinstance(data[altitude], float) \
+           and not isinstance(data[altitude], int):
+            raise TypeError(f'Altitude of node lat: {lat}, lon {lon} '
+                            'is not a float')
+
+
 def check_workspace():
     """Ensure workspace exist and it contains only necessary files.
 
+       Altitudes of nodes are checked while the graph is read (see
+       check_altitude()), so files are read only once.
+
        Otherwise it could raise:
        - FileExistsError
        - FileNotFoundError
-       - NameError
-       - TypeError
     """
     ws = utility.CLI.args().workspace
     if not os.path.isdir(ws):
@@ -59,25 +398,12 @@ def check_workspace():
         raise FileNotFoundError(errno.ENOENT, 'nodes.shp not found in '
                                 f'workspace ({ws})')
 
-    graph_read = nx.read_shp(path=os.path.join(ws, 'nodes.shp'), simplify=True)
-
-    # check each node has an altitude attribute
-    altitude = utility.CLI.args().altitude
-    for (lon, lat), data in graph_read.nodes_iter(data=True):
-        if altitude not in data:
-            raise NameError(f'Could not find \'{altitude}\' attribute in '
-                            'nodes.shp')
-
-        # check each altitude attribute is a floating point number
-        if not isinstance(data[altitude], float) \
-           and not isinstance(data[altitude], int):
-            raise TypeError(f'Altitude of node lat: {lat}, lon {lon} '
-                            'is not a float')
-
     for f in os.listdir(ws):
+        if _is_temporary(f):
+            continue  # left by an interrupted _write_binary_tables()
         if f not in [prefix + suffix
                      for prefix in ('nodes.', 'edges.')
-                     for suffix in ('dbf', 'shp', 'shx')]:
+                     for suffix in ('dbf', 'npy', 'shp', 'shx')]:
             raise FileExistsError(errno.EEXIST, 'Please remove '
                                   '\'{}\''.format(os.path.join(ws, f)))
 
@@ -116,27 +442,210 @@ def export_problem_to_directory(exit_on_success=False):
 def import_shapefile_to_workspace(exit_on_success=False):
     """Populate workspace with translation of import_shapefile into a graph.
 
-       Raises NameError
+       Roads are read and written one at a time: the ones whose fclass is
+       not in fclass_whitelist are dropped, multi-lines are split in their
+       lines and only imported_attributes are kept; the binary form of
+       edges is written every edges_per_chunk roads and concatenated at
+       the end, so memory grows only with the number of nodes.
+
+       If an elevation raster is set (-D option) the altitude tag of nodes
+       is sampled from it (see ElevationRaster).
+
+       Raises:
+       - FileNotFoundError if the elevation raster does not exist
+       - NameError if workspace is not set
+       - ValueError if some nodes are out of the elevation raster
     """
     import_file = utility.CLI.args().import_file
     ws = utility.CLI.args().workspace
-
-    imported_graph = nx.read_shp(path=import_file, simplify=True)
-    Log.info(f'File \'{import_file}\' imported correctly')
-
     if not ws:
         raise NameError('Please set workspace dir')
 
-    nx.write_shp(imported_graph, ws)
-    Log.info(f'Exported correctly to \'{ws}\' nodes.shp and edges.shp\n')
-    Log.info('PLEASE ADD TO \'{}\' ELEVATION '
-             'INFORMATION !'.format(os.path.join(ws, 'nodes.shp')))
-    Log.info('(Open with QGIS the node.shp and a dem.tif')
-    Log.info('then with Point Sampling Tool Plugin create a new node.shp)')
+    try:
+        from osgeo import ogr
+    except ImportError:
+        raise ImportError('Import requires OGR: http://www.gdal.org/')
+    ogr.UseExceptions()
+    dem_file = utility.CLI.args().dem_file
+    raster = ElevationRaster(dem_file) if dem_file else None
+
+    os.makedirs(ws, exist_ok=True)
+    workspace = ogr.GetDriverByName('ESRI Shapefile').CreateDataSource(ws)
+    for name in ('nodes', 'edges'):
+        # delete pre-existing output first otherwise ogr chokes
+        try:
+            workspace.DeleteLayer(name)
+        except Exception:
+            pass
+    nodes = workspace.CreateLayer('nodes', None, ogr.wkbPoint)
+    edges = workspace.CreateLayer('edges', None, ogr.wkbLineString)
+
+    # binary form of edges is written in chunks, as the roads are many
+    node_ids, edge_fields, edge_chunks, chunk = dict(), set(), list(), list()
+    dropped, skipped, imported = 0, 0, 0
+    try:
+        for layer in ogr.Open(import_file):
+            fields = [field.GetName() for field in layer.schema]
+            for field in layer.schema:
+                name = field.GetName()
+                if name in imported_attributes and name not in edge_fields:
+                    edges.CreateField(field)
+                    edge_fields.add(name)
+
+            for feature in layer:
+                if 'fclass' in fields \
+                   and feature.GetField('fclass') not in fclass_whitelist:
+                    dropped += 1
+                    continue
+                geometry = feature.geometry()
+                kind = None if geometry is None \
+                    else ogr.GT_Flatten(geometry.GetGeometryType())
+                if kind == ogr.wkbLineString:
+                    lines = [geometry]
+                elif kind == ogr.wkbMultiLineString:
+                    lines = [geometry.GetGeometryRef(index) for index
+                             in range(geometry.GetGeometryCount())]
+                else:
+                    skipped += 1
+                    continue
+
+                attributes = {name: feature.GetField(name)
+                              for name in edge_fields if name in fields}
+                attributes = {name: value for name, value
+                              in attributes.items() if value is not None}
+                for line in lines:
+                    # lines are simplified to their endpoints like read_shp()
+                    endpoints = (line.GetPoint_2D(0),
+                                 line.GetPoint_2D(line.GetPointCount() - 1))
+                    for point in endpoints:
+                        if point not in node_ids:
+                            node_ids[point] = len(node_ids)
+
+                    edge = ogr.Feature(edges.GetLayerDefn())
+                    edge.SetGeometry(line)
+                    for name, value in attributes.items():
+                        edge.SetField(name, value)
+                    edges.CreateFeature(edge)
+                    chunk.append((node_ids[endpoints[0]],
+                                  node_ids[endpoints[1]], attributes))
+                if len(chunk) >= edges_per_chunk:
+                    imported += len(chunk)
+                    _write_chunk(ws, binary_workspace[1],
+                                 _edges_chunk_table(chunk), edge_chunks)
+                    chunk = list()
+        if chunk or not edge_chunks:
+            imported += len(chunk)
+            _write_chunk(ws, binary_workspace[1], _edges_chunk_table(chunk),
+                         edge_chunks)
+        Log.info(f'File \'{import_file}\' imported correctly '
+                 f'({imported} roads, {dropped} dropped)')
+        if skipped:
+            Log.warning(f'{skipped} features of \'{import_file}\' skipped '
+                        'because their geometry is not a line')
+
+        # nodes are written at the end, with altitudes sampled all at once
+        coordinates = list(node_ids)
+        node_columns = {'lon': [lon for lon, lat in coordinates],
+                        'lat': [lat for lon, lat in coordinates]}
+        altitude_columns = dict()
+        if raster is not None:
+            altitude = raster.altitudes(node_columns['lon'],
+                                        node_columns['lat'])
+            if np.isnan(altitude).any():
+                raise ValueError(f'{np.isnan(altitude).sum()} nodes are out '
+                                 f'of {dem_file} or next to cells without '
+                                 'data')
+            altitude_columns[utility.CLI.args().altitude] = altitude.tolist()
+            nodes.CreateField(ogr.FieldDefn(utility.CLI.args().altitude,
+                                            ogr.OFTReal))
+        for index, point in enumerate(coordinates):
+            node = ogr.Feature(nodes.GetLayerDefn())
+            node_geometry = ogr.Geometry(ogr.wkbPoint)
+            node_geometry.AddPoint_2D(*point)
+            node.SetGeometry(node_geometry)
+            for tag, values in altitude_columns.items():
+                node.SetField(tag, values[index])
+            nodes.CreateFeature(node)
+        nodes, edges, workspace = None, None, None  # flush shapefiles
+
+        _write_binary_tables(
+            ws, _attributes_table(node_columns, altitude_columns), edge_chunks)
+    finally:
+        for f in edge_chunks:
+            os.remove(f)
+    Log.info(f'Exported correctly to \'{ws}\' nodes.shp and edges.shp '
+             '(and their binary form)\n')
+    if raster is not None:
+        Log.info(f'Added altitude of nodes from \'{dem_file}\'')
+    else:
+        Log.info('PLEASE ADD TO \'{}\' ELEVATION '
+                 'INFORMATION !'.format(os.path.join(ws, 'nodes.shp')))
+        Log.info('(Open with QGIS the node.shp and a dem.tif')
+        Log.info('then with Point Sampling Tool Plugin create a new '
+                 'node.shp, or import again with -D dem.tif)')
     if exit_on_success:
         raise SystemExit(0)
 
 
+def paths_cache_dir(version):
+    """Return directory of the paths cache of the problem to solve.
+
+       The directory name is a hash of the cache format version, the
+       workspace files (their size and modification time), the altitude
+       tag, the snap tolerance, the crop buffer, the car and the nodes of
+       interests, so it changes as soon as any of them changes;
+       None is returned if no cache dir is set.
+    """
+    cache_dir = utility.CLI.args().cache_dir
+    if not cache_dir:
+        return None
+
+    problem = load_problem_file()
+    fingerprint = _workspace_fingerprint(version)
+    fingerprint.update(str(utility.CLI.args().snap_tolerance).encode())
+    fingerprint.update(str(utility.CLI.args().crop_buffer).encode())
+    fingerprint.update(yaml.dump([problem[key] for key in
+                                  ('car', 'depot', 'customer', 'station')],
+                                 default_flow_style=True).encode())
+    return os.path.join(cache_dir, fingerprint.hexdigest())
+
+
+def hierarchy_dir(version):
+    """Return directory of the contraction hierarchies of the workspace.
+
+       It is next to the workspace (which can only contain its own files,
+       see check_workspace()) and its name is a hash of the hierarchy
+       format version, the workspace files, the altitude tag, the crop
+       buffer and the car, so adding a node of interests does not change
+       it; a cropped graph still changes with the nodes of interests, so
+       its hierarchies are checked when loaded (see
+       ContractionHierarchy.load()).
+    """
+    ws = os.path.normpath(os.path.abspath(utility.CLI.args().workspace))
+    fingerprint = _workspace_fingerprint(version)
+    fingerprint.update(str(utility.CLI.args().crop_buffer).encode())
+    fingerprint.update(yaml.dump(load_problem_file()['car'],
+                                 default_flow_style=True).encode())
+    return os.path.join(ws + '-hierarchy', fingerprint.hexdigest())
+
+
+def _workspace_fingerprint(version):
+    """Return sha256 hash of version, workspace files and altitude tag.
+
+       Files are not read: like in read_binary_workspace() they are
+       supposed unchanged until their size or modification time changes.
+    """
+    ws = utility.CLI.args().workspace
+    fingerprint = hashlib.sha256(str(version).encode())
+    for f in sorted(os.listdir(ws)):
+        if f in binary_workspace or _is_temporary(f):
+            continue  # binary files are built from the other ones
+        stat = os.stat(os.path.join(ws, f))
+        fingerprint.update(f'{f}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    fingerprint.update(utility.CLI.args().altitude.encode())
+    return fingerprint
+
+
 def load_problem_file(_cache={}):
     """Parse problem file content and return it.
 
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+""" E-VRP is a project about the routing of a fleet of electrical vehicles.
+
+    E-VRP is a project developed for the Application of Operational Research
+    exam at University of Modena and Reggio Emilia.
+
+    Copyright (C) 2017  Serena Ziviani, Federico Motta
+
+    This file is part of E-VRP.
+
+    E-VRP is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    E-VRP is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with E-VRP.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__authors__ = "Serena Ziviani, Federico Motta"
+__copyright__ = "E-VRP  Copyright (C)  2017"
+__license__ = "GPL3"
+
+import math
+import networkx as nx
+import os
+import tempfile
+import time
+import tracemalloc
+
+from context import graph
+from context import instances
+
+
+def bench_greenest_engines(abstract_g):
+    """Compare Bellman-Ford against reweighted Dijkstra from every source."""
+    sources = [coor for coor, data in abstract_g.nodes_iter(data=True)
+               if data['type']]
+
+    t0 = time.perf_counter()
+    bellman_ford = {src: nx.bellman_ford(abstract_g, src, weight='energy')[1]
+                    for src in sources}
+    t_bellman_ford = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    compact_g = graph.CompactGraph(abstract_g)
+    t_compact = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    potential = graph.CachePaths._greenest_potential(compact_g)
+    weights = compact_g.reduced_weights('energy', potential)
+    dijkstra = dict()
+    for src in sources:
+        i = compact_g.node_id(src)
+        dist = compact_g.dijkstra(i, weights)[2]
+        dijkstra[src] = {compact_g.coordinates[j]:
+                         d - potential[i] + potential[j]
+                         for j, d in enumerate(dist) if d < math.inf}
+    t_dijkstra = time.perf_counter() - t0
+
+    max_error = max(abs(energy - dijkstra[src][dest])
+                    for src in sources
+                    for dest, energy in bellman_ford[src].items())
+    print(f'{len(sources):>6} sources  '
+          f'bellman-ford {t_bellman_ford:>8.3f} s   '
+          f'CSR {t_compact:>6.3f} s + dijkstra {t_dijkstra:>8.3f} s   '
+          f'speedup {t_bellman_ford / (t_compact + t_dijkstra):>6.1f}x   '
+          f'max error {max_error:.2e} J')
+
+
+def bench_parallel_build(abstract_g, workers=(1, 2, 4)):
+    """Time CachePaths construction with different numbers of processes."""
+    timings = list()
+    for n in workers:
+        t0 = time.perf_counter()
+        graph.CachePaths(abstract_g, workers=n)
+        timings.append(f'{n:>3} processes {time.perf_counter() - t0:>8.3f} s')
+    print('   '.join(timings))
+
+
+def bench_warm_start(abstract_g):
+    """Time a CachePaths build against loading it from disk."""
+    t0 = time.perf_counter()
+    cache = graph.CachePaths(abstract_g)
+    t_build = time.perf_counter() - t0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = os.path.join(temp_dir, 'cache')
+        cache.save(directory)
+        t0 = time.perf_counter()
+        graph.CachePaths.load(abstract_g, directory)
+        t_load = time.perf_counter() - t0
+    print(f'build {t_build:>8.3f} s   load {t_load:>8.3f} s')
+
+
+def bench_cache_memory(abstract_g):
+    """Compare memory of the cache trees against unrolled Path objects."""
+    tracemalloc.start()
+    cache = graph.CachePaths(abstract_g)
+    cache_size = tracemalloc.get_traced_memory()[0]
+    paths = [path for src in cache.nodes
+             for __, *record in cache.source_iterator(src)
+             for path in record if path._nodes]
+    paths_size = tracemalloc.get_traced_memory()[0] - cache_size
+    tracemalloc.stop()
+    print(f'{len(paths):>7} paths   cache {cache_size / 2**20:>8.2f} MB   '
+          f'unrolled paths {paths_size / 2**20:>8.2f} MB')
+
+
+def bench_chain_contraction(abstract_g):
+    """Time CachePaths construction with and without contracted chains."""
+    timings = list()
+    for contract in (False, True):
+        t0 = time.perf_counter()
+        cache = graph.CachePaths(abstract_g, contract=contract)
+        timings.append(time.perf_counter() - t0)
+    compact_g = graph.CompactGraph(abstract_g)
+    contracted = compact_g.contract_chains(
+        compact_g.node_id(node[:2]) for node in cache.nodes)
+    print(f'{compact_g.number_of_edges():>7} -> '
+          f'{contracted.number_of_edges():>6} edges   '
+          f'plain {timings[0]:>8.3f} s   contracted {timings[1]:>8.3f} s   '
+          f'speedup {timings[0] / timings[1]:>5.1f}x')
+
+
+def bench_contraction_hierarchy(abstract_g):
+    """Time many-to-many queries of a hierarchy against CachePaths."""
+    compact_g = graph.CompactGraph(abstract_g)
+    t0 = time.perf_counter()
+    cache = graph.CachePaths(compact_g)
+    t_cache = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    hierarchy = graph.ContractionHierarchy(compact_g, 'time')
+    t_build = time.perf_counter() - t0
+    ids = [compact_g.node_id(node[:2]) for node in cache.nodes]
+    t0 = time.perf_counter()
+    hierarchy.matrix(ids, ids)
+    t_matrix = time.perf_counter() - t0
+
+    # a new customer needs a row and a column
+    other = next(index for index in range(len(compact_g))
+                 if index not in ids)
+    t0 = time.perf_counter()
+    hierarchy.matrix([other], ids + [other])
+    hierarchy.matrix(ids, [other])
+    t_add = time.perf_counter() - t0
+    print(f'cache {t_cache:>8.3f} s   hierarchy {t_build:>8.3f} s '
+          f'({hierarchy.number_of_shortcuts():>6} edges)   '
+          f'matrix {t_matrix:>6.3f} s   new node {t_add:>6.3f} s')
+
+
+def main():
+    print('Greenest paths engines (grid side, customers, stations):')
+    for side, customers, stations in ((20, 10, 3), (40, 40, 10),
+                                      (60, 80, 20)):
+        osm_g = instances.grid_osm_graph(side, customers, stations)
+        abstract_g = graph.Graph(from_DiGraph=osm_g)
+        print(f'({side}, {customers}, {stations})', end='  ')
+        bench_greenest_engines(abstract_g)
+
+    print('\nCachePaths construction (grid side, customers, stations):')
+    for side, customers, stations in ((40, 40, 10), (60, 80, 20)):
+        osm_g = instances.grid_osm_graph(side, customers, stations)
+        abstract_g = graph.Graph(from_DiGraph=osm_g)
+        print(f'({side}, {customers}, {stations})', end='  ')
+        bench_parallel_build(abstract_g)
+
+    print('\nCachePaths warm start (grid side, customers, stations):')
+    for side, customers, stations in ((40, 40, 10), (60, 80, 20)):
+        osm_g = instances.grid_osm_graph(side, customers, stations)
+        abstract_g = graph.Graph(from_DiGraph=osm_g)
+        print(f'({side}, {customers}, {stations})', end='  ')
+        bench_warm_start(abstract_g)
+
+    print('\nCachePaths memory (grid side, customers, stations):')
+    for side, customers, stations in ((40, 40, 10), (60, 80, 20)):
+        osm_g = instances.grid_osm_graph(side, customers, stations)
+        abstract_g = graph.Graph(from_DiGraph=osm_g)
+        print(f'({side}, {customers}, {stations})', end='  ')
+        bench_cache_memory(abstract_g)
+
+    print('\nCachePaths chain contraction (grid side, customers, stations, '
+          'shape points):')
+    for side, customers, stations, shape_points in ((40, 40, 10, 0),
+                                                    (40, 40, 10, 4),
+                                                    (60, 80, 20, 4)):
+        osm_g = instances.grid_osm_graph(side, customers, stations,
+                                         shape_points=shape_points)
+        abstract_g = graph.Graph(from_DiGraph=osm_g)
+        print(f'({side}, {customers}, {stations}, {shape_points})', end='  ')
+        bench_chain_contraction(abstract_g)
+
+    print('\nContraction hierarchy of times (grid side, customers, '
+          'stations):')
+    for side, customers, stations in ((40, 40, 10), (60, 80, 20)):
+        osm_g = instances.grid_osm_graph(side, customers, stations)
+        abstract_g = graph.Graph(from_DiGraph=osm_g)
+        print(f'({side}, {customers}, {stations})', end='  ')
+        bench_contraction_hierarchy(abstract_g)
+
+
+# ----------------------------------- MAIN ---------------------------------- #
+if __name__ == '__main__':
+    main()
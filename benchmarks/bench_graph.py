@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+""" E-VRP is a project about the routing of a fleet of electrical vehicles.
+
+    E-VRP is a project developed for the Application of Operational Research
+    exam at University of Modena and Reggio Emilia.
+
+    Copyright (C) 2017  Serena Ziviani, Federico Motta
+
+    This file is part of E-VRP.
+
+    E-VRP is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    E-VRP is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with E-VRP.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__authors__ = "Serena Ziviani, Federico Motta"
+__copyright__ = "E-VRP  Copyright (C)  2017"
+__license__ = "GPL3"
+
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from context import graph
+from context import instances
+
+
+def bench_abstract_graph(osm_g):
+    """Time the build of the abstract graph and of its CSR form."""
+    t0 = time.perf_counter()
+    abstract_g = graph.Graph(from_DiGraph=osm_g)
+    t_abstract = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    graph.CompactGraph(abstract_g)
+    t_compact = time.perf_counter() - t0
+    print(f'{abstract_g.number_of_edges():>9} edges   '
+          f'abstract {t_abstract:>8.3f} s   compact {t_compact:>8.3f} s')
+
+
+def bench_binary_workspace(osm_g):
+    """Time writing and reading the binary form of a workspace."""
+    with tempfile.TemporaryDirectory() as ws:
+        t0 = time.perf_counter()
+        graph.IO.write_binary_workspace(osm_g, ws)
+        t_write = time.perf_counter() - t0
+        size = sum(os.path.getsize(os.path.join(ws, name))
+                   for name in graph.IO.binary_workspace)
+
+        t0 = time.perf_counter()
+        graph.Graph(osm_shapefile=ws)
+        t_read = time.perf_counter() - t0
+    print(f'{osm_g.number_of_edges():>9} edges   write {t_write:>8.3f} s   '
+          f'read {t_read:>8.3f} s   {size / 2**20:>8.2f} MB')
+
+
+def _peak_memory(side, release):
+    """Return peak RSS (in MB) of a process building a CompactGraph.
+
+       Graphs which are not needed any more are dropped as e-vrp.py does.
+    """
+    osm_g = instances.grid_osm_graph(side, customers=10, stations=3)
+    abstract_g = graph.Graph(from_DiGraph=osm_g, release=release)
+    compact_g = graph.CompactGraph(abstract_g)
+    if release:
+        del osm_g, abstract_g
+    compact_g.dijkstra(0)  # the solver starts with all graphs built
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+def bench_peak_memory(side):
+    """Report peak RSS keeping or releasing the graph from shapefile."""
+    peaks = list()
+    # a fresh process per variant, since peak RSS never decreases
+    for release in (False, True):
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            peaks.append(pool.apply(_peak_memory, (side, release)))
+    print(f'kept {peaks[0]:>8.1f} MB   released {peaks[1]:>8.1f} MB')
+
+
+def main():
+    print('Graph construction (grid side):')
+    for side in (100, 200, 400):
+        osm_g = instances.grid_osm_graph(side, customers=10, stations=3)
+        print(f'{side:>4}', end='  ')
+        bench_abstract_graph(osm_g)
+
+    print('\nBinary workspace (grid side):')
+    for side in (100, 200, 400):
+        osm_g = instances.grid_osm_graph(side, customers=10, stations=3)
+        print(f'{side:>4}', end='  ')
+        bench_binary_workspace(osm_g)
+
+    print('\nPeak memory up to the compact graph (grid side):')
+    for side in (100, 200, 400):
+        print(f'{side:>4}', end='  ')
+        bench_peak_memory(side)
+
+
+# ----------------------------------- MAIN ---------------------------------- #
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+""" E-VRP is a project about the routing of a fleet of electrical vehicles.
+
+    E-VRP is a project developed for the Application of Operational Research
+    exam at University of Modena and Reggio Emilia.
+
+    Copyright (C) 2017  Serena Ziviani, Federico Motta
+
+    This file is part of E-VRP.
+
+    E-VRP is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    E-VRP is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with E-VRP.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+__authors__ = "Serena Ziviani, Federico Motta"
+__copyright__ = "E-VRP  Copyright (C)  2017"
+__license__ = "GPL3"
+
+import contextlib
+import copy
+import itertools
+import time
+import unittest.mock
+
+from context import graph
+from context import heuristic
+from context import instances
+from context import solution
+
+
+@contextlib.contextmanager
+def generic_deepcopy():
+    """Make copy.deepcopy() ignore __deepcopy__() of solution classes."""
+    with contextlib.ExitStack() as stack:
+        for cls in (solution.Solution, solution.Route, solution.Path,
+                    solution.Battery):
+            # copy.deepcopy() skips a __deepcopy__ attribute set to None
+            stack.enter_context(unittest.mock.patch.object(cls, '__deepcopy__',
+                                                           None))
+        yield
+
+
+def _solution(compact_g, cache, customers_per_route=5):
+    """Return solution visiting customers in order, a few per route.
+
+       The first reachable station not in the route is visited when the
+       battery runs low.
+    """
+    sol = solution.Solution(compact_g, cache)
+    customers = compact_g.customers
+    for first in range(0, len(customers), customers_per_route):
+        route = solution.Route(cache, greenest=True)
+        for node in customers[first:first + customers_per_route] \
+                + [compact_g.depot]:
+            try:
+                route.append(node)
+            except solution.BatteryCriticalException:
+                for station in compact_g.stations:
+                    if station in route.positions():
+                        continue  # moves of routes with repeats are scored
+                    try:
+                        route.append(station)
+                        break
+                    except solution.BatteryCriticalException:
+                        continue
+                route.append(node)
+        sol.routes.append(route)
+    return sol
+
+
+def _neighbors_per_second(sol, limit):
+    """Return how many move neighbors of sol are explored per second."""
+    t0 = time.perf_counter()
+    explored = sum(1 for __ in itertools.islice(heuristic.move_neighbors(sol),
+                                                limit))
+    return explored / (time.perf_counter() - t0)
+
+
+def bench_neighbors(compact_g, limit=200):
+    """Compare neighbors per second with a generic and a cheap deepcopy."""
+    sol = _solution(compact_g, graph.CachePaths(compact_g))
+    with generic_deepcopy():
+        t0 = time.perf_counter()
+        copy.deepcopy(sol)
+        t_generic = time.perf_counter() - t0
+        generic = _neighbors_per_second(sol, limit)
+    t0 = time.perf_counter()
+    copy.deepcopy(sol)
+    t_cheap = time.perf_counter() - t0
+    cheap = _neighbors_per_second(sol, limit)
+    print(f'deepcopy {t_generic * 1e3:>9.3f} ms -> {t_cheap * 1e3:>7.3f} ms'
+          f'   neighbors {generic:>8.1f}/s -> {cheap:>8.1f}/s')
+
+
+def bench_move_scoring(compact_g, customers_per_route=5):
+    """Compare estimating and scoring moves against applying them."""
+    sol = _solution(compact_g, graph.CachePaths(compact_g),
+                    customers_per_route)
+    moves = list(heuristic.move_moves(sol)) + list(heuristic.swap_moves(sol))
+
+    t0 = time.perf_counter()
+    for move in moves:
+        heuristic.estimate_move(sol, move)
+    t_estimate = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for move in moves:
+        heuristic.score_move(sol, move)
+    t_score = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for move in moves:
+        try:
+            heuristic.apply_move(sol, move)
+        except solution.UnfeasibleRouteException:
+            pass
+    t_apply = time.perf_counter() - t0
+    print(f'{len(moves):>6} moves   apply {len(moves) / t_apply:>8.1f}/s   '
+          f'score {len(moves) / t_score:>8.1f}/s   '
+          f'estimate {len(moves) / t_estimate:>8.1f}/s')
+
+
+def main():
+    print('Move neighbors of a solution (grid side, customers, '
+          'stations):')
+    for side, customers, stations in ((20, 10, 3), (40, 40, 10)):
+        osm_g = instances.grid_osm_graph(side, customers, stations)
+        compact_g = graph.CompactGraph(graph.Graph(from_DiGraph=osm_g))
+        print(f'({side}, {customers}, {stations})', end='  ')
+        bench_neighbors(compact_g)
+
+    print('\nMove and swap moves of a solution (grid side, customers, '
+          'stations, customers per route):')
+    for side, customers, stations, per_route in ((20, 10, 3, 5),
+                                                 (40, 40, 10, 5),
+                                                 (60, 100, 20, 50)):
+        osm_g = instances.grid_osm_graph(side, customers, stations)
+        compact_g = graph.CompactGraph(graph.Graph(from_DiGraph=osm_g))
+        print(f'({side}, {customers}, {stations}, {per_route})', end='  ')
+        bench_move_scoring(compact_g, per_route)
+
+
+# ----------------------------------- MAIN ---------------------------------- #
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+# benchmarks solve their own problem file, other CLI arguments are kept
+sys.argv[1:1] = ['--solve', os.path.join(os.path.dirname(__file__),
+                                         'problem.yaml')]
+
+import graph
+import heuristic
+import IO
+import solution
+import utility
+import instances
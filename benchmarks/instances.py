@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+""" E-VRP is a project about the routing of a fleet of electrical vehicles.
+
+    E-VRP is a project developed for the Application of Operational Research
+    exam at University of Modena and Reggio Emilia.
+
+    Copyright (C) 2017  Serena Ziviani, Federico Motta
+
+    This file is part of E-VRP.
+
+    E-VRP is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    E-VRP is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with E-VRP.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__authors__ = "Serena Ziviani, Federico Motta"
+__copyright__ = "E-VRP  Copyright (C)  2017"
+__license__ = "GPL3"
+
+import math
+import networkx as nx
+import random
+
+import graph
+import utility
+
+
+def grid_osm_graph(side, customers, stations, seed=0, shape_points=0):
+    """Return an OpenStreetMap-like graph laid out on a side x side grid.
+
+       Nodes are (lon, lat) tuples with an altitude and a type, like the
+       ones of a labelled workspace; the first node is the depot, then
+       customers and stations are picked at random.
+
+       Each road is split by shape_points intermediate nodes, like the
+       geometry of roads in real shapefiles.
+    """
+    rand = random.Random(seed)
+    alt = utility.CLI.args().altitude
+    step = 0.001  # about a hundred meters
+    osm_g = nx.DiGraph(name=graph.Graph._osm_name)
+
+    coor = [(11 + x * step, 44 + y * step)
+            for x in range(side) for y in range(side)]
+    kinds = ['depot'] + ['customer'] * customers + ['station'] * stations
+    kinds += [''] * (len(coor) - len(kinds))
+    kinds = kinds[:1] + rand.sample(kinds[1:], len(kinds) - 1)
+    for (lon, lat), kind in zip(coor, kinds):
+        altitude = 100 + 30 * math.sin(lon * 900) * math.cos(lat * 700)
+        osm_g.add_node((lon, lat), {alt: altitude + rand.random(),
+                                    'type': kind})
+
+    osm_id = 0
+    for x in range(side):
+        for y in range(side):
+            for dx, dy in ((1, 0), (0, 1)):
+                if x + dx >= side or y + dy >= side:
+                    continue
+                src = coor[x * side + y]
+                dest = coor[(x + dx) * side + y + dy]
+                if rand.random() < 0.5:
+                    src, dest = dest, src
+                osm_id += 1
+                data = {'osm_id': osm_id,
+                        'length': 100 + 20 * rand.random(),
+                        'speed': rand.choice((30, 50, 70)),
+                        'oneway': rand.random() < 0.2}
+                road = [src]
+                for k in range(1, shape_points + 1):
+                    t = k / (shape_points + 1)
+                    point = (src[0] + t * (dest[0] - src[0]),
+                             src[1] + t * (dest[1] - src[1]))
+                    altitude = ((1 - t) * osm_g.node[src][alt]
+                                + t * osm_g.node[dest][alt])
+                    osm_g.add_node(point, {alt: altitude, 'type': ''})
+                    road.append(point)
+                road.append(dest)
+                data['length'] /= shape_points + 1
+                for segment_src, segment_dest in zip(road, road[1:]):
+                    osm_g.add_edge(segment_src, segment_dest, dict(data))
+    return osm_g
+
+
+# ------------------------------ SCRIPT LOADED ------------------------------ #
+if __name__ == '__main__':
+    raise SystemExit('Please do not run that script, load it!')
@@ -31,12 +31,14 @@ __license__ = "GPL3"
 # -------------------------------- SCRIPT RUN ------------------------------- #
 
 # Add to the following loop every external library used!
-for lib in ('graphviz', 'networkx as nx', 'yaml'):
+for lib in ('graphviz', 'networkx as nx', 'numpy as np', 'yaml'):
     try:
         exec('import ' + str(lib))
     except ImportError:
         raise SystemExit(f'Could not import {lib} library, please install it!')
 
+import os
+
 import graph
 import heuristic
 import IO
@@ -55,30 +57,89 @@ def main():
             raise utility.UsageException()
 
         IO.check_workspace()
+        # altitudes are checked while the workspace is read
+        osm_g = graph.Graph(osm_shapefile=utility.CLI.args().workspace)
     except (FileExistsError, FileNotFoundError) as e:
         print(str(e))
         exit(e.errno)
-    except (NameError, TypeError, utility.UsageException) as e:
+    except (NameError, TypeError, ValueError, utility.UsageException) as e:
         print(str(e))
         exit(1)
+    except RuntimeError as e:
+        print(str(e))
+        exit(2)
 
     try:
-        osm_g = graph.Graph(osm_shapefile=utility.CLI.args().workspace)
         osm_g.label_nodes()
+        if utility.CLI.args().crop_buffer is not None:
+            removed = osm_g.crop(utility.CLI.args().crop_buffer)
+            IO.Log.debug(f'Cropped {removed} nodes out of graph from '
+                         'shapefile')
         osm_g.check_problem_solvability()
         IO.Log.debug('Graph from shapefile passed solvability tests')
 
-        abstract_g = graph.Graph(from_DiGraph=osm_g)
+        # the graph from shapefile is emptied while it is abstracted
+        abstract_g = graph.Graph(from_DiGraph=osm_g, release=True)
         IO.Log.debug('Created abstract graph')
+
+        # the solver runs over the integer-indexed form of the graph
+        compact_g = graph.CompactGraph(abstract_g)
+        IO.Log.debug(f'Created compact graph ({len(compact_g)} nodes, '
+                     f'{compact_g.number_of_edges()} edges)')
+        del osm_g, abstract_g
     except (NameError, RuntimeError, TypeError) as e:
         print(str(e))
         exit(2)
 
-    cache = graph.CachePaths(abstract_g)
-    IO.Log.debug('Created cache over abstract graph')
+    if utility.CLI.args().hierarchy:
+        # values of paths are queried in the hierarchies of the workspace
+        hierarchy_dir = IO.hierarchy_dir(graph.ContractionHierarchy._format)
+        hierarchies = dict()
+        for label in graph.CachePaths._hierarchy_labels:
+            label_dir = os.path.join(hierarchy_dir, label)
+            try:
+                hierarchies[label] = graph.ContractionHierarchy.load(
+                    compact_g, label_dir)
+                IO.Log.debug(f'Loaded {label} hierarchy from {label_dir}')
+            except (FileNotFoundError, ValueError) as e:
+                IO.Log.debug(f'Could not load hierarchy ({str(e)})')
+                hierarchies[label] = graph.ContractionHierarchy(compact_g,
+                                                                label)
+                IO.Log.debug(f'Created {label} hierarchy ('
+                             f'{hierarchies[label].number_of_shortcuts()} '
+                             'edges)')
+                hierarchies[label].save(label_dir)
+                IO.Log.debug(f'Saved {label} hierarchy to {label_dir}')
+        cache = graph.CachePaths.from_hierarchies(compact_g, hierarchies)
+        IO.Log.debug('Created cache from hierarchies')
+    else:
+        cache, cache_dir = None, IO.paths_cache_dir(graph.CachePaths._format)
+        if cache_dir is not None:
+            try:
+                cache = graph.CachePaths.load(compact_g, cache_dir)
+                IO.Log.debug('Loaded cache over compact graph from '
+                             f'{cache_dir}')
+            except (FileNotFoundError, ValueError) as e:
+                IO.Log.debug(f'Could not load cache ({str(e)})')
+        if cache is None:
+            memory_budget = utility.CLI.args().cache_memory
+            if memory_budget is not None:
+                memory_budget *= 2 ** 20  # MB to bytes
+            cache = graph.CachePaths(compact_g,
+                                     workers=utility.CLI.args().jobs,
+                                     memory_budget=memory_budget)
+            IO.Log.debug('Created cache over compact graph')
+            if cache_dir is not None and memory_budget is not None:
+                # saving would search paths from all sources at once
+                IO.Log.info(f'Cache not saved to {cache_dir} to keep it '
+                            'within -M megabytes (run without -M to save '
+                            'it)')
+            elif cache_dir is not None:
+                cache.save(cache_dir)
+                IO.Log.debug(f'Saved cache to {cache_dir}')
 
     # create a greedy heuristic solution
-    heur = heuristic.GreedyHeuristic(abstract_g, cache)
+    heur = heuristic.GreedyHeuristic(compact_g, cache)
     initial_sol = heur.create_feasible_solution()
     IO.Log.debug('Greedy solution {} feasible'.format(
                  'is' if initial_sol.is_feasible() else 'not'))
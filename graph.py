@@ -28,9 +28,19 @@ __authors__ = "Serena Ziviani, Federico Motta"
 __copyright__ = "E-VRP  Copyright (C)  2017"
 __license__ = "GPL3"
 
+import collections
+import collections.abc
+import concurrent.futures
+import errno
 import graphviz
+import heapq
+import itertools
 import math
 import networkx as nx
+import numpy as np
+import os
+import shutil
+import tempfile
 
 import IO
 import utility
@@ -47,7 +57,7 @@ class Graph(nx.classes.digraph.DiGraph):
     _osm_name = 'OpenStreetMap_graph'
     """Name given to the osm graph."""
 
-    def __new__(cls, osm_shapefile='', from_DiGraph=None):
+    def __new__(cls, osm_shapefile='', from_DiGraph=None, release=False):
         """Return instance of super class."""
         return super(Graph, cls).__new__(cls)
 
@@ -55,24 +65,56 @@ class Graph(nx.classes.digraph.DiGraph):
         """Initialize instance of super class."""
         path = kwargs['osm_shapefile'] if 'osm_shapefile' in kwargs else ''
         osm_g = kwargs['from_DiGraph'] if 'from_DiGraph' in kwargs else None
+        release = kwargs['release'] if 'release' in kwargs else False
 
         if isinstance(path, str) and path != '' and osm_g is None:
-            super(Graph, self).__init__(data=nx.read_shp(path=path,
-                                                         simplify=True),
+            super(Graph, self).__init__(data=Graph._read_workspace(path),
                                         name=Graph._osm_name)
         elif (path == ''
               and osm_g is not None
               and issubclass(type(osm_g), nx.classes.digraph.DiGraph)):
-            super(Graph, self).__init__(data=Graph._get_abstract_graph(osm_g))
+            super(Graph, self).__init__(
+                data=Graph._get_abstract_graph(osm_g, release))
         elif (path != ''
               and osm_g is None
               and issubclass(type(path), nx.classes.digraph.DiGraph)):
-            super(Graph, self).__init__(data=Graph._get_abstract_graph(path))
+            super(Graph, self).__init__(
+                data=Graph._get_abstract_graph(path, release))
         else:
             raise TypeError('Please pass a path to \'osm_shapefile\' or '
                             'a subclass of networkx.classes.digraph.DiGraph '
                             'to \'from_DiGraph\' in constructor Graph().')
 
+    @staticmethod
+    def _read_workspace(path):
+        """Return DiGraph of the shapefiles in path.
+
+           If path is a workspace directory its binary form is read when
+           it is up to date, otherwise it is written for the next runs
+           (see IO.write_binary_workspace()).
+
+           Raises NameError or TypeError if nodes have not a valid
+           altitude (see IO.check_altitude())
+        """
+        if not os.path.isdir(path):
+            ret = nx.read_shp(path=path, simplify=True)
+            IO.check_altitude(ret)
+            return ret
+        ret = IO.read_binary_workspace(path)
+        if ret is not None:
+            IO.Log.debug(f'Read binary form of workspace {path}')
+            IO.check_altitude(ret)
+            return ret
+        ret = nx.read_shp(path=path, simplify=True)
+        IO.check_altitude(ret)
+        try:
+            IO.write_binary_workspace(ret, path)
+            IO.Log.debug(f'Wrote binary form of workspace {path}')
+        except OSError as e:
+            IO.Log.debug(f'Could not write binary form of workspace '
+                         f'({str(e)})')
+        return ret
+
     @staticmethod
     def assert_graph_is_osm(graph, method_name):
         """Raise TypeError if self is not an OpenStreetMap graph."""
@@ -88,10 +130,12 @@ class Graph(nx.classes.digraph.DiGraph):
                             'over abstract graphs')
 
     @staticmethod
-    def _get_abstract_graph(osm_g):
+    def _get_abstract_graph(osm_g, release=False):
         """Return a copy of osm_g with only the necessary attributes.
 
            Fixes osm_g inverted coordinates
+           If release is True osm_g is emptied while it is read, so the
+           memory of its attributes is freed before the copy is built.
            Raises TypeError
 
            Node attributes:
@@ -117,39 +161,73 @@ class Graph(nx.classes.digraph.DiGraph):
         ret = nx.DiGraph()
 
         # note: OpenStreetMap shapefiles have latitude and longitude swapped
+        node_ids, altitude = dict(), list()
         for (lon, lat), data in osm_g.nodes_iter(data=True):
             ret.add_node((lat, lon), altitude=data[alt], type=data['type'],
                          latitude=lat, longitude=lon)
-
+            node_ids[(lon, lat)] = len(altitude)
+            altitude.append(data[alt])
+            if release:
+                data.clear()
+
+        # edges are collected first and their attributes computed in batch
+        edges, src_ids, dest_ids = list(), list(), list()
+        osm_id, length, speed = list(), list(), list()
         for (src_lon, src_lat), adjacency_dict in osm_g.adjacency_iter():
             for (dest_lon, dest_lat), data in adjacency_dict.items():
                 if not all(tag in data for tag in necessary_osm_attr):
                     continue
 
-                attr = {'osm_id': data['osm_id'],
-                        'length': data['length']}
-                attr['rise'] = osm_g.node[(dest_lon, dest_lat)][alt]
-                attr['rise'] -= osm_g.node[(src_lon, src_lat)][alt]
+                edges.append(((src_lat, src_lon), (dest_lat, dest_lon),
+                              data['oneway']))
+                src_ids.append(node_ids[(src_lon, src_lat)])
+                dest_ids.append(node_ids[(dest_lon, dest_lat)])
+                osm_id.append(data['osm_id'])
+                length.append(data['length'])
 
                 if data['speed'] > 0:
-                    attr['speed'] = data['speed']
+                    speed.append(data['speed'])
                 elif 'maxspeed' in data and data['maxspeed'] > 0:
-                    attr['speed'] = data['maxspeed']
+                    speed.append(data['maxspeed'])
                 else:
-                    attr['speed'] = 50  # default value if no speed available
-
-                attr['energy'] = utility.energy(**attr, **car)
-                attr['slope'] = math.atan2(attr['rise'], attr['length'])
-                attr['time'] = (attr['length'] / attr['speed']) * 0.06
-                ret.add_edge((src_lat, src_lon), (dest_lat, dest_lon),
-                             attr_dict=attr)
-
-                if not data['oneway']:
-                    attr['rise'] *= -1
-                    attr['slope'] *= -1
-                    attr['energy'] = utility.energy(**attr, **car)
-                    ret.add_edge((dest_lat, dest_lon), (src_lat, src_lon),
-                                 attr_dict=attr)
+                    speed.append(50)  # default value if no speed available
+            if release:
+                # edge attributes are shared by successors and predecessors
+                for dest in adjacency_dict:
+                    del osm_g.pred[dest][(src_lon, src_lat)]
+                adjacency_dict.clear()
+        if release:
+            osm_g.succ.clear()
+            osm_g.pred.clear()
+            osm_g.node.clear()
+            node_ids = None
+
+        altitude = np.array(altitude)
+        rise = altitude[dest_ids] - altitude[src_ids]
+        length_array = np.array(length, dtype=np.float64)
+        energy = utility.energies(rise, length_array, **car).tolist()
+        reverse_energy = utility.energies(-rise, length_array, **car).tolist()
+        time = ((length_array / np.array(speed, dtype=np.float64))
+                * 0.06).tolist()
+        rise = rise.tolist()
+        # numpy.arctan2() may differ from math.atan2() in the last digit
+        slope = list(map(math.atan2, rise, length))
+
+        for index, (src, dest, oneway) in enumerate(edges):
+            attr = {'osm_id': osm_id[index],
+                    'length': length[index],
+                    'rise': rise[index],
+                    'speed': speed[index],
+                    'energy': energy[index],
+                    'slope': slope[index],
+                    'time': time[index]}
+            ret.add_edge(src, dest, attr_dict=attr)
+
+            if not oneway:
+                attr['rise'] *= -1
+                attr['slope'] *= -1
+                attr['energy'] = reverse_energy[index]
+                ret.add_edge(dest, src, attr_dict=attr)
         return ret
 
     def _nodes_of_interests(self, label):
@@ -183,18 +261,29 @@ class Graph(nx.classes.digraph.DiGraph):
     def label_nodes(self, kind='type', lat='latitude', lon='longitude'):
         """Ensure problem file is applicable to graph.
 
-           Nodes of interests are then labelled
+           Nodes of interests are then labelled; one which is not a node of
+           graph is moved to the nearest node within the snap tolerance set
+           from CLI (if any).
            Raises NameError, TypeError
         """
         Graph.assert_graph_is_osm(self, 'label_nodes')
 
-        already_labeled_nodes, problem = list(), IO.load_problem_file()
+        already_labeled_nodes, problem = set(), IO.load_problem_file()
+        tolerance, index = utility.CLI.args().snap_tolerance, None
 
         for node_type in ('depot', 'customer', 'station'):
             setattr(self, '_' + node_type, list())
             for node in problem[node_type]:
                 coor = node[lon], node[lat]
-                if coor not in self.nodes_iter():
+                if coor not in self.node and tolerance > 0:
+                    if index is None:
+                        index = GridIndex(self.nodes(), tolerance)
+                    nearest = index.nearest(*coor)
+                    if nearest is not None:
+                        IO.Log.warning(f'Moved {node_type} {coor} to the '
+                                       f'nearest node {nearest}')
+                        coor = nearest
+                if coor not in self.node:
                     raise NameError(f'Could not find {node_type} {coor} '
                                     'in workspace')
                 elif coor in already_labeled_nodes:
@@ -202,13 +291,88 @@ class Graph(nx.classes.digraph.DiGraph):
                                     f'{coor}')
                 else:
                     self.node[coor][kind] = node_type
-                    already_labeled_nodes.append(coor)
+                    already_labeled_nodes.add(coor)
                     getattr(self, '_' + node_type).append((*coor, node_type))
 
         for coor, data in self.nodes_iter(data=True):
             if kind not in data:
                 data[kind] = ''
 
+    def _reachable(self, sources, reverse=False, nodes=None):
+        """Return set of nodes reachable from any node in sources.
+
+           If reverse is True return the nodes from which any node in
+           sources is reachable; if nodes is a set, paths are restricted
+           to its nodes.
+        """
+        adjacency = self.pred if reverse else self.succ
+        seen, stack = set(sources), list(sources)
+        while stack:
+            for node in adjacency[stack.pop()]:
+                if node not in seen and (nodes is None or node in nodes):
+                    seen.add(node)
+                    stack.append(node)
+        return seen
+
+    def _connections(self, nodes=None):
+        """Return which nodes of interests are connected to the other ones.
+
+           The returned tuple has the nodes of interests reachable from the
+           depot, the ones reaching it and the stations reachable from
+           (and reaching) the depot or any customer; if nodes is a set,
+           paths are restricted to its nodes.
+        """
+        depot = [self.depot[:2]]
+        test_coor = depot + [coor[:2] for coor in self.customers]
+        stations = {coor[:2] for coor in self.stations}
+        interests = set(test_coor) | stations
+        return (interests & self._reachable(depot, nodes=nodes),
+                interests & self._reachable(depot, True, nodes),
+                stations & self._reachable(test_coor, nodes=nodes),
+                stations & self._reachable(test_coor, True, nodes))
+
+    def crop(self, buffer, attempts=4):
+        """Remove nodes outside the bounding box of the nodes of interests.
+
+           The box is enlarged by buffer meters on each side; while a node
+           of interests loses one of its connections (see _connections())
+           in the cropped graph the buffer is doubled, and after attempts
+           times the graph is left untouched.
+           Returns the number of removed nodes.
+        """
+        Graph.assert_graph_is_osm(self, 'crop')
+
+        interests = np.array([coor[:2] for coor in [self.depot]
+                              + self.customers + self.stations],
+                             dtype=np.float64)
+        low, high = interests.min(axis=0), interests.max(axis=0)
+        nodes = self.nodes()
+        coordinates = np.array(nodes, dtype=np.float64).reshape(-1, 2)
+
+        # a degree of longitude shrinks towards the poles
+        shrink = max(math.cos(math.radians(np.abs(interests[:, 1]).max())),
+                     0.01)
+        expected = self._connections()
+        for attempt in range(attempts):
+            margin_lat = buffer / GridIndex._meters_per_degree
+            margin = np.array([margin_lat / shrink, margin_lat])
+            inside = np.all((coordinates >= low - margin)
+                            & (coordinates <= high + margin), axis=1)
+            if inside.all():
+                return 0
+
+            kept = {nodes[index] for index in np.flatnonzero(inside)}
+            if self._connections(kept) == expected:
+                removed = [nodes[index] for index in np.flatnonzero(~inside)]
+                self.remove_nodes_from(removed)
+                return len(removed)
+            IO.Log.debug(f'Cropping with a buffer of {buffer} m would '
+                         'disconnect nodes of interests')
+            buffer *= 2
+        IO.Log.warning('Could not crop graph without disconnecting nodes of '
+                       'interests')
+        return 0
+
     def check_problem_solvability(self, kind='type'):
         """Test if customers and stations are reachable from depot.
 
@@ -216,23 +380,30 @@ class Graph(nx.classes.digraph.DiGraph):
         """
         Graph.assert_graph_is_osm(self, 'check_problem_solvability')
 
+        # one traversal per direction instead of a search per pair of nodes
+        from_depot = self._reachable([self.depot[:2]])
+        to_depot = self._reachable([self.depot[:2]], reverse=True)
+
         unsolvable = False
         for *cust_coor, label in self.customers:
-            if not nx.has_path(self, self.depot[:2], tuple(cust_coor)):
+            c = tuple(cust_coor)
+            if c not in from_depot:
                 IO.Log.warning(f'Customer {c} is not reachable from the depot')
                 unsolvable = True
-            if not nx.has_path(self, tuple(cust_coor), self.depot[:2]):
+            if c not in to_depot:
                 IO.Log.warning(f'Depot is not reachable from customer {c}')
                 unsolvable = True
 
-        test_coor = [self.depot] + self.customers
+        test_coor = [tuple(coor) for *coor, __
+                     in [self.depot] + self.customers]
+        from_test = self._reachable(test_coor)
+        to_test = self._reachable(test_coor, reverse=True)
         for *stat_coor, label in self.stations:
-            if not any(nx.has_path(self, tuple(src_coor), tuple(stat_coor))
-                       for *src_coor, __ in test_coor):
+            s = tuple(stat_coor)
+            if s not in from_test:
                 IO.Log.warning(f'Refueling station {s} is not reachable from '
                                'any customer or depot')
-            if not any(nx.has_path(self, tuple(stat_coor), tuple(dest_coor))
-                       for *dest_coor, __ in test_coor):
+            if s not in to_test:
                 IO.Log.warning('No customer or depot reachable from '
                                f'refueling station {s}')
 
@@ -243,9 +414,7 @@ class Graph(nx.classes.digraph.DiGraph):
     def print_edge_properties(self, fclass_whitelist=None, tag_blacklist=None):
         """For each edge in the whitelist print tags not in the blacklist."""
         if fclass_whitelist is None:
-            fclass_whitelist = ('living_street', 'motorway', 'motorway_link',
-                                'primary', 'primary_link', 'residential',
-                                'secondary', 'tertiary', 'unclassified')
+            fclass_whitelist = IO.fclass_whitelist
         if tag_blacklist is None:
             tag_blacklist = ('code', 'lastchange', 'layer', 'ete',
                              'ShpName', 'Wkb', 'Wkt', 'Json')
@@ -263,73 +432,974 @@ class Graph(nx.classes.digraph.DiGraph):
                             print(f'{tag}: {data[tag]}')
 
 
-class CachePaths(object):
-    """Cache of shortest and most energy-efficient routes."""
-
-    _cache = None
-    """List of tuples: ((src_lat, src_lon, src_type),
-                        (dest_lat, dest_lon, dest_type),
-                        greenest_path,
-                        shortest_path)
-       where greenest_path and shortest_path are objects of type Path.
+class GridIndex(object):
+    """Uniform grid over (lon, lat) points to find the nearest one.
+
+       Cells are as large as the tolerance, so only the few cells around a
+       query are visited whatever the number of points.
+    """
+
+    _meters_per_degree = math.radians(1) * 6371000
+    """Length of an arc of one degree on a meridian [meters]."""
+
+    def __init__(self, points, tolerance):
+        """Index list of points (lon, lat) for queries within tolerance.
+
+           tolerance is measured in meters
+        """
+        self._points = list(points)
+        self._tolerance = tolerance
+        self._cell = tolerance / GridIndex._meters_per_degree
+        coordinates = np.array(self._points, dtype=np.float64).reshape(-1, 2)
+
+        # points are sorted by cell, which maps to a slice of them
+        keys = np.floor(coordinates / self._cell).astype(np.int64)
+        self._order = np.lexsort((keys[:, 1], keys[:, 0]))
+        keys = keys[self._order]
+        self._coordinates = coordinates[self._order]
+        bounds = np.flatnonzero(np.any(np.diff(keys, axis=0), axis=1)) + 1
+        starts = [0] + bounds.tolist()
+        stops = bounds.tolist() + [len(keys)]
+        self._cells = {tuple(keys[start].tolist()): (start, stop)
+                       for start, stop in zip(starts, stops) if start < stop}
+
+    def nearest(self, lon, lat):
+        """Return the nearest point within tolerance or None.
+
+           Distances are computed with an equirectangular projection,
+           which is accurate enough at the scale of the tolerance.
+        """
+        # a degree of longitude shrinks towards the poles
+        shrink = max(math.cos(math.radians(lat)), 0.01)
+        cells_lon = range(math.floor((lon - self._cell / shrink) / self._cell),
+                          math.floor((lon + self._cell / shrink) / self._cell)
+                          + 1)
+        cells_lat = range(math.floor((lat - self._cell) / self._cell),
+                          math.floor((lat + self._cell) / self._cell) + 1)
+        candidates = list()
+        for cell_lon in cells_lon:
+            for cell_lat in cells_lat:
+                start, stop = self._cells.get((cell_lon, cell_lat), (0, 0))
+                candidates.extend(range(start, stop))
+        if not candidates:
+            return None
+
+        delta = self._coordinates[candidates] - (lon, lat)
+        delta[:, 0] *= shrink
+        distances = np.hypot(delta[:, 0], delta[:, 1])
+        distances *= GridIndex._meters_per_degree
+        best = np.argmin(distances)
+        if distances[best] > self._tolerance:
+            return None
+        return self._points[self._order[candidates[best]]]
+
+
+class CompactGraph(object):
+    """Integer-indexed copy of an abstract graph in CSR form.
+
+       Nodes are numbered in graph order; the edges leaving node i are the
+       ones from indptr[i] to indptr[i + 1], their destinations are in
+       indices and their attributes in parallel arrays (see edge_values()).
+
+       The networkx-like views (node, edge, adj and the iterators) build
+       dictionaries on the fly, so Path, CachePaths and DrawSVG can run
+       over a CompactGraph instead of an abstract Graph.
     """
 
-    def _add(self, src_node, dest_node, greenest, shortest):
-        """Append to cache two new paths between src_node and dest_node.
+    _edge_attributes = ('energy', 'length', 'osm_id', 'rise', 'slope',
+                        'speed', 'time')
+    """Edge attributes of abstract graphs kept in parallel arrays."""
 
-           greenest and shortest are lists of coordinates (lat, lon)
+    _origin = None
+    """Arrays mapping edges to the original ones (see contract_chains())."""
+
+    _origin_lists_cache = None
+    """Lists of the arrays of origin(), built by _origin_lists()."""
+
+    def __init__(self, graph):
+        """Copy abstract graph in arrays.
+
+           Raises TypeError if graph is an OpenStreetMap one.
         """
-        if src_node == dest_node:
+        Graph.assert_graph_is_abstract(graph, 'CompactGraph')
+        self.name = graph.name
+        self._coordinates = list(graph.nodes_iter())
+        self._ids = {coor: index
+                     for index, coor in enumerate(self._coordinates)}
+        self._altitude = np.array([graph.node[coor]['altitude']
+                                   for coor in self._coordinates],
+                                  dtype=np.float64)
+        self._types = [graph.node[coor]['type'] for coor in self._coordinates]
+        for label in ('depot', 'customer', 'station'):
+            setattr(self, '_' + label, graph._nodes_of_interests(label))
+
+        indptr, indices = [0], list()
+        values = {label: list() for label in CompactGraph._edge_attributes}
+        for coor in self._coordinates:
+            for dest, data in graph.adj[coor].items():
+                indices.append(self._ids[dest])
+                for label, label_values in values.items():
+                    label_values.append(data[label])
+            indptr.append(len(indices))
+        self._indptr = np.array(indptr, dtype=np.int64)
+        self._indices = np.array(indices, dtype=np.int32)
+        self._edges = {label: np.array(label_values,
+                                       dtype=(np.int64 if label == 'osm_id'
+                                              else np.float64))
+                       for label, label_values in values.items()}
+        self._csr_lists = None
+
+    def __contains__(self, coor):
+        return coor in self._ids
+
+    def __iter__(self):
+        """Return iterator over node coordinates (lat, lon)."""
+        return iter(self._coordinates)
+
+    def __len__(self):
+        return len(self._coordinates)
+
+    @property
+    def indptr(self):
+        """Return int64 array of the first edge of each node."""
+        return self._indptr
+
+    @property
+    def indices(self):
+        """Return int32 array of the destination of each edge."""
+        return self._indices
+
+    @property
+    def coordinates(self):
+        """Return list of node coordinates (lat, lon) ordered by id."""
+        return self._coordinates
+
+    def node_id(self, coor):
+        """Return integer identifier of node at coordinates (lat, lon).
+
+           Raises KeyError if there is no such node
+        """
+        return self._ids[coor]
+
+    def edge_values(self, label):
+        """Return array of label values of the edges, in CSR order."""
+        return self._edges[label]
+
+    @property
+    def depot(self):
+        """Return depot coordinates."""
+        return self._depot[0]
+
+    @property
+    def customers(self):
+        """Return list of customers coordinates."""
+        return self._customer
+
+    @property
+    def stations(self):
+        """Return list of stations coordinates."""
+        return self._station
+
+    def _node_data(self, index):
+        """Return dictionary of attributes of node with id index."""
+        lat, lon = self._coordinates[index]
+        return {'altitude': self._altitude[index].item(),
+                'latitude': lat, 'longitude': lon,
+                'type': self._types[index]}
+
+    def _edge_data(self, edge):
+        """Return dictionary of attributes of edge with index edge."""
+        return {label: values[edge].item()
+                for label, values in self._edges.items()}
+
+    @property
+    def node(self):
+        """Return read-only mapping {(lat, lon): attributes}."""
+        return _NodeView(self)
+
+    @property
+    def adj(self):
+        """Return read-only mapping {(lat, lon): {(lat, lon): attributes}}."""
+        return _AdjacencyView(self)
+
+    edge = adj
+    succ = adj
+
+    def nodes_iter(self, data=False):
+        """Return iterator over nodes (and their attributes)."""
+        if not data:
+            return iter(self._coordinates)
+        return ((coor, self._node_data(index))
+                for index, coor in enumerate(self._coordinates))
+
+    def edges_iter(self, data=False):
+        """Return iterator over edges (and their attributes)."""
+        for index, coor in enumerate(self._coordinates):
+            for edge in range(self._indptr[index], self._indptr[index + 1]):
+                dest = self._coordinates[self._indices[edge]]
+                if data:
+                    yield coor, dest, self._edge_data(edge)
+                else:
+                    yield coor, dest
+
+    def adjacency_iter(self):
+        """Return iterator over (node, {successor: attributes})."""
+        return ((coor, _NeighborView(self, index))
+                for index, coor in enumerate(self._coordinates))
+
+    def number_of_nodes(self):
+        return len(self._coordinates)
+
+    def number_of_edges(self):
+        return len(self._indices)
+
+    def _lists(self):
+        """Return indptr and indices as lists, which are faster to index."""
+        if self._csr_lists is None:
+            self._csr_lists = (self._indptr.tolist(), self._indices.tolist())
+        return self._csr_lists
+
+    def edge_sources(self):
+        """Return int32 array of the source of each edge."""
+        return np.repeat(np.arange(len(self._coordinates), dtype=np.int32),
+                         np.diff(self._indptr))
+
+    def reduced_weights(self, label, potential):
+        """Return list of the reduced label values of the edges.
+
+           The reduced weight of edge (u, v) is (see
+           CachePaths._greenest_potential()):
+               max(0, weight(u, v) + potential[u] - potential[v])
+        """
+        sources = self.edge_sources()
+        return np.maximum(0.0, self._edges[label] + potential[sources]
+                          - potential[self._indices]).tolist()
+
+    def contract_chains(self, keep=()):
+        """Return copy of graph where chains of nodes are single edges.
+
+           A node is in a chain if it is not in keep (a collection of node
+           ids) and it links exactly one predecessor to one successor, in
+           one or both directions; a chain is not contracted if it would
+           become a loop or an edge between already adjacent nodes.
+
+           Nodes keep their ids, but the ones inside chains have no edges;
+           edges have the sums of energy, length, rise and time of the
+           original ones, listed by origin() (see collapse() and hops()).
+        """
+        indptr, indices = self._lists()
+        succ = [indices[indptr[node]:indptr[node + 1]]
+                for node in range(len(indptr) - 1)]
+        pred = [list() for node in succ]
+        for node, node_succ in enumerate(succ):
+            for dest in node_succ:
+                pred[dest].append(node)
+        keep = set(keep)
+
+        def in_chain(node):
+            if node in keep or node in succ[node]:
+                return False
+            node_pred, node_succ = set(pred[node]), set(succ[node])
+            if len(node_pred) == 1 and len(node_succ) == 1:
+                return node_pred != node_succ
+            return len(node_pred) == 2 and node_pred == node_succ
+
+        chained = [in_chain(node) for node in range(len(succ))]
+        while True:
+            # chains are followed from every node which is not in them
+            edges, rejected = list(), set()
+            for node, node_succ in enumerate(succ):
+                if chained[node]:
+                    continue
+                node_edges = list()
+                for edge in range(indptr[node], indptr[node + 1]):
+                    chain, prev, dest = [edge], node, indices[edge]
+                    while chained[dest]:
+                        edge = next(e for e in range(indptr[dest],
+                                                     indptr[dest + 1])
+                                    if indices[e] != prev
+                                    or len(succ[dest]) == 1)
+                        chain.append(edge)
+                        prev, dest = dest, indices[edge]
+                    node_edges.append((dest, chain))
+                destinations = collections.Counter(d for d, __ in node_edges)
+                for dest, chain in node_edges:
+                    if len(chain) > 1 and (dest == node
+                                           or destinations[dest] > 1):
+                        rejected.update(indices[e] for e in chain[:-1])
+                edges.append(node_edges)
+            if not rejected:
+                break
+            for node in rejected:
+                chained[node] = False
+
+        contracted = CompactGraph.__new__(CompactGraph)
+        contracted.__dict__.update(self.__dict__)
+        contracted_indptr, contracted_indices = [0], list()
+        origin_indptr, origin = [0], list()
+        node_edges = iter(edges)
+        for node in range(len(succ)):
+            for dest, chain in ([] if chained[node] else next(node_edges)):
+                contracted_indices.append(dest)
+                origin.extend(chain)
+                origin_indptr.append(len(origin))
+            contracted_indptr.append(len(contracted_indices))
+        contracted._indptr = np.array(contracted_indptr, dtype=np.int64)
+        contracted._indices = np.array(contracted_indices, dtype=np.int32)
+        contracted._origin = (np.array(origin_indptr, dtype=np.int64),
+                              np.array(origin, dtype=np.int64),
+                              self._indices)
+        contracted._edges = {label: contracted.collapse(self._edges[label])
+                             for label in ('energy', 'length', 'rise',
+                                           'time')}
+        contracted._csr_lists = None
+        return contracted
+
+    def origin(self):
+        """Return the edges of the original graph of each edge.
+
+           The tuple (origin_indptr, origin_edges, original_indices) of
+           arrays is returned: edge e is made of the original edges from
+           origin_edges[origin_indptr[e]] to origin_edges[origin_indptr[e +
+           1] - 1], whose destinations are in original_indices; it is None
+           if graph was not returned by contract_chains().
+        """
+        return self._origin
+
+    def _origin_lists(self):
+        """Return origin() as a tuple of lists, which are faster to index."""
+        if self._origin is not None and self._origin_lists_cache is None:
+            self._origin_lists_cache = tuple(array.tolist()
+                                             for array in self._origin)
+        return self._origin_lists_cache
+
+    def collapse(self, values):
+        """Return array of the sums of values of original edges by edge.
+
+           values is a sequence with a value for each edge of the original
+           graph (see contract_chains()).
+        """
+        if self._origin is None or len(self._origin[1]) == 0:
+            return np.asarray(values)
+        origin_indptr, origin_edges, __ = self._origin
+        return np.add.reduceat(np.asarray(values)[origin_edges],
+                               origin_indptr[:-1])
+
+    def hops(self):
+        """Return list of the number of original edges of each edge.
+
+           None is returned if graph was not returned by contract_chains(),
+           since every edge is a single one.
+        """
+        if self._origin is None:
+            return None
+        return np.diff(self._origin[0]).tolist()
+
+    def dijkstra(self, source, weights=None):
+        """Return predecessors, edges and distances of paths from source.
+
+           source is a node id and weights a list of non-negative edge
+           weights (the number of edges is minimized if it is None);
+           returned lists are indexed by node id and have the predecessor
+           on the path, the index of the edge from it (-1 for source and
+           unreachable nodes) and the distance (infinite if unreachable).
+
+           Ties are broken as networkx does, so paths are the same.
+        """
+        indptr, indices = self._lists()
+        size = len(indptr) - 1
+        pred, pred_edge = [-1] * size, [-1] * size
+        dist, seen, done = [math.inf] * size, [math.inf] * size, [False] * size
+        seen[source] = 0
+        heap, counter = [(0, 0, source)], itertools.count(1)
+        while heap:
+            d, __, node = heapq.heappop(heap)
+            if done[node]:
+                continue
+            done[node], dist[node] = True, d
+            for edge in range(indptr[node], indptr[node + 1]):
+                succ = indices[edge]
+                succ_d = d + (1 if weights is None else weights[edge])
+                if not done[succ] and succ_d < seen[succ]:
+                    seen[succ] = succ_d
+                    pred[succ], pred_edge[succ] = node, edge
+                    heapq.heappush(heap, (succ_d, next(counter), succ))
+        return pred, pred_edge, dist
+
+    def bellman_ford(self, source, weights):
+        """Return predecessors, edges and distances of paths from source.
+
+           Like dijkstra(), but weights can be negative; the queue-based
+           variant of networkx is used so paths are the same.
+
+           Raises networkx.NetworkXUnbounded on negative cycles
+        """
+        indptr, indices = self._lists()
+        size = len(indptr) - 1
+        pred, pred_edge, dist = [-1] * size, [-1] * size, [math.inf] * size
+        dist[source], count = 0, [0] * size
+        queue, in_queue = collections.deque([source]), [False] * size
+        in_queue[source] = True
+        while queue:
+            node = queue.popleft()
+            in_queue[node] = False
+            # skip relaxations if the predecessor of node is in the queue
+            if pred[node] >= 0 and in_queue[pred[node]]:
+                continue
+            for edge in range(indptr[node], indptr[node + 1]):
+                succ = indices[edge]
+                succ_d = dist[node] + weights[edge]
+                if succ_d < dist[succ]:
+                    if not in_queue[succ]:
+                        queue.append(succ)
+                        in_queue[succ] = True
+                        count[succ] += 1
+                        if count[succ] == size:
+                            raise nx.NetworkXUnbounded('Negative cost cycle '
+                                                       'detected.')
+                    dist[succ] = succ_d
+                    pred[succ], pred_edge[succ] = node, edge
+        return pred, pred_edge, dist
+
+
+class _NodeView(collections.abc.Mapping):
+    """Mapping {(lat, lon): attributes} of the nodes of a CompactGraph."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __getitem__(self, coor):
+        return self._graph._node_data(self._graph._ids[coor])
+
+    def __iter__(self):
+        return iter(self._graph._coordinates)
+
+    def __len__(self):
+        return len(self._graph._coordinates)
+
+
+class _AdjacencyView(_NodeView):
+    """Mapping {(lat, lon): {(lat, lon): attributes}} of a CompactGraph."""
+
+    def __getitem__(self, coor):
+        return _NeighborView(self._graph, self._graph._ids[coor])
+
+
+class _NeighborView(collections.abc.Mapping):
+    """Mapping {(lat, lon): attributes} of the edges leaving a node."""
+
+    def __init__(self, graph, index):
+        self._graph = graph
+        self._edges = range(graph._indptr[index], graph._indptr[index + 1])
+
+    def __getitem__(self, coor):
+        dest = self._graph._ids[coor]
+        for edge in self._edges:
+            if self._graph._indices[edge] == dest:
+                return self._graph._edge_data(edge)
+        raise KeyError(coor)
+
+    def __iter__(self):
+        return (self._graph._coordinates[self._graph._indices[edge]]
+                for edge in self._edges)
+
+    def __len__(self):
+        return len(self._edges)
+
+
+class CachePaths(object):
+    """Cache of shortest and most energy-efficient routes.
+
+       Paths are not stored as lists of nodes: for each source there is a
+       compact tree of the paths to the other nodes of interests (see
+       _subtree()) while their energy, length and time are kept in dense
+       matrices; Path objects are built on demand and their nodes are
+       unrolled from the tree only when needed.
+    """
+
+    _nodes = None
+    """List of nodes of interests (lat, lon, type) ordered by id."""
+
+    _ids = None
+    """Dictionary of stable integer identifiers of the nodes of interests:
+       {(lat, lon, type): id}
+       they are assigned in graph order and index the rows and columns of
+       the matrices returned by matrix() and reachable.
+    """
+
+    _coordinates = None
+    """Float64 array of the (lat, lon) of the nodes in trees, by node id."""
+
+    _trees = None
+    """List of the trees of paths from each node of interests:
+       [((greenest_nodes, greenest_parents),
+         (shortest_nodes, shortest_parents)), ...]
+       where items are int32 arrays (see _subtree()); it is None in lazy
+       mode.
+    """
+
+    _positions = None
+    """Int32 array [greenest/shortest, src_id, dest_id] of the position of
+       dest in the tree of src (-1 if there is no path); it is None in
+       lazy mode.
+    """
+
+    _values = None
+    """Float64 array [greenest/shortest, label, src_id, dest_id] of the
+       energy, length and time of paths (infinite if there is no path);
+       it is None in lazy mode.
+    """
+
+    _reachable = None
+    """Boolean array [src_id, dest_id] of the cached paths; it is None in
+       lazy mode.
+    """
+
+    _searched = None
+    """Boolean array [src_id] of the sources searched at least once."""
+
+    _labels = ('energy', 'length', 'time')
+    """Path properties which can be exported as matrices."""
+
+    _files = ('nodes', 'coordinates', 'values', 'reachable', 'positions',
+              'tree_nodes', 'tree_parents', 'tree_offsets')
+    """Names of the .npy files written by save() in a cache directory."""
+
+    _format = 2
+    """Version of the files written by save()."""
+
+    _hierarchy_labels = ('energy', 'hops')
+    """Metrics of the hierarchies of greenest and shortest paths (see
+       from_hierarchies()).
+    """
+
+    _hierarchies = None
+    """Tuple of the ContractionHierarchy of greenest and shortest paths
+       of caches without trees (see from_hierarchies()).
+    """
+
+    _lru = None
+    """In lazy mode OrderedDict of the rows of the last used sources:
+       {src_id: (row, size)}
+       where row is the result of _paths_from_source() and size the
+       memory (in bytes) used by its arrays.
+    """
+
+    def _store(self, src_id, result):
+        """Save in cache the result of _paths_from_source() from src_id."""
+        self._searched[src_id] = True
+        if self._lru is None:
+            trees, positions, values, reachable = result
+            self._trees[src_id] = trees
+            self._positions[:, src_id] = positions
+            self._values[:, :, src_id] = values
+            self._reachable[src_id] = reachable
             return
-        record = (src_node, dest_node,
-                  solution.Path(self.graph, greenest),
-                  solution.Path(self.graph, shortest))
-        for index, (s, d, *__) in enumerate(self._cache):
-            # update record if already existing
-            if (s, d) == (src_node, dest_node):
-                self._cache[index] = record
-                return
-        else:
-            self._cache.append(record)
 
-    def __init__(self, graph, type_whitelist=('depot', 'customer', 'station')):
+        trees, *arrays = result
+        size = sum(array.nbytes for array in arrays)
+        size += sum(array.nbytes for tree in trees for array in tree)
+        self._lru[src_id] = (result, size)
+        self._lru_size += size
+        while self._lru_size > self._memory_budget and len(self._lru) > 1:
+            __, (__, evicted_size) = self._lru.popitem(last=False)
+            self._lru_size -= evicted_size
+
+    def _row(self, src_id):
+        """Return (trees, positions, values, reachable) of paths from src_id.
+
+           Items are the ones of _paths_from_source(); in lazy mode paths
+           from src_id are searched if their row is not in the least
+           recently used ones, otherwise they are views of the matrices.
+        """
+        if self._lru is None:
+            trees = None if self._trees is None else self._trees[src_id]
+            return (trees, self._positions[:, src_id],
+                    self._values[:, :, src_id], self._reachable[src_id])
+        if src_id not in self._lru:
+            self._store(src_id, _paths_from_source(src_id,
+                                                   self._search_state))
+        self._lru.move_to_end(src_id)
+        return self._lru[src_id][0]
+
+    def _tree(self, src_id):
+        """Return the trees of paths from the node of interests src_id."""
+        return self._row(src_id)[0]
+
+    def _dense(self):
+        """Return (positions, values, reachable) matrices of all sources.
+
+           In lazy mode they are built from the rows of every source at each
+           call and they are not kept, so memory stays within the budget
+           once the caller drops them.
+        """
+        if self._lru is None:
+            return self._positions, self._values, self._reachable
+        size = len(self._nodes)
+        positions = np.empty((2, size, size), dtype=np.int32)
+        values = np.empty((2, len(self._labels), size, size))
+        reachable = np.empty((size, size), dtype=bool)
+        for src_id in range(size):
+            __, positions[:, src_id], values[:, :, src_id], \
+                reachable[src_id] = self._row(src_id)
+        for array in (positions, values, reachable):
+            array.flags.writeable = False
+        return positions, values, reachable
+
+    def _unroll(self, src_id, dest_id, g):
+        """Return list of coordinates (lat, lon) of a path from its tree.
+
+           g is 0 for the greenest path and 1 for the shortest one.
+        """
+        trees, positions, *__ = self._row(src_id)
+        if trees is None:
+            return self._search_path(src_id, dest_id, g)
+        nodes, parents = trees[g]
+        sequence, position = list(), int(positions[g, dest_id])
+        while position >= 0:
+            sequence.append(nodes[position])
+            position = parents[position]
+        return self._coordinates[sequence[::-1]].tolist()
+
+    def _search_path(self, src_id, dest_id, g):
+        """Return list of coordinates (lat, lon) of a path out of trees.
+
+           The path is unpacked from the hierarchy of greenest (g is 0) or
+           shortest (g is 1) paths, so its values are the cached ones (see
+           from_hierarchies()).
+        """
+        src, dest = (self._graph.node_id(self._nodes[index][:2])
+                     for index in (src_id, dest_id))
+        sequence = self._hierarchies[g].path(src, dest)
+        return self._coordinates[sequence].tolist()
+
+    def _path_values(self, src_node, dest_node, g):
+        """Return ids and {label: value} of a cached path (None if missing).
+
+           g is 0 for the greenest path and 1 for the shortest one.
+        """
+        src_id, dest_id = self._ids.get(src_node), self._ids.get(dest_node)
+        if src_id is None or dest_id is None:
+            return None
+        __, __, values, reachable = self._row(src_id)
+        if not reachable[dest_id]:
+            return None
+        return src_id, dest_id, {label: float(values[g, index, dest_id])
+                                 for index, label in enumerate(self._labels)}
+
+    def _path(self, src_node, dest_node, g):
+        """Return Path from src_node to dest_node or None if not cached.
+
+           g is 0 for the greenest path and 1 for the shortest one.
+        """
+        found = self._path_values(src_node, dest_node, g)
+        if found is None:
+            return None
+        src_id, dest_id, saved = found
+        return solution.Path.lazy(self.graph,
+                                  lambda: self._unroll(src_id, dest_id, g),
+                                  self._nodes[src_id], self._nodes[dest_id],
+                                  saved)
+
+    def __init__(self, graph, type_whitelist=('depot', 'customer', 'station'),
+                 workers=1, memory_budget=None, contract=True):
         """Compute shortest and most efficient path.
 
            Only nodes with labels matching type_whitelist will be considered.
+
+           With more than one worker the searches from each source are
+           distributed over a pool of processes; results are then merged in
+           source order, so the cache is the same of the serial build.
+
+           If memory_budget (in bytes) is set paths are searched only when
+           their source is queried the first time, and the trees of the
+           least recently used sources are dropped (to be searched again
+           if needed) when their size exceeds the budget; the matrices of
+           all sources are not allocated, so rows of values and positions
+           of each source are counted in the budget with its trees.
+
+           If contract is True searches run over a copy of graph where
+           chains of nodes which are not of interests are single edges
+           (see CompactGraph.contract_chains()).
         """
-        self._cache = list()
         self._graph = graph
         self._type_whitelist = type_whitelist
+        self._memory_budget = memory_budget
+
+        # searches always run over the CSR form of graph
+        if not isinstance(graph, CompactGraph):
+            graph = CompactGraph(graph)
+
+        # nodes of interests are collected once, not at every source
+        targets = [index for index, kind in enumerate(graph._types)
+                   if kind in type_whitelist]
+        self._nodes = [(*graph.coordinates[index], graph._types[index])
+                       for index in targets]
+        self._ids = {node: index for index, node in enumerate(self._nodes)}
+        self._coordinates = np.array(graph.coordinates,
+                                     dtype=np.float64).reshape(-1, 2)
+
+        size = len(self._nodes)
+        self._searched = np.zeros(size, dtype=bool)
+
+        # one pass over the edges is enough to run Dijkstra on energies
+        potential = CachePaths._greenest_potential(graph)
+        if potential is None:
+            IO.Log.debug('Could not find a valid potential for energies, '
+                         'falling back to Bellman-Ford')
+            weights = graph.edge_values('energy').tolist()
+        else:
+            weights = graph.reduced_weights('energy', potential)
+
+        # searches skip the nodes in chains, paths are unrolled in trees
+        values = [graph.edge_values(label).tolist() for label in self._labels]
+        if contract:
+            graph = graph.contract_chains(targets)
+            weights = graph.collapse(weights).tolist()
+            IO.Log.debug(f'Contracted chains of graph to '
+                         f'{graph.number_of_edges()} edges')
+        state = (graph, weights, potential is not None, targets, values)
+        if memory_budget is not None:
+            self._lru, self._lru_size = collections.OrderedDict(), 0
+            self._search_state = state
+            return
+
+        # matrices of all sources are allocated only out of lazy mode
+        self._trees = [None] * size
+        self._positions = np.full((2, size, size), -1, dtype=np.int32)
+        self._values = np.full((2, len(self._labels), size, size), np.inf)
+        self._reachable = np.zeros((size, size), dtype=bool)
+        if workers is None or workers <= 1 or size <= 1:
+            results = (_paths_from_source(src_id, state)
+                       for src_id in range(size))
+        else:
+            # the graph is shipped to each worker only once
+            pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=state)
+            chunksize = max(1, size // (4 * workers))
+            with pool:
+                results = list(pool.map(_worker_paths_from_source,
+                                        range(size), chunksize=chunksize))
+            IO.Log.debug(f'Searched paths from {size} sources with '
+                         f'{workers} processes')
+
+        # from each depot, customer, station to other ones
+        for src_id, result in enumerate(results):
+            self._store(src_id, result)
+        for array in (self._positions, self._values, self._reachable):
+            array.flags.writeable = False
+
+    def save(self, directory):
+        """Write cache to directory as memory-mappable .npy files.
+
+           Files are written in a temporary directory which then replaces
+           the given one, so a cache is never read while partially written;
+           in lazy mode paths from all sources are searched and their
+           matrices allocated, so the memory budget is exceeded.
+
+           Raises ValueError on caches built by from_hierarchies()
+        """
+        if self._lru is None and self._trees is None:
+            raise ValueError('Could not save a cache without trees')
+        positions, values, reachable = self._dense()
+        size = len(self._nodes)
+        tree_nodes = [np.zeros(0, dtype=np.int32)]
+        tree_parents = [np.zeros(0, dtype=np.int32)]
+        tree_offsets, start = np.zeros((size, 2, 2), dtype=np.int64), 0
+        for src_id in range(size):
+            for g, (nodes, parents) in enumerate(self._tree(src_id)):
+                tree_offsets[src_id, g] = start, start + len(nodes)
+                tree_nodes.append(nodes)
+                tree_parents.append(parents)
+                start += len(nodes)
+
+        # only the coordinates of nodes in trees are written
+        used, tree_nodes = np.unique(np.concatenate(tree_nodes),
+                                     return_inverse=True)
+        arrays = {'nodes': np.array(self._nodes,
+                                    dtype=[('lat', np.float64),
+                                           ('lon', np.float64),
+                                           ('type', 'U8')]),
+                  'coordinates': self._coordinates[used],
+                  'values': values,
+                  'reachable': reachable,
+                  'positions': positions,
+                  'tree_nodes': tree_nodes.astype(np.int32),
+                  'tree_parents': np.concatenate(tree_parents),
+                  'tree_offsets': tree_offsets}
+
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(dir=parent)
+        for name in CachePaths._files:
+            np.save(os.path.join(temp_dir, name + '.npy'), arrays[name])
+        shutil.rmtree(directory, ignore_errors=True)
+        os.rename(temp_dir, directory)
+
+    @classmethod
+    def load(cls, graph, directory,
+             type_whitelist=('depot', 'customer', 'station')):
+        """Return cache written by save() in directory.
+
+           Arrays are memory-mapped and used as they are, so nothing is
+           read until paths are queried.
+
+           Raises:
+           - FileNotFoundError if a file is missing
+           - ValueError if the nodes of interests of graph are not the
+             ones in cache
+        """
+        arrays = dict()
+        for name in CachePaths._files:
+            file_name = os.path.join(directory, name + '.npy')
+            if not os.path.isfile(file_name):
+                raise FileNotFoundError(errno.ENOENT, 'Could not find '
+                                        f'{file_name}')
+            arrays[name] = np.load(file_name, mmap_mode='r')
+
+        cache = cls.__new__(cls)
+        cache._graph = graph
+        cache._type_whitelist = type_whitelist
+        cache._nodes = [tuple(node) for node in arrays['nodes'].tolist()]
+        cache._ids = {node: index for index, node in enumerate(cache._nodes)}
+        if cache._nodes != [(*coor, data['type'])
+                            for coor, data in graph.nodes_iter(data=True)
+                            if data['type'] in type_whitelist]:
+            raise ValueError(f'Nodes of interests in {directory} do not '
+                             'match the ones of the graph')
+
+        cache._coordinates = arrays['coordinates']
+        cache._values = arrays['values']
+        cache._reachable = arrays['reachable']
+        cache._positions = arrays['positions']
+        cache._searched = np.ones(len(cache._nodes), dtype=bool)
+
+        tree_nodes, tree_parents = arrays['tree_nodes'], arrays['tree_parents']
+        cache._trees = [tuple((tree_nodes[start:stop],
+                               tree_parents[start:stop])
+                              for start, stop in offsets)
+                        for offsets in arrays['tree_offsets'].tolist()]
+        return cache
+
+    @classmethod
+    def from_hierarchies(cls, graph, hierarchies,
+                         type_whitelist=('depot', 'customer', 'station')):
+        """Return cache whose values are computed by contraction hierarchies.
+
+           graph is a CompactGraph and hierarchies a dictionary
+           {label: ContractionHierarchy} with its energy and hops
+           hierarchies (see _hierarchy_labels): greenest paths are the ones
+           with the least energy and shortest paths the ones with the least
+           roads, like in searched caches; no single-source search is run
+           and the values of a path are the sums over its roads.
+
+           There are no trees: the nodes of a path are unpacked from its
+           hierarchy when it is unrolled.
+
+           Raises ValueError if a hierarchy is missing
+        """
+        for label in cls._hierarchy_labels:
+            if label not in hierarchies:
+                raise ValueError(f'Missing {label} hierarchy')
+        cache = cls.__new__(cls)
+        cache._graph = graph
+        cache._type_whitelist = type_whitelist
+        targets = [index for index, kind in enumerate(graph._types)
+                   if kind in type_whitelist]
+        cache._nodes = [(*graph.coordinates[index], graph._types[index])
+                        for index in targets]
+        cache._ids = {node: index for index, node in enumerate(cache._nodes)}
+        cache._coordinates = np.array(graph.coordinates,
+                                      dtype=np.float64).reshape(-1, 2)
+
+        size = len(targets)
+        cache._hierarchies = tuple(hierarchies[label]
+                                   for label in cls._hierarchy_labels)
+        cache._values = np.stack([hierarchy.values(targets, targets)
+                                  for hierarchy in cache._hierarchies])
+        cache._reachable = np.all(cache._values < math.inf, axis=(0, 1))
+        np.fill_diagonal(cache._reachable, False)
+        cache._values[:, :, ~cache._reachable] = math.inf
+        cache._positions = np.full((2, size, size), -1, dtype=np.int32)
+        for array in (cache._positions, cache._values, cache._reachable):
+            array.flags.writeable = False
+        cache._searched = np.ones(size, dtype=bool)
+        return cache
 
-        # from each depot, customer, station ...
-        for src_coor, src_data in graph.nodes_iter(data=True):
-            if src_data['type'] in type_whitelist:
-                # get shortest paths starting from src_coor
-                shortest_path = nx.single_source_dijkstra_path(graph,
-                                                               src_coor,
-                                                               weight='lenght')
-                # get most energy-efficient paths from src_coor
-                greenest_t = nx.bellman_ford(graph, src_coor, weight='energy')
-                g_pred, g_energy = greenest_t
-
-                # ... to other depot, customer, destination
-                for dest_coor, dest_data in graph.nodes_iter(data=True):
-                    if dest_data['type'] in type_whitelist \
-                       and dest_coor != src_coor \
-                       and dest_coor in shortest_path \
-                       and dest_coor in g_energy:
-                        # unroll the path from predecessors dictionary
-                        greenest_path = list()
-                        coor_to_add = dest_coor
-                        while coor_to_add is not None:
-                            greenest_path.append(coor_to_add)
-                            coor_to_add = g_pred[coor_to_add]
-                        greenest_path = list(reversed(greenest_path))
-
-                        self._add((*src_coor, src_data['type']),
-                                  (*dest_coor, dest_data['type']),
-                                  greenest_path,
-                                  shortest_path[dest_coor])
+    @staticmethod
+    def _greenest_potential(graph, weight='energy', tolerance=1e-6):
+        """Return a node potential making every reduced weight non-negative.
+
+           graph is a CompactGraph and the reduced weight of edge (u, v) is:
+               weight(u, v) + potential[u] - potential[v]
+           the sum of reduced weights along a path differs from the
+           original one only by the potential of its endpoints, so Dijkstra
+           can replace Bellman-Ford (Johnson's reweighting).
+
+           The null potential is tried first and then one proportional to
+           the altitude of nodes (utility.energy() is linear in the rise of
+           a road); None is returned if both of them are not valid.
+        """
+        factor = IO.load_problem_file()['car'][1]['weight'] * 9.81
+        weights, sources = graph.edge_values(weight), graph.edge_sources()
+        for potential in (np.zeros(len(graph)), factor * graph._altitude):
+            if np.all(weights + potential[sources] - potential[graph.indices]
+                      >= -tolerance):
+                return potential
+
+    @staticmethod
+    def _subtree(pred, pred_edge, targets, values, origin=None):
+        """Return the tree of the paths from a source to targets.
+
+           pred and pred_edge are the lists returned by the searches of
+           CompactGraph, while values are lists of edge values by label.
+           If the searches ran over contracted chains, origin is the tuple
+           of CompactGraph.origin() as lists: edges are unrolled and values
+           are the ones of the original edges.
+
+           The tree is a tuple of two int32 arrays (nodes, parents): nodes
+           has the identifiers of the nodes in the union of the paths,
+           parents the position of the previous node in the same arrays
+           (-1 for the source) which always comes before its successors.
+
+           The positions of targets and, for each label, the list of the
+           sums of the edge values from the source to each position are
+           returned too; sums are accumulated in path order, so they are
+           the same values of Path properties.
+        """
+        nodes, parents, position = list(), list(), dict()
+        sums = [list() for label_values in values]
+        for target in targets:
+            chain, node = list(), target
+            while node >= 0 and node not in position:
+                chain.append(node)
+                node = pred[node]
+            for node in reversed(chain):
+                if pred[node] < 0:
+                    position[node] = len(nodes)
+                    nodes.append(node)
+                    parents.append(-1)
+                    for label_sums in sums:
+                        label_sums.append(0)
+                    continue
+                parent, edges = position[pred[node]], [pred_edge[node]]
+                if origin is not None:
+                    origin_indptr, origin_edges, original_indices = origin
+                    edges = origin_edges[origin_indptr[edges[0]]:
+                                         origin_indptr[edges[0] + 1]]
+                for edge in edges:
+                    # inner nodes of chains are not in position
+                    nodes.append(original_indices[edge]
+                                 if origin is not None else node)
+                    parents.append(parent)
+                    for label_values, label_sums in zip(values, sums):
+                        label_sums.append(label_sums[parent]
+                                          + label_values[edge])
+                    parent = len(nodes) - 1
+                position[node] = parent
+        tree = (np.array(nodes, dtype=np.int32),
+                np.array(parents, dtype=np.int32))
+        return tree, [position[target] for target in targets], sums
 
     @property
     def graph(self):
@@ -345,12 +1415,11 @@ class CachePaths(object):
             raise ValueError(f'source node not in cache {src_node}')
         if dest_node[2] not in self._type_whitelist:
             raise ValueError(f'destination node not in cache {dest_node}')
-        try:
-            return next(greenest for src, dest, greenest, __ in self._cache
-                        if (src, dest) == (src_node, dest_node))
-        except StopIteration:
+        path = self._path(src_node, dest_node, 0)
+        if path is None:
             raise nx.exception.NetworkXNoPath('No greenest path found between '
                                               f'{src_node} and {dest_node}')
+        return path
 
     def shortest(self, src_node, dest_node):
         """Return shortest Path between src_node and dest_node.
@@ -361,21 +1430,39 @@ class CachePaths(object):
             raise ValueError(f'source node not in cache {src_node}')
         if dest_node[2] not in self._type_whitelist:
             raise ValueError(f'destination node not in cache {dest_node}')
-        try:
-            return next(shortest for src, dest, __, shortest in self._cache
-                        if (src, dest) == (src_node, dest_node))
-        except StopIteration:
+        path = self._path(src_node, dest_node, 1)
+        if path is None:
             raise nx.exception.NetworkXNoPath('No shortest path found between '
                                               f'{src_node} and {dest_node}')
+        return path
+
+    def path_values(self, src_node, dest_node, greenest=True):
+        """Return {label: value} of the greenest (or shortest) cached path.
+
+           Unlike greenest() and shortest() no Path is built, so it is a
+           cheap way to know the energy, length and time of a path; None is
+           returned if the path is not cached.
+        """
+        found = self._path_values(src_node, dest_node, 0 if greenest else 1)
+        return None if found is None else found[2]
 
     def destination_iterator(self, dest_node):
         """Return iterator over cached records ending in dest_node.
 
            dest_node is a tuple of three elements (lat, lon, type) and
            it is omitted from records.
+
+           In lazy mode paths from every source are searched.
         """
-        return iter([(s, green, short)
-                     for s, d, green, short in self._cache if d == dest_node])
+        if dest_node not in self._ids:
+            return iter(list())
+        dest_id = self._ids[dest_node]
+        sources = [src_id for src_id in range(len(self._nodes))
+                   if self._row(src_id)[3][dest_id]]
+        return iter([(self._nodes[src_id],
+                      self._path(self._nodes[src_id], dest_node, 0),
+                      self._path(self._nodes[src_id], dest_node, 1))
+                     for src_id in sources])
 
     def source_iterator(self, src_node):
         """Return iterator over cached records starting from src_node.
@@ -383,8 +1470,547 @@ class CachePaths(object):
            src_node is a tuple of three elements (lat, lon, type) and
            it is omitted from records.
         """
-        return iter([(d, green, short)
-                     for s, d, green, short in self._cache if s == src_node])
+        if src_node not in self._ids:
+            return iter(list())
+        destinations = np.flatnonzero(self._row(self._ids[src_node])[3])
+        return iter([(self._nodes[dest_id],
+                      self._path(src_node, self._nodes[dest_id], 0),
+                      self._path(src_node, self._nodes[dest_id], 1))
+                     for dest_id in destinations.tolist()])
+
+    @property
+    def nodes(self):
+        """Return list of nodes of interests (lat, lon, type) ordered by id."""
+        return self._nodes
+
+    def node_id(self, node):
+        """Return integer identifier of node in the matrices.
+
+           node is a tuple of three elements (lat, lon, type)
+           Raises ValueError if node is not in cache
+        """
+        try:
+            return self._ids[node]
+        except KeyError:
+            raise ValueError(f'node not in cache {node}')
+
+    def matrix(self, label, greenest=True):
+        """Return read-only matrix of label values between nodes of interests.
+
+           label can be 'energy', 'length' or 'time';
+           element [i, j] refers to the greenest (or shortest) path from the
+           node with id i to the node with id j and it is infinite where the
+           path does not exist (see reachable).
+
+           In lazy mode paths from every source are searched and the matrix
+           is built at each call (see row()).
+           Raises ValueError on unknown label
+        """
+        if label not in self._labels:
+            raise ValueError(f'Could not build a matrix of {label} values')
+        g, index = 0 if greenest else 1, self._labels.index(label)
+        if self._lru is None:
+            return self._values[g, index]
+        ret = np.stack([self._row(src_id)[2][g, index]
+                        for src_id in range(len(self._nodes))])
+        ret.flags.writeable = False
+        return ret
+
+    def row(self, src_node, label, greenest=True):
+        """Return read-only array of label values of paths from src_node.
+
+           element [j] refers to the greenest (or shortest) path to the
+           node with id j and it is infinite where the path does not exist;
+           unlike matrix() only the paths from src_node are searched in
+           lazy mode.
+
+           Raises ValueError on unknown label or if src_node is not in cache
+        """
+        if label not in self._labels:
+            raise ValueError(f'Could not build a row of {label} values')
+        values = self._row(self.node_id(src_node))[2]
+        ret = values[0 if greenest else 1, self._labels.index(label)]
+        ret.flags.writeable = False
+        return ret
+
+    @property
+    def reachable(self):
+        """Return read-only boolean matrix of the cached paths.
+
+           element [i, j] is True if a path from the node with id i to the
+           node with id j is cached (the diagonal is always False).
+
+           In lazy mode paths from every source are searched and the matrix
+           is built at each call.
+        """
+        if self._lru is None:
+            return self._reachable
+        ret = np.stack([self._row(src_id)[3]
+                        for src_id in range(len(self._nodes))])
+        ret.flags.writeable = False
+        return ret
+
+
+def _paths_from_source(src_id, state):
+    """Return shortest and greenest paths from a node of interests to others.
+
+       state is a tuple: (graph, weights, nonnegative, targets, values)
+       (see CachePaths.__init__()), src_id is an index of targets and the
+       returned tuple is: (trees, positions, values, reachable)
+       - trees: greenest and shortest trees (see CachePaths._subtree())
+       - positions: int32 array [greenest/shortest, target] of the
+         positions of targets in trees (-1 if there is no path)
+       - values: float64 array [greenest/shortest, label, target] of the
+         energy, length and time of paths (infinite if there is no path)
+       - reachable: boolean array [target] of the existing paths
+    """
+    graph, weights, nonnegative, targets, values = state
+    src = targets[src_id]
+
+    # get shortest paths starting from src (the 'lenght' weight of previous
+    # versions was missing on every edge, so the number of edges is used)
+    shortest = graph.dijkstra(src, graph.hops())
+    # get most energy-efficient paths from src
+    if nonnegative:
+        greenest = graph.dijkstra(src, weights)
+    else:
+        greenest = graph.bellman_ford(src, weights)
+
+    # ... to other depot, customer, destination
+    reachable = np.array([dest != src
+                          and shortest[2][dest] < math.inf
+                          and greenest[2][dest] < math.inf
+                          for dest in targets], dtype=bool)
+    reached = [targets[index] for index in np.flatnonzero(reachable)]
+
+    origin = graph._origin_lists()
+    trees = list()
+    positions = np.full((2, len(targets)), -1, dtype=np.int32)
+    path_values = np.full((2, len(values), len(targets)), np.inf)
+    for g, (pred, pred_edge, __) in enumerate((greenest, shortest)):
+        tree, reached_positions, sums = CachePaths._subtree(
+            pred, pred_edge, reached, values, origin)
+        trees.append(tree)
+        positions[g, reachable] = reached_positions
+        for index, label_sums in enumerate(sums):
+            path_values[g, index, reachable] = [
+                label_sums[position] for position in reached_positions]
+    return tuple(trees), positions, path_values, reachable
+
+
+_worker_state = None
+"""State of CachePaths construction shared by the processes of a pool."""
+
+
+def _init_worker(*state):
+    """Save in a pool process the state needed by _paths_from_source()."""
+    global _worker_state
+    _worker_state = state
+
+
+def _worker_paths_from_source(src_id):
+    """Run _paths_from_source() over the state saved by _init_worker()."""
+    return _paths_from_source(src_id, _worker_state)
+
+
+class ContractionHierarchy(object):
+    """Contraction hierarchy of a CompactGraph for a single metric.
+
+       Nodes are contracted one at a time (the ones adding less shortcuts
+       first) and a shortcut replaces each path through a contracted node
+       which has no shorter alternative (witness); then the distance
+       between two nodes is the shortest sum of an upward search from the
+       source and a backward upward search from the target, both settling
+       only few nodes.
+
+       Each edge of the hierarchy keeps the contracted node it passes
+       through (-1 for roads) and the energy, length and time of the roads
+       it stands for, so the values and the nodes of the shortest path are
+       known along with its metric.
+
+       matrix() and values() answer many-to-many queries with buckets: the
+       backward searches from targets are stored in the nodes they settle
+       and then scanned by the forward searches from sources, so adding a
+       node of interests costs two small searches instead of a whole tree.
+    """
+
+    _labels = ('energy', 'hops', 'length', 'time')
+    """Metrics of a hierarchy: edge attributes or the number of roads."""
+
+    _carried = CachePaths._labels
+    """Road attributes summed along the edges of a hierarchy."""
+
+    _files = ('label', 'coordinates', 'potential',
+              'up_indptr', 'up_indices', 'up_weights', 'up_middles',
+              'up_values', 'down_indptr', 'down_indices', 'down_weights',
+              'down_middles', 'down_values')
+    """Names of the .npy files written by save() in a directory."""
+
+    _csr_names = ('indptr', 'indices', 'weights', 'middles', 'values')
+    """Names of the arrays of upward and downward edges (see _csr())."""
+
+    _format = 2
+    """Version of the files written by save()."""
+
+    def __init__(self, graph, label, settle_limit=64):
+        """Contract nodes of graph (a CompactGraph) weighted by label.
+
+           Witness searches stop after settle_limit nodes, which can only
+           add some superfluous shortcuts.
+
+           Raises ValueError on unknown label or if energies cannot be
+           made non-negative (see CachePaths._greenest_potential())
+        """
+        if label not in ContractionHierarchy._labels:
+            raise ValueError(f'Could not build a hierarchy of {label} '
+                             'values')
+        self._label = label
+        self._coordinates = np.array(graph.coordinates,
+                                     dtype=np.float64).reshape(-1, 2)
+        self._potential = np.zeros(len(graph))
+        if label == 'energy':
+            # energies of downhill roads are negative, they are reweighted
+            self._potential = CachePaths._greenest_potential(graph)
+            if self._potential is None:
+                raise ValueError('Could not find a valid potential for '
+                                 'energies')
+            weights = graph.reduced_weights('energy', self._potential)
+        elif label == 'hops':
+            weights = graph.hops() or [1] * graph.number_of_edges()
+        else:
+            weights = graph.edge_values(label).tolist()
+        carried = list(zip(*[graph.edge_values(name).tolist()
+                             for name in ContractionHierarchy._carried]))
+
+        # edges between nodes which are not contracted yet, the lightest
+        # of parallel edges is kept
+        indptr, indices = graph._lists()
+        succ = [dict() for node in range(len(graph))]
+        pred = [dict() for node in range(len(graph))]
+        data = dict()  # {(src, dest): (middle node, carried values)}
+        for node in range(len(graph)):
+            for edge in range(indptr[node], indptr[node + 1]):
+                dest = indices[edge]
+                if dest != node \
+                        and weights[edge] < succ[node].get(dest, math.inf):
+                    succ[node][dest] = pred[dest][node] = weights[edge]
+                    data[node, dest] = -1, carried[edge]
+
+        up, down = [None] * len(graph), [None] * len(graph)
+        deleted = [0] * len(graph)
+        heap = [(self._priority(node, succ, pred, deleted, settle_limit)[0],
+                 node) for node in range(len(graph))]
+        heapq.heapify(heap)
+        while heap:
+            __, node = heapq.heappop(heap)
+            priority, shortcuts = self._priority(node, succ, pred, deleted,
+                                                 settle_limit)
+            if heap and priority > heap[0][0]:
+                # priorities change while neighbors are contracted
+                heapq.heappush(heap, (priority, node))
+                continue
+            up[node], down[node] = succ[node], pred[node]
+            for neighbor in succ[node]:
+                del pred[neighbor][node]
+                deleted[neighbor] += 1
+            for neighbor in pred[node]:
+                del succ[neighbor][node]
+                deleted[neighbor] += 1
+            for src, dest, weight in shortcuts:
+                if weight < succ[src].get(dest, math.inf):
+                    succ[src][dest] = pred[dest][src] = weight
+                    data[src, dest] = node, tuple(
+                        a + b for a, b in zip(data[src, node][1],
+                                              data[node, dest][1]))
+
+        self._up = ContractionHierarchy._csr(up, data, backward=False)
+        self._down = ContractionHierarchy._csr(down, data, backward=True)
+        self._csr_lists = None
+
+    @staticmethod
+    def _witness(src, skip, limit, succ, settle_limit):
+        """Return distances from src avoiding node skip (up to limit)."""
+        dist, heap, settled = {src: 0}, [(0, src)], 0
+        while heap and settled < settle_limit:
+            d, node = heapq.heappop(heap)
+            if d > limit:
+                break
+            if d > dist[node]:
+                continue
+            settled += 1
+            for dest, weight in succ[node].items():
+                if dest != skip and d + weight < dist.get(dest, math.inf):
+                    dist[dest] = d + weight
+                    heapq.heappush(heap, (d + weight, dest))
+        return dist
+
+    @staticmethod
+    def _priority(node, succ, pred, deleted, settle_limit):
+        """Return priority of node and the shortcuts its contraction adds.
+
+           The priority is the number of added shortcuts minus the one of
+           removed edges plus the number of contracted neighbors.
+        """
+        shortcuts = list()
+        for src, src_weight in pred[node].items():
+            weights = {dest: src_weight + weight
+                       for dest, weight in succ[node].items() if dest != src}
+            if not weights:
+                continue
+            dist = ContractionHierarchy._witness(
+                src, node, max(weights.values()), succ, settle_limit)
+            shortcuts.extend((src, dest, weight)
+                             for dest, weight in weights.items()
+                             if dist.get(dest, math.inf) > weight)
+        priority = (len(shortcuts) - len(succ[node]) - len(pred[node])
+                    + deleted[node])
+        return priority, shortcuts
+
+    @staticmethod
+    def _csr(adjacency, data, backward):
+        """Return (indptr, indices, weights, middles, values) arrays.
+
+           adjacency is the list of the dicts {node: weight} of the upward
+           edges of each node (of the downward ones, whose source is in
+           the dict, if backward is True) and data the dict {(src, dest):
+           (middle, carried values)} of edges.
+        """
+        indptr, indices, weights, middles, values = [0], [], [], [], []
+        for node, node_adjacency in enumerate(adjacency):
+            for other, weight in node_adjacency.items():
+                middle, carried = data[(other, node) if backward
+                                       else (node, other)]
+                indices.append(other)
+                weights.append(weight)
+                middles.append(middle)
+                values.append(carried)
+            indptr.append(len(indices))
+        return (np.array(indptr, dtype=np.int64),
+                np.array(indices, dtype=np.int32),
+                np.array(weights, dtype=np.float64),
+                np.array(middles, dtype=np.int32),
+                np.array(values, dtype=np.float64).reshape(
+                    -1, len(ContractionHierarchy._carried)))
+
+    @property
+    def label(self):
+        """Return the metric of the hierarchy."""
+        return self._label
+
+    def number_of_shortcuts(self):
+        """Return number of edges of the hierarchy."""
+        return len(self._up[1]) + len(self._down[1])
+
+    def _lists(self, backward):
+        """Return arrays of upward or downward edges as lists."""
+        if self._csr_lists is None:
+            self._csr_lists = tuple(tuple(array.tolist() for array in csr)
+                                    for csr in (self._up, self._down))
+        return self._csr_lists[1 if backward else 0]
+
+    def _search(self, src, backward):
+        """Return dictionary {node: (distance, parent, edge)} of a search.
+
+           The search is upward (downward edges are followed backward if
+           backward is True), nodes are in the order they are settled and
+           edge is the index of the edge linking them to parent (-1 for
+           src).
+        """
+        indptr, indices, weights, __, __ = self._lists(backward)
+        dist, heap, settled = {src: 0}, [(0, src, -1, -1)], dict()
+        while heap:
+            d, node, parent, edge = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled[node] = d, parent, edge
+            for edge in range(indptr[node], indptr[node + 1]):
+                dest = indices[edge]
+                if d + weights[edge] < dist.get(dest, math.inf):
+                    dist[dest] = d + weights[edge]
+                    heapq.heappush(heap, (d + weights[edge], dest, node,
+                                          edge))
+        return settled
+
+    def _carried_values(self, settled, backward):
+        """Return {node: carried values} of the paths of a search."""
+        values = self._lists(backward)[4]
+        ret = dict()
+        for node, (__, parent, edge) in settled.items():
+            if edge < 0:
+                ret[node] = (0,) * len(ContractionHierarchy._carried)
+            else:
+                ret[node] = tuple(a + b for a, b in zip(ret[parent],
+                                                        values[edge]))
+        return ret
+
+    def _join(self, sources, targets):
+        """Return metric and carried values of paths (see values()).
+
+           Among the nodes where searches meet, the one with the least sum
+           of distances (and the least id on ties, like in path()) is
+           chosen.
+        """
+        buckets = collections.defaultdict(list)
+        for j, target in enumerate(targets):
+            settled = self._search(target, backward=True)
+            carried = self._carried_values(settled, backward=True)
+            for node, (d, __, __) in settled.items():
+                buckets[node].append((j, d, carried[node]))
+
+        size = len(ContractionHierarchy._carried)
+        metric = np.full((len(sources), len(targets)), math.inf)
+        values = np.full((size, len(sources), len(targets)), math.inf)
+        for i, source in enumerate(sources):
+            settled = self._search(source, backward=False)
+            carried = self._carried_values(settled, backward=False)
+            best = [(math.inf, -1)] * len(targets)
+            for node, (d, __, __) in settled.items():
+                for j, target_d, target_carried in buckets.get(node, ()):
+                    if (d + target_d, node) < best[j]:
+                        best[j] = d + target_d, node
+                        values[:, i, j] = [a + b for a, b in zip(
+                            carried[node], target_carried)]
+            metric[i] = [d for d, __ in best]
+        return metric, values
+
+    def matrix(self, sources, targets):
+        """Return array of label values of the paths from sources to targets.
+
+           sources and targets are lists of node ids (see
+           CompactGraph.node_id()); element [i, j] is the minimum value of
+           a path from sources[i] to targets[j] and it is infinite if there
+           is no path.
+        """
+        ret, __ = self._join(sources, targets)
+        # potentials of endpoints are removed from reweighted energies
+        return (ret - self._potential[sources][:, np.newaxis]
+                + self._potential[targets][np.newaxis, :])
+
+    def values(self, sources, targets):
+        """Return array [label, source, target] of the values of paths.
+
+           Labels are the ones of CachePaths and values are the sums over
+           the roads of the paths minimizing the metric (the ones returned
+           by path()); they are infinite if there is no path.
+        """
+        __, ret = self._join(sources, targets)
+        return ret
+
+    def path(self, src, dest):
+        """Return list of node ids of the path from src to dest.
+
+           The path is the one whose values are returned by values(); None
+           is returned if there is no path.
+        """
+        forward = self._search(src, backward=False)
+        backward = self._search(dest, backward=True)
+        meeting = min(((d + backward[node][0], node)
+                       for node, (d, __, __) in forward.items()
+                       if node in backward), default=None)
+        if meeting is None:
+            return None
+
+        # edges of the hierarchy from src to dest, with their middles
+        edges, node = list(), meeting[1]
+        up_middles = self._lists(backward=False)[3]
+        down_middles = self._lists(backward=True)[3]
+        while node != src:
+            __, parent, edge = forward[node]
+            edges.append((parent, node, up_middles[edge]))
+            node = parent
+        edges.reverse()
+        node = meeting[1]
+        while node != dest:
+            __, parent, edge = backward[node]
+            edges.append((node, parent, down_middles[edge]))
+            node = parent
+
+        ret = [src]
+        for edge in edges:
+            ret.extend(self._unpack(*edge))
+        return ret
+
+    def _unpack(self, src, dest, middle):
+        """Return nodes after src of the roads of an edge of the hierarchy.
+
+           A shortcut through middle is made of the edges from src to
+           middle (a downward one of middle) and from middle to dest (an
+           upward one), which may be shortcuts too.
+        """
+        ret, stack = list(), [(src, dest, middle)]
+        while stack:
+            src, dest, middle = stack.pop()
+            if middle < 0:
+                ret.append(dest)
+                continue
+            stack.append((middle, dest,
+                          self._middle(middle, dest, backward=False)))
+            stack.append((src, middle,
+                          self._middle(middle, src, backward=True)))
+        return ret
+
+    def _middle(self, node, other, backward):
+        """Return middle of the upward (downward) edge of node and other."""
+        indptr, indices, __, middles, __ = self._lists(backward)
+        for edge in range(indptr[node], indptr[node + 1]):
+            if indices[edge] == other:
+                return middles[edge]
+        raise KeyError(f'No edge between {node} and {other} in hierarchy')
+
+    def save(self, directory):
+        """Write hierarchy to directory as .npy files.
+
+           Files are written in a temporary directory which then replaces
+           the given one, so a hierarchy is never read while partially
+           written.
+        """
+        arrays = {'label': np.array(self._label),
+                  'coordinates': self._coordinates,
+                  'potential': self._potential}
+        for prefix, csr in (('up_', self._up), ('down_', self._down)):
+            for name, array in zip(ContractionHierarchy._csr_names, csr):
+                arrays[prefix + name] = array
+
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(dir=parent)
+        for name in ContractionHierarchy._files:
+            np.save(os.path.join(temp_dir, name + '.npy'), arrays[name])
+        shutil.rmtree(directory, ignore_errors=True)
+        os.rename(temp_dir, directory)
+
+    @classmethod
+    def load(cls, graph, directory):
+        """Return hierarchy written by save() in directory.
+
+           Raises:
+           - FileNotFoundError if a file is missing
+           - ValueError if the nodes of graph are not the ones of the
+             hierarchy
+        """
+        arrays = dict()
+        for name in ContractionHierarchy._files:
+            file_name = os.path.join(directory, name + '.npy')
+            if not os.path.isfile(file_name):
+                raise FileNotFoundError(errno.ENOENT, 'Could not find '
+                                        f'{file_name}')
+            arrays[name] = np.load(file_name)
+
+        if not np.array_equal(arrays['coordinates'],
+                              np.array(graph.coordinates,
+                                       dtype=np.float64).reshape(-1, 2)):
+            raise ValueError(f'Nodes of hierarchy in {directory} do not '
+                             'match the ones of the graph')
+        hierarchy = cls.__new__(cls)
+        hierarchy._label = str(arrays['label'])
+        hierarchy._coordinates = arrays['coordinates']
+        hierarchy._potential = arrays['potential']
+        hierarchy._up = tuple(arrays['up_' + name]
+                              for name in ContractionHierarchy._csr_names)
+        hierarchy._down = tuple(arrays['down_' + name]
+                                for name in ContractionHierarchy._csr_names)
+        hierarchy._csr_lists = None
+        return hierarchy
 
 
 class DrawSVG(object):
@@ -28,7 +28,9 @@ __authors__ = "Serena Ziviani, Federico Motta"
 __copyright__ = "E-VRP  Copyright (C)  2017"
 __license__ = "GPL3"
 
+import collections
 import math
+import numpy as np
 import time
 import copy
 
@@ -133,24 +135,209 @@ class GreedyHeuristic(object):
 
 
 def find_nearest(sol, current_node, type_to_find):
-    min_time = math.inf
-    min_node = None
-    for dest, green, short in sol._graph_cache.source_iterator(current_node):
-        if type_to_find == 'customer':
-            if dest[2] == type_to_find and \
-               dest in sol.missing_customers() and \
-               green.time < min_time:
-                min_time = green.time
-                min_node = dest
-        else:
-            if dest[2] == type_to_find and green.time < min_time:
-                min_time = green.time
-                min_node = dest
-    return min_node
+    """Return the node of type_to_find quickest to reach from current_node.
 
+       When looking for a customer only the missing ones are considered;
+       None is returned if no such node is reachable.
+    """
+    cache = sol._graph_cache
+    try:
+        # in lazy mode only the paths from current_node are searched
+        times = cache.row(current_node, 'time', greenest=True)
+    except ValueError:
+        return None
+    if type_to_find == 'customer':
+        candidates = sorted(cache.node_id(c) for c in sol.missing_customers())
+    else:
+        candidates = [index for index, node in enumerate(cache.nodes)
+                      if node[2] == type_to_find]
+    if not candidates:
+        return None
+
+    # times of unreachable candidates are infinite
+    candidates = np.array(candidates, dtype=np.intp)
+    times = times[candidates]
+    min_index = int(np.argmin(times))
+    if not times[min_index] < math.inf:
+        return None
+    return cache.nodes[candidates[min_index]]
+
+
+class Move(collections.namedtuple('Move', ('operator', 'routes',
+                                           'positions'))):
+    """Descriptor of a change turning a solution in one of its neighbors.
+
+       operator is a key of operators, routes are the indices of the
+       changed routes and positions the indices of the paths (in those
+       routes) whose last nodes are moved, or the bounds of the moved
+       ranges of paths.
+    """
 
-def two_opt_neighbors(sol):
-    """Generator which produces a series of solutions close to the given one.
+    __slots__ = ()
+
+
+def _two_opt(route, i, j):
+    route.swap(route._paths[i].last_node(), route._paths[j].last_node())
+
+
+def _three_opt(route, i, j, k):
+    node_i, node_j, node_k = (route._paths[p].last_node() for p in (i, j, k))
+    route.swap(node_i, node_j)
+    route.swap(node_i, node_k)
+
+
+def _move(route, i, j):
+    node_i = route._paths[i].last_node()
+    route.remove(node_i)  # a remove shifts indexes left by one
+    route.insert(node_i, j - 1)
+
+
+def _swap(route_a, route_b, i, j):
+    node_i = route_a._paths[i].last_node()
+    node_j = route_b._paths[j].last_node()
+    route_a.replace(i, i + 1, [node_j])
+    route_b.replace(j, j + 1, [node_i])
+
+
+def _cross(route_a, route_b, i, j, k, l):
+    nodes_a = [path.last_node() for path in route_a._paths[i:j]]
+    nodes_b = [path.last_node() for path in route_b._paths[k:l]]
+    route_a.replace(i, j, nodes_b)
+    route_b.replace(k, l, nodes_a)
+
+
+operators = {'2-opt': _two_opt,
+             '3-opt': _three_opt,
+             'cross': _cross,
+             'move': _move,
+             'swap': _swap}
+"""Functions applying a Move to its routes (followed by its positions).
+
+   Routes can be Route or RouteDraft instances.
+   Raises solution.UnfeasibleRouteException
+"""
+
+
+def _removal(route, i):
+    """Return ranges of paths of route left removing its node i.
+
+       None is returned if the remove would not be estimated correctly.
+    """
+    nodes = route._paths
+    prev = nodes[i - 1].last_node() if i else route._graph_cache.graph.depot
+    if i + 1 < len(nodes) and prev == nodes[i + 1].last_node():
+        return None  # the next node would be skipped
+    return [range(i), range(i + 1, len(nodes))]
+
+
+def _two_opt_pieces(route, i, j):
+    return [[range(i), route._paths[j].last_node(), range(i + 1, j),
+             route._paths[i].last_node(), range(j + 1, len(route._paths))]]
+
+
+def _move_pieces(route, i, j):
+    if _removal(route, i) is None:
+        return None
+    return [[range(i), range(i + 1, j), route._paths[i].last_node(),
+             range(j, len(route._paths))]]
+
+
+def _swap_pieces(route_a, route_b, i, j):
+    node_i = route_a._paths[i].last_node()
+    node_j = route_b._paths[j].last_node()
+    if (node_j in route_a.positions() or node_i in route_b.positions()
+            or _removal(route_a, i) is None or _removal(route_b, j) is None):
+        return None
+    return [[range(i), node_j, range(i + 1, len(route_a._paths))],
+            [range(j), node_i, range(j + 1, len(route_b._paths))]]
+
+
+def _cross_pieces(route_a, route_b, i, j, k, l):
+    return [[range(i), solution.Stretch(route_b, range(k, l)),
+             range(j, len(route_a._paths))],
+            [range(k), solution.Stretch(route_a, range(i, j)),
+             range(l, len(route_b._paths))]]
+
+
+pieces = {'2-opt': _two_opt_pieces,
+          'cross': _cross_pieces,
+          'move': _move_pieces,
+          'swap': _swap_pieces}
+"""Functions returning, for each route of a Move, the pieces of the
+   changed route (see solution.Route.estimate()).
+
+   They expect routes without repeated nodes; None is returned if the
+   move could not be estimated correctly.
+"""
+
+
+def estimate_move(sol, move):
+    """Return estimated (time, energy) of the neighbor of sol made by move.
+
+       Routes are not changed and their unchanged paths are summed up by
+       segments (see solution.Route.estimate()), so swaps cost constant
+       time and the other moves the length of the reversed or shifted
+       paths; moves which cannot be estimated are scored (see
+       score_move()).
+       None is returned if the neighbor is not feasible.
+    """
+    routes = [sol.routes[index] for index in move.routes]
+    changes = None
+    if move.operator in pieces and all(len(route.positions())
+                                       == len(route._paths)
+                                       for route in routes):
+        changes = pieces[move.operator](*routes, *move.positions)
+    try:
+        costs = [route.estimate(changed)
+                 for route, changed in zip(routes, changes)] \
+            if changes is not None else None
+    except ValueError:
+        costs = None
+    if costs is None:
+        return score_move(sol, move)
+    if None in costs:
+        return None
+    costs = dict(zip(move.routes, costs))
+    return (max([costs[index][0] if index in costs else route.time
+                 for index, route in enumerate(sol.routes)]),
+            math.fsum([costs[index][1] if index in costs else route.energy
+                       for index, route in enumerate(sol.routes)]))
+
+
+def score_move(sol, move):
+    """Return (time, energy) of the neighbor of sol made by move.
+
+       The move is tried on drafts of the routes (see
+       solution.RouteDraft), so sol is not changed and no path is built;
+       None is returned if the neighbor is not feasible.
+    """
+    drafts = {index: sol.routes[index].draft() for index in move.routes}
+    try:
+        operators[move.operator](*[drafts[index] for index in move.routes],
+                                 *move.positions)
+    except solution.UnfeasibleRouteException as e:
+        IO.Log.debug(f'{move} is not feasible ({str(e)})')
+        return None
+    routes = [drafts.get(index, route) for index, route
+              in enumerate(sol.routes)]
+    # same operations of Solution.time and Solution.energy
+    return (max([route.time for route in routes]),
+            math.fsum([route.energy for route in routes]))
+
+
+def apply_move(sol, move):
+    """Return a copy of sol changed by move.
+
+       Raises solution.UnfeasibleRouteException
+    """
+    ret = copy.deepcopy(sol)
+    operators[move.operator](*[ret.routes[index] for index in move.routes],
+                             *move.positions)
+    return ret
+
+
+def two_opt_moves(sol):
+    """Generator which produces the moves towards solutions close to sol.
 
        (close in neighborhood sense)
 
@@ -161,30 +348,14 @@ def two_opt_neighbors(sol):
               <~ D   B - ...                <~ D - B - ...
               (A, B, ... C, D)              (A, C, ..., B, D)
     """
-    mod_sol = copy.deepcopy(sol)
-    for route in mod_sol.routes:
+    for r, route in enumerate(sol.routes):
         for i in utility.shuffled_range(len(route._paths) - 1):
-            if i >= len(route._paths):  # should never happen
-                continue
-            node_i = route._paths[i].last_node()        # node C of the example
             for j in utility.shuffled_range(i + 1, len(route._paths)):
-                if j >= len(route._paths):  # should never happen
-                    continue
-                node_j = route._paths[j].last_node()    # node B of the example
-                try:
-                    route.swap(node_i, node_j)
-                except solution.UnfeasibleRouteException as e:
-                    IO.Log.debug(f'two_opt_neighbors() generator got '
-                                 f'UnfeasibleRouteException: {str(e)}')
-                    continue
-                else:
-                    yield mod_sol
-                finally:
-                    mod_sol = copy.deepcopy(sol)
+                yield Move('2-opt', (r,), (i, j))
 
 
-def three_opt_neighbors(sol, _d={}):
-    """Generator which produces a series of solutions close to the given one.
+def three_opt_moves(sol, _d={}):
+    """Generator which produces the moves towards solutions close to sol.
 
        (close in neighborhood sense)
 
@@ -214,101 +385,98 @@ def three_opt_neighbors(sol, _d={}):
         if 'written_once' not in _d:
             IO.Log.debug('To explore 3-opt neighborhood use -3 CLI argument.')
             _d['written_once'] = True
-        return iter(list())
-    mod_sol = copy.deepcopy(sol)
-    for route in mod_sol.routes:
+        return
+    for r, route in enumerate(sol.routes):
         for i in utility.shuffled_range(len(route._paths) - 2):
-            if i >= len(route._paths):  # should never happen
-                continue
-            node_i = route._paths[i].last_node()
             for j in utility.shuffled_range(i + 1, len(route._paths) - 1):
-                if j >= len(route._paths):  # should never happen
-                    continue
-                node_j = route._paths[j].last_node()
                 for k in utility.shuffled_range(j + 1, len(route._paths)):
-                    if k >= len(route._paths):  # should never happen
-                        continue
-                    node_k = route._paths[k].last_node()
-                    route_bkp = copy.deepcopy(route)        # i - j - k
-                    try:
-                        route.swap(node_i, node_j)          # j - i - k
-                        route.swap(node_i, node_k)          # j - k - i
-                    except solution.UnfeasibleRouteException as e:
-                        IO.Log.debug(f'three_opt_neighbors() generator got '
-                                     f'UnfeasibleRouteException: {str(e)}')
-                    else:
-                        yield mod_sol
-                    mod_sol = copy.deepcopy(sol)
-                    route = copy.deepcopy(route_bkp)        # i - j - k
-                    try:
-                        route.swap(node_i, node_k)          # k - j - i
-                        route.swap(node_j, node_i)          # k - i - j
-                    except solution.UnfeasibleRouteException as e:
-                        IO.Log.debug(f'three_opt_neighbors() generator got '
-                                     f'UnfeasibleRouteException: {str(e)}')
-                    else:
-                        yield mod_sol
-                    mod_sol = copy.deepcopy(sol)
+                    yield Move('3-opt', (r,), (i, j, k))  # j - k - i
+                    yield Move('3-opt', (r,), (i, k, j))  # k - i - j
 
 
-def move_neighbors(sol):
-    """Generator which produces a move neighborhood of the given solution."""
-    mod_sol = copy.deepcopy(sol)
-    for route in mod_sol.routes:
+def move_moves(sol):
+    """Generator which produces the moves of a node in its route."""
+    for r, route in enumerate(sol.routes):
         for i in utility.shuffled_range(len(route._paths) - 1):
-            if i >= len(route._paths):  # should never happen
-                continue
-            node_i = route._paths[i].last_node()
             for j in utility.shuffled_range(i + 1, len(route._paths)):
-                try:
-                    route.remove(node_i)  # a remove shifts indexes left by one
-                    route.insert(node_i, j - 1)
-                except solution.UnfeasibleRouteException as e:
-                    IO.Log.debug(f'Move of node {i} ({node_i}) to position '
-                                 f'{j} is not feasible ({str(e)})')
-                    continue
-                else:
-                    yield mod_sol
-                finally:
-                    mod_sol = copy.deepcopy(sol)
+                yield Move('move', (r,), (i, j))
+
+
+def swap_moves(sol):
+    """Generator which produces the swaps of nodes of different routes.
+
+       The depot ending each route is never swapped.
+    """
+    for a in utility.shuffled_range(len(sol.routes) - 1):
+        for b in utility.shuffled_range(a + 1, len(sol.routes)):
+            for i in utility.shuffled_range(len(sol.routes[a]._paths) - 1):
+                for j in utility.shuffled_range(len(sol.routes[b]._paths)
+                                                - 1):
+                    yield Move('swap', (a, b), (i, j))
+
+
+def cross_moves(sol, max_length=3):
+    """Generator which produces the exchanges of segments of two routes.
+
+       Segments have at most max_length nodes and one of them can be
+       empty (so the other one is moved); the depot ending a route is
+       never moved and no route is left empty.
+    """
+    for a in utility.shuffled_range(len(sol.routes) - 1):
+        for b in utility.shuffled_range(a + 1, len(sol.routes)):
+            last_a = len(sol.routes[a]._paths) - 1
+            last_b = len(sol.routes[b]._paths) - 1
+            for i in utility.shuffled_range(last_a + 1):
+                for k in utility.shuffled_range(last_b + 1):
+                    for m in range(min(max_length, last_a - i) + 1):
+                        for n in range(min(max_length, last_b - k) + 1):
+                            if (m or n) and (m, n) != (last_a, 0) \
+                                    and (m, n) != (0, last_b):
+                                yield Move('cross', (a, b),
+                                           (i, i + m, k, k + n))
+
+
+def neighbors(sol, moves):
+    """Generator which produces the feasible neighbors of sol.
+
+       moves is a generator function of the moves to try (like
+       two_opt_moves()); only feasible moves are applied to copies of sol.
+    """
+    for move in moves(sol):
+        if score_move(sol, move) is not None:
+            yield apply_move(sol, move)
+
+
+def two_opt_neighbors(sol):
+    """Generator which produces a 2-opt neighborhood of the given solution."""
+    return neighbors(sol, two_opt_moves)
+
+
+def three_opt_neighbors(sol):
+    """Generator which produces a 3-opt neighborhood of the given solution."""
+    return neighbors(sol, three_opt_moves)
+
+
+def move_neighbors(sol):
+    """Generator which produces a move neighborhood of the given solution."""
+    return neighbors(sol, move_moves)
 
 
 def swap_neighbors(sol):
     """Generator which produces a swap neighborhood of the given solution."""
-    mod_sol = copy.deepcopy(sol)
-    for a in utility.shuffled_range(len(mod_sol.routes) - 1):
-        route_a = mod_sol.routes[a]
-        for b in utility.shuffled_range(a + 1, len(mod_sol.routes)):
-            route_b = mod_sol.routes[b]
-            for i in utility.shuffled_range(len(route_a._paths)):
-                if i >= len(route_a._paths):  # should never happen
-                    continue
-                node_i = route_a._paths[i].last_node()
-                for j in utility.shuffled_range(len(route_b._paths)):
-                    if j >= len(route_b._paths):  # should never happen
-                        continue
-                    node_j = route_b._paths[j].last_node()
-                    try:
-                        route_a.remove(node_i)
-                        route_b.remove(node_j)
-
-                        route_a.insert(node_j, i)
-                        route_a.insert(node_i, j)
-                    except solution.UnfeasibleRouteException as e:
-                        IO.Log.debug(f'Swap between node {i} ({node_i}) of '
-                                     f'route {a} and node {j} ({node_j}) of '
-                                     f'route {b} is not feasible ({str(e)})')
-                        continue
-                    else:
-                        yield mod_sol
-                    finally:
-                        mod_sol = copy.deepcopy(sol)
-
-
-neighborhoods = {'2-opt': two_opt_neighbors,
-                 '3-opt': three_opt_neighbors,
-                 'swap': swap_neighbors,
-                 'move': move_neighbors}
+    return neighbors(sol, swap_moves)
+
+
+def cross_neighbors(sol):
+    """Generator which produces a cross neighborhood of the given solution."""
+    return neighbors(sol, cross_moves)
+
+
+neighborhoods = {'2-opt': two_opt_moves,
+                 '3-opt': three_opt_moves,
+                 'swap': swap_moves,
+                 'move': move_moves,
+                 'cross': cross_moves}
 
 
 def metaheuristic(initial_solution, max_iter=10**3):
@@ -329,10 +497,11 @@ def metaheuristic(initial_solution, max_iter=10**3):
             break
 
         # explore each available neighborhood
-        for k, neighborhood_generator in enumerate(neighborhoods.values()):
-            # explore each solution in the neighborhood
-            sol = shake(actual_solution, k)
-            sol = local_search(sol, neighborhood_generator)
+        for k, neighborhood_moves in enumerate(neighborhoods.values()):
+            # explore each solution in the neighborhood (cross, the last
+            # one, is shaken with 3 swaps like move)
+            sol = shake(actual_solution, min(k, 3))
+            sol = local_search(sol, neighborhood_moves)
             if sol[0] is not None:
                 # local search found a better solution in the neighborhood
                 actual_solution = sol[0]
@@ -351,14 +520,27 @@ def metaheuristic(initial_solution, max_iter=10**3):
 
 
 def local_search(actual_solution, neighborhood):
-    """Look in the neighborhood of actual_solution for better neighbors."""
+    """Look in the neighborhood of actual_solution for better neighbors.
+
+       neighborhood is a generator function of moves (see neighborhoods):
+       they are estimated (see estimate_move()), the improving ones are
+       scored on drafts of the routes and only the first one which is
+       still improving is applied to a copy of actual_solution.
+    """
     num_explored_solutions = 0
-    for neighbor in neighborhood(actual_solution):
+    actual_cost = actual_solution.time, actual_solution.energy
+    for move in neighborhood(actual_solution):
+        cost = estimate_move(actual_solution, move)
+        if cost is None:
+            continue
         num_explored_solutions += 1
-        # return the first improving one
-        if (neighbor.time < actual_solution.time
-            or (neighbor.time == actual_solution.time and
-                neighbor.energy < actual_solution.energy)):
+        # return the first improving one (by time, then by energy)
+        if cost < actual_cost:
+            # estimates may differ in the last digits
+            cost = score_move(actual_solution, move)
+            if cost is None or not cost < actual_cost:
+                continue
+            neighbor = apply_move(actual_solution, move)
             delta_energy = neighbor.energy - actual_solution.energy
             delta_time = neighbor.time - actual_solution.time
             IO.Log.info(f'VNS found a better solution '
@@ -367,7 +549,7 @@ def local_search(actual_solution, neighborhood):
             assert not neighbor.missing_customers(), 'There are some ' \
                                                      'customers left out'
             assert neighbor.is_feasible(), 'neighbor found is not feasible'
-            return copy.deepcopy(neighbor), num_explored_solutions
+            return neighbor, num_explored_solutions
     # Could not find a better solution in actual_solution's neigborhood
     # => actual_solution is a local optimum for that neighborhood
     return None, num_explored_solutions
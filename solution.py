@@ -30,24 +30,128 @@ __license__ = "GPL3"
 
 # ------------------------------ SCRIPT LOADED ------------------------------ #
 
+import collections
 import copy
 import csv
+import heapq
+import itertools
+import math
 import networkx as nx
 
 import IO
+import utility
 
 if __name__ == '__main__':
     raise SystemExit('Please do not load that script, run it!')
 
 
 class Solution(object):
-    """A Solution is a list of Routes."""
+    """A Solution is a list of Routes.
+
+       Its time, energy and missing customers are kept up to date while
+       routes change (see Routes), so reading them again while routes do
+       not change costs constant time.
+    """
 
     def __init__(self, graph, graph_cache):
         self._graph_cache = graph_cache
         self._graph = graph
+        self._customers = frozenset(graph.customers)
+        self._counter = itertools.count()  # breaks ties in _makespan
+        self._tracked = None  # see _update()
         self.routes = list()
 
+    def __deepcopy__(self, memo):
+        """Return copy of solution sharing graph and cache of paths.
+
+           Only routes are copied, since graph and cache are never changed;
+           the aggregates of routes are copied too, to not compute them
+           again.
+        """
+        sol = copy.copy(self)
+        copies = {route: copy.deepcopy(route, memo) for route in self.routes}
+        sol._routes = Routes(sol, [copies[route] for route in self.routes])
+        if self._tracked is None:
+            sol._reset()
+            return sol
+        for route in sol._routes:
+            route._solution = sol
+        sol._tracked = {copies[route]: aggregates
+                        for route, aggregates in self._tracked.items()}
+        sol._dirty = {copies[route] for route in self._dirty}
+        sol._visits = collections.Counter(self._visits)
+        sol._missing = set(self._missing)
+        # keys are the same, so the list is still a heap
+        sol._makespan = [(time, count, copies[route])
+                         for time, count, route in self._makespan]
+        return sol
+
+    @property
+    def routes(self):
+        """Routes of solution (see Routes)."""
+        return self._routes
+
+    @routes.setter
+    def routes(self, routes):
+        self._routes = Routes(self, routes)
+        self._reset()
+
+    def _reset(self):
+        """Compute aggregates of all routes again at the next query."""
+        for route in self._tracked or ():
+            route._solution = None
+        self._tracked, self._dirty = None, set()
+
+    def _add(self, route):
+        """Start following changes of route appended to routes."""
+        # a solution being unpickled or copied has no attributes yet
+        if getattr(self, '_tracked', None) is not None:
+            route._solution = self
+            self._tracked.setdefault(route, (frozenset(), 0))
+            self._dirty.add(route)
+
+    def _update(self):
+        """Apply changes of routes to the aggregates of solution.
+
+           Only the routes changed since the last query are looked at: the
+           energy is summed again (see energy) and the frozenset of missing
+           customers built again only if they changed, and the makespan is
+           a max-heap of route times where an entry is dropped once it is
+           on top and its route has another time.
+        """
+        if self._tracked is None:
+            self._tracked = {route: (frozenset(), 0) for route in self.routes}
+            self._dirty = set(self._tracked)
+            self._visits = collections.Counter()
+            self._missing = set(self._customers)
+            self._missing_frozen = None  # see missing_customers()
+            self._makespan = list()
+            self._energy = None  # see energy
+            for route in self._tracked:
+                route._solution = self
+        elif len(self._makespan) > 2 * len(self._tracked) + 16:
+            # drop the entries of old times
+            self._dirty.update(self._tracked)
+            self._makespan = list()
+        for route in self._dirty:
+            visited = route.visited_customers()
+            old_visited = self._tracked[route][0]
+            for customer in old_visited - visited:
+                self._visits[customer] -= 1
+                if not self._visits[customer] and customer in self._customers:
+                    self._missing.add(customer)
+                    self._missing_frozen = None
+            for customer in visited - old_visited:
+                self._visits[customer] += 1
+                if customer in self._missing:
+                    self._missing.discard(customer)
+                    self._missing_frozen = None
+            self._tracked[route] = visited, route.energy
+            self._energy = None
+            heapq.heappush(self._makespan,
+                           (-route.time, next(self._counter), route))
+        self._dirty.clear()
+
     def is_feasible(self):
         """Return if all routes are feasibile."""
         return bool(all([route.is_feasible() for route in self.routes])
@@ -55,18 +159,36 @@ class Solution(object):
 
     @property
     def energy(self):
-        return sum([route.energy for route in self.routes])
+        """Sum of the energies of routes, computed again only if changed.
+
+           math.fsum() is exact, so it does not depend on the order of
+           routes.
+        """
+        self._update()
+        if self._energy is None:
+            self._energy = math.fsum(energy for __, energy
+                                     in self._tracked.values())
+        return self._energy
 
     @property
     def time(self):
-        return max([route.time for route in self.routes])
+        self._update()
+        while self._makespan and \
+                -self._makespan[0][0] != self._makespan[0][2].time:
+            heapq.heappop(self._makespan)
+        if not self._makespan:
+            raise ValueError('Solution has no routes')
+        return -self._makespan[0][0]
 
     def missing_customers(self):
-        """Return set of missing customers."""
-        customers_left = set(self._graph.customers)
-        for route in self.routes:
-            customers_left.difference_update(route.visited_customers())
-        return customers_left
+        """Return frozenset of missing customers.
+
+           It is cached until a customer is visited or left out.
+        """
+        self._update()
+        if self._missing_frozen is None:
+            self._missing_frozen = frozenset(self._missing)
+        return self._missing_frozen
 
     def create_csv(self, filename):
         """Export solution to csv file."""
@@ -119,6 +241,37 @@ class Solution(object):
                 csv_file.writerow({k: '' for k in header})
 
 
+class Routes(list):
+    """List of the routes of a solution, which follows their changes.
+
+       Appended routes are followed one by one, other changes of the list
+       make the solution compute its aggregates again.
+    """
+
+    def __init__(self, solution, routes=()):
+        super(Routes, self).__init__(routes)
+        self._solution = solution
+
+    def append(self, route):
+        super(Routes, self).append(route)
+        self._solution._add(route)
+
+
+def _resetting(name):
+    """Return list method name which also resets aggregates of solution."""
+    def method(self, *args, **kwargs):
+        ret = getattr(list, name)(self, *args, **kwargs)
+        self._solution._reset()
+        return ret
+    method.__name__ = name
+    return method
+
+
+for name in ('__delitem__', '__iadd__', '__setitem__', 'clear', 'extend',
+             'insert', 'pop', 'remove', 'reverse', 'sort'):
+    setattr(Routes, name, _resetting(name))
+
+
 class Route(object):
     """A Route is a list of Path with the tail-head nodes in common.
 
@@ -140,8 +293,23 @@ class Route(object):
 
         self._graph_cache = graph_cache
         self._paths, self._batteries = list(), list()
+        # prefix sums of the time and energy of paths (see estimate())
+        self._elapsed, self._spent = list(), list()
+        self._positions = None  # see positions()
+        self._segments = None  # see segment()
+        self._solution = None  # see Solution.routes
         self.time_limit = IO.load_problem_file()['time_limit']
 
+    def __deepcopy__(self, memo):
+        """Return copy of route sharing cache of paths and time limit."""
+        route = copy.copy(self)
+        route._paths = [copy.deepcopy(path, memo) for path in self._paths]
+        route._batteries = [copy.deepcopy(batt, memo)
+                            for batt in self._batteries]
+        route._elapsed, route._spent = list(self._elapsed), list(self._spent)
+        route._solution = None  # the copy is not in routes of a solution
+        return route
+
     def append(self, dest_node):
         """Add to route the path to reach dest_node from previous last node.
 
@@ -166,7 +334,8 @@ class Route(object):
 
         path = self.default_path(src_node, dest_node)
 
-        if path.time + sum(p.time for p in self._paths) > self.time_limit:
+        elapsed = self._elapsed[-1] if self._elapsed else 0
+        if path.time + elapsed > self.time_limit:
             raise MaximumTimeException('Time limit exceeded')
 
         batt.charge -= path.energy  # can raise BatteryCriticalException
@@ -174,6 +343,10 @@ class Route(object):
         # it's safe to append path to route because it's feasible
         self._paths.append(path)
         self._batteries.append(batt)
+        self._elapsed.append(elapsed + path.time)
+        self._spent.append((self._spent[-1] if self._spent else 0)
+                           + path.energy)
+        self._changed()
 
         # if a station is reached recharge the battery
         if dest_node[2] == 'station':
@@ -200,22 +373,20 @@ class Route(object):
             self.append(node)
             return
 
-        # backup paths and batteries
-        path_bkp, batt_bkp = copy.copy(self._paths), copy.copy(self._batteries)
+        backup = self._backup()
 
         if node in [path.last_node() for path in self._paths]:
             self.remove(node)
 
         nodes_to_append = [node] + [p.last_node() for p in self._paths[pos:]]
 
-        # cut paths and batteries
-        self._paths, self._batteries = self._paths[:pos], self._batteries[:pos]
+        self._cut(pos)
 
         try:
             for n in nodes_to_append:
                 self.append(n)
         except UnfeasibleRouteException as e:
-            self._paths, self._batteries = path_bkp, batt_bkp
+            self._restore(backup)
             raise e
 
     def remove(self, rm_node):
@@ -244,15 +415,14 @@ class Route(object):
 
         nodes_to_append = [p.last_node() for p in self._paths[idx + 1:]]
 
-        # backup and cut paths and batteries
-        path_bkp, batt_bkp = copy.copy(self._paths), copy.copy(self._batteries)
-        self._paths, self._batteries = self._paths[:idx], self._batteries[:idx]
+        backup = self._backup()
+        self._cut(idx)
 
         try:
             for node in nodes_to_append:
                 self.append(node)
         except UnfeasibleRouteException as e:
-            self._paths, self._batteries = path_bkp, batt_bkp
+            self._restore(backup)
             raise e
 
     def substitute(self, old_node, new_node):
@@ -284,16 +454,15 @@ class Route(object):
             raise ValueError('Could not substitute node with another one '
                              'already in route')
 
-        # backup and cut paths and batteries
-        path_bkp, batt_bkp = copy.copy(self._paths), copy.copy(self._batteries)
-        self._paths, self._batteries = self._paths[:idx], self._batteries[:idx]
+        backup = self._backup()
+        self._cut(idx)
 
         try:
             self.append(new_node)
             for node in nodes_to_append:
                 self.append(node)
         except UnfeasibleRouteException as e:
-            self._paths, self._batteries = path_bkp, batt_bkp
+            self._restore(backup)
             raise e
 
     def swap(self, node1, node2):
@@ -330,24 +499,70 @@ class Route(object):
         nodes_to_append += [node1]
         nodes_to_append += [p.last_node() for p in self._paths[id2 + 1:]]
 
-        # backup and cut paths and batteries
-        path_bkp, batt_bkp = copy.copy(self._paths), copy.copy(self._batteries)
-        self._paths, self._batteries = self._paths[:id1], self._batteries[:id1]
+        backup = self._backup()
+        self._cut(id1)
 
         try:
             for n in nodes_to_append:
                 self.append(n)
         except UnfeasibleRouteException as e:
-            self._paths, self._batteries = path_bkp, batt_bkp
+            self._restore(backup)
+            raise e
+
+    def replace(self, start, stop, nodes):
+        """Replace the paths from start to stop (excluded) with paths to nodes.
+
+           nodes is a list of tuples of three elements (lat, lon, type)
+
+           Example:
+           route = [ Path_A_B, Path_B_C, Path_C_D, Path_D_E ]
+           route.replace(1, 3, [(lat_X, lon_X, type_X)])
+           route = [ Path_A_B, Path_B_X, Path_X_E ]
+
+           Raises:
+           - UnfeasibleRouteException (without modifing current route)
+           - ValueError if nor greenest or shortest flags is set
+        """
+        nodes_to_append = list(nodes)
+        nodes_to_append += [p.last_node() for p in self._paths[stop:]]
+
+        backup = self._backup()
+        self._cut(start)
+
+        try:
+            for node in nodes_to_append:
+                self.append(node)
+        except UnfeasibleRouteException as e:
+            self._restore(backup)
             raise e
 
+    def _backup(self):
+        """Return lists of the route, to be given to _restore()."""
+        return self._paths, self._batteries, self._elapsed, self._spent
+
+    def _restore(self, backup):
+        self._paths, self._batteries, self._elapsed, self._spent = backup
+        self._changed()
+
+    def _changed(self):
+        """Drop caches of route and tell its solution (see Solution)."""
+        self._positions, self._segments = None, None
+        if self._solution is not None:
+            self._solution._dirty.add(self)
+
+    def _cut(self, pos):
+        """Keep only the first pos paths (in new lists, see _backup())."""
+        self._paths, self._batteries = self._paths[:pos], self._batteries[:pos]
+        self._elapsed, self._spent = self._elapsed[:pos], self._spent[:pos]
+        self._changed()
+
     @property
     def energy(self):
-        return sum([path.energy for path in self._paths])
+        return self._spent[-1] if self._spent else 0
 
     @property
     def time(self):
-        return sum([path.time for path in self._paths])
+        return self._elapsed[-1] if self._elapsed else 0
 
     def is_empty(self):
         """Return if path and batteries list are empty.
@@ -416,8 +631,7 @@ class Route(object):
 
     def visited_customers(self):
         """Return set of visited customers (lat, lon, 'customer')."""
-        return {path.last_node() for path in self._paths
-                if path.last_node()[2] == 'customer'}
+        return {node for node in self.positions() if node[2] == 'customer'}
 
     def last_battery(self):
         """Return battery status at last reached node.
@@ -435,6 +649,113 @@ class Route(object):
         if not self.is_empty():
             return self._paths[-1].last_node()
 
+    def positions(self):
+        """Return dictionary {node: index of the first path reaching it}.
+
+           It is cached until the route changes.
+        """
+        if self._positions is None:
+            self._positions = dict()
+            for index, path in enumerate(self._paths):
+                self._positions.setdefault(path.last_node(), index)
+        return self._positions
+
+    def segment(self, start, stop):
+        """Return Segment summing up the paths from start to stop (excluded).
+
+           Segments of the first and of the last paths are cached until
+           the route changes, so their cost is constant; the others are
+           concatenated from O(log n) cached segments of 2 ** k paths (a
+           sparse table, whose rows are built when first needed).
+        """
+        if self._segments is None:
+            model = BatteryModel.load()
+            legs = [Segment.leg(path.energy, path.time, path.last_node(),
+                                model)
+                    for path in self._paths]
+            forward, backward = [Segment.empty], [Segment.empty]
+            for leg in legs:
+                forward.append(forward[-1] + leg)
+            for leg in reversed(legs):
+                backward.append(leg + backward[-1])
+            backward.reverse()
+            self._segments = legs, forward, backward, [legs]
+        legs, forward, backward, table = self._segments
+        if start >= stop:
+            return Segment.empty
+        elif start == 0:
+            return forward[stop]
+        elif stop >= len(legs):
+            return backward[start]
+        ret = Segment.empty
+        while start < stop:
+            # table[k][i] is the segment of the 2 ** k paths from i
+            k = (stop - start).bit_length() - 1
+            while len(table) <= k:
+                half, row = 2 ** (len(table) - 1), table[-1]
+                table.append([row[i] + row[i + half]
+                              for i in range(len(row) - half)])
+            ret += table[k][start]
+            start += 2 ** k
+        return ret
+
+    def estimate(self, pieces):
+        """Return estimated (time, energy) of the route made of pieces.
+
+           pieces is a list of nodes (lat, lon, type), of ranges of indices
+           of paths of this route and of Stretch of other routes, standing
+           for the nodes reached by those paths; the paths of a range are
+           summed up with segment(), only the first one is searched in cache
+           if the range does not follow its previous node, so the cost is
+           constant for ranges at the beginning or at the end of a route.
+
+           None is returned if the route would not be feasible; the
+           estimate may differ from the cost of the built route in the
+           last digits.
+           Raises ValueError if a node is reached twice in a row (append()
+           would skip it and the route would be a different one)
+        """
+        model = BatteryModel.load()
+        node = depot = self._graph_cache.graph.depot
+        total = Segment.empty
+        for piece in pieces:
+            if isinstance(piece, range):
+                piece = Stretch(self, piece)
+            if isinstance(piece, Stretch):
+                route, steps = piece
+                if not steps:
+                    continue
+                start, stop = steps.start, steps.stop
+                prev = route._paths[start - 1].last_node() if start else depot
+                if node != prev:
+                    dest = route._paths[start].last_node()
+                    start += 1
+                else:
+                    dest = None
+            else:
+                route, start, stop, dest = None, 0, 0, piece
+            if dest is not None:
+                if dest == node:
+                    raise ValueError(f'Node {dest} reached twice in a row')
+                values = self._graph_cache.path_values(node, dest,
+                                                       self.greenest)
+                if values is None:
+                    return None
+                total += Segment.leg(values['energy'], values['time'], dest,
+                                     model)
+                node = dest
+            if start < stop:
+                total += route.segment(start, stop)
+                node = route._paths[stop - 1].last_node()
+        if total.charge(model.total_energy) is None \
+                or total.time > self.time_limit:
+            return None
+        return total.time, total.energy
+
+    def draft(self):
+        """Return RouteDraft of route, to try moves without changing it."""
+        return RouteDraft(self)
+
     def default_path(self, src_node, dest_node):
         """Return greenest or shortest path between src and dest.
 
@@ -455,6 +776,112 @@ class Route(object):
             raise UnfeasibleRouteException(str(e))
 
 
+class RouteDraft(Route):
+    """A Route whose paths keep only their last node, energy and time.
+
+       Moves (insert(), remove(), replace(), swap() and substitute()) are
+       the same of Route, but paths are never built, so the cost and
+       feasibility of a move can be known cheaply before applying it to
+       the real route.
+    """
+
+    def __init__(self, route):
+        """Copy route paths as legs; batteries are shared, not changed."""
+        self.greenest, self.shortest = route.greenest, route.shortest
+        self._graph_cache = route._graph_cache
+        self.time_limit = route.time_limit
+        self._paths = [Leg(path.last_node(), path.energy, path.time)
+                       for path in route._paths]
+        self._batteries = list(route._batteries)
+        self._elapsed, self._spent = list(route._elapsed), list(route._spent)
+        self._positions, self._segments = None, None
+        self._solution = None
+
+    def default_path(self, src_node, dest_node):
+        """Return Leg of greenest or shortest path between src and dest.
+
+           Raises UnfeasibleRouteException if there is no path
+        """
+        values = self._graph_cache.path_values(src_node, dest_node,
+                                               self.greenest)
+        if values is None:
+            raise UnfeasibleRouteException(f'No path found between {src_node}'
+                                           f' and {dest_node}')
+        return Leg(dest_node, values['energy'], values['time'])
+
+
+class Leg(collections.namedtuple('Leg', ('node', 'energy', 'time'))):
+    """Last node, energy and time of a path (see RouteDraft)."""
+
+    __slots__ = ()
+
+    def last_node(self):
+        return self.node
+
+
+class Stretch(collections.namedtuple('Stretch', ('route', 'steps'))):
+    """Range of indices (steps) of paths of a route (see Route.estimate())."""
+
+    __slots__ = ()
+
+
+class Segment(collections.namedtuple('Segment', ('time', 'energy',
+                                                 'recharges', 'needed',
+                                                 'shift', 'low', 'high'))):
+    """Summary of consecutive paths of a route.
+
+       time and energy are summed over the paths and recharges is the
+       number of stations reached; a battery entering the paths with
+       charge c goes through them if c > needed (its minimum margin) and
+       leaves them with charge min(high, max(low, c + shift)).
+
+       Segments are concatenated with + in constant time, in the order
+       the paths are traveled.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def leg(cls, energy, time, node, model):
+        """Return Segment of a path reaching node (see Battery.charge).
+
+           model is the BatteryModel of the route batteries.
+        """
+        total, low = model.total_energy, -math.inf
+        if node[2] == 'station':
+            # see Battery.recharge()
+            low = min(total, total * 0.8)
+        return cls(time, energy, int(node[2] == 'station'),
+                   model.critical * total + energy, -energy,
+                   low, total)
+
+    def __add__(self, other):
+        """Return Segment of the paths of self followed by those of other."""
+        if self.low > other.needed:
+            needed = self.needed
+        elif self.high <= other.needed:
+            needed = math.inf
+        else:
+            needed = max(self.needed, other.needed - self.shift)
+        return Segment(self.time + other.time, self.energy + other.energy,
+                       self.recharges + other.recharges, needed,
+                       self.shift + other.shift,
+                       min(other.high, max(other.low,
+                                           self.low + other.shift)),
+                       min(other.high, max(other.low,
+                                           self.high + other.shift)))
+
+    def charge(self, charge):
+        """Return charge left by the paths, None if battery gets critical."""
+        if charge <= self.needed:
+            return None
+        return min(self.high, max(self.low, charge + self.shift))
+
+
+Segment.empty = Segment(0, 0, 0, -math.inf, 0, -math.inf, math.inf)
+"""Segment of no path."""
+
+
 class Path(object):
     """A path is a sequence of nodes visited in a given order.
 
@@ -464,6 +891,8 @@ class Path(object):
     def __init__(self, graph, coor_list=None):
         """Initialize a path from a list of coordinates (lat, lon)."""
         self._graph = graph
+        self._loader = None   # see lazy()
+        self._ends = None     # first and last nodes of a lazy path
         self._nodes = list()  # each item will be a tuple: ( lat, long, type )
         self._saved = dict()  # empty cache for energy, length and time values
 
@@ -471,6 +900,38 @@ class Path(object):
             for lat, lon, *__ in coor_list:
                 self.append(lat, lon)
 
+    def __deepcopy__(self, memo):
+        """Return copy of path sharing graph (and loader of lazy paths)."""
+        path = copy.copy(self)
+        path._node_list = list(self._node_list)
+        path._saved = dict(self._saved)
+        return path
+
+    @classmethod
+    def lazy(cls, graph, loader, first_node, last_node, saved):
+        """Return a path whose list of nodes is built only when needed.
+
+           loader is a function returning the list of coordinates (lat, lon)
+           while saved is a dictionary with its energy, length and time.
+        """
+        path = cls(graph)
+        path._loader, path._ends = loader, (first_node, last_node)
+        path._saved = dict(saved)
+        return path
+
+    @property
+    def _nodes(self):
+        """List of tuples (latitude, longitude, type)."""
+        if self._loader is not None:
+            loader, self._loader, self._ends = self._loader, None, None
+            self._node_list = [(lat, lon, self._graph.node[(lat, lon)]['type'])
+                               for lat, lon, *__ in loader()]
+        return self._node_list
+
+    @_nodes.setter
+    def _nodes(self, node_list):
+        self._node_list = node_list
+
     def __iter__(self):
         """Return iterator over tuple (latitude, longitude, type)."""
         return iter(self._nodes)
@@ -537,38 +998,76 @@ class Path(object):
 
     def first_node(self):
         """Raises IndexError if path is empty."""
+        if self._ends is not None:
+            return self._ends[0]
         if not self._nodes:
             raise IndexError('Could not get first node from empty path')
         return self._nodes[0]
 
     def last_node(self):
         """Raises IndexError if path is empty."""
+        if self._ends is not None:
+            return self._ends[1]
         if not self._nodes:
             raise IndexError('Could not get last node from empty path')
         return self._nodes[-1]
 
 
+class BatteryModel(collections.namedtuple('BatteryModel',
+                                           ('total_energy', 'critical',
+                                            'charge_rate'))):
+    """Battery of the car of the problem, shared by all Battery instances.
+
+       total_energy is in Joule, critical a percentage of it and
+       charge_rate in Joule / minute.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def load(cls, _cache={}):
+        """Return model of the car battery in problem file (built once).
+
+           Raises ValueError on malformed ccs_charge percentage in problem.
+        """
+        problem_file = utility.CLI.args().problem_file
+        if problem_file not in _cache:
+            car = IO.load_problem_file()['car'][1]
+            total_energy = car['battery']  # kW·h
+            total_energy *= 3.6 * 10 ** 6  # Joule
+
+            energy = car['ccs_charge']['percentage']
+            if energy > 1 and energy <= 100:
+                # normalize energy variable
+                energy /= 100
+
+            elif not (energy > 0 and energy <= 1):
+                raise ValueError('Bad percentage in car ccs_charge')
+            energy *= total_energy  # car['ccs_charge']['%'] in Joule
+
+            time = car['ccs_charge']['time'] * 60  # from hours to minutes
+            _cache[problem_file] = cls(total_energy, 0.20, energy / time)
+        return _cache[problem_file]
+
+
 class Battery(object):
+    """Charge of a battery, whose parameters are in its BatteryModel."""
 
-    def __init__(self):
-        """Raises ValueError on malformed ccs_charge percentage in problem."""
-        car = IO.load_problem_file()['car'][1]
-        self._total_energy = car['battery']  # kW·h
-        self._total_energy *= 3.6 * 10 ** 6  # Joule
-        self._charge = self._total_energy    # Joule
-        self._critical = 0.20  # percentage
+    __slots__ = ('_charge', 'model')
 
-        energy = car['ccs_charge']['percentage']
-        if energy > 1 and energy <= 100:
-            # normalize energy variable
-            energy /= 100
+    def __init__(self, model=None):
+        """Raises ValueError on malformed ccs_charge percentage in problem."""
+        self.model = BatteryModel.load() if model is None else model
+        self._charge = self.model.total_energy  # Joule
 
-        elif not (energy > 0 and energy <= 1):
-            raise ValueError('Bad percentage in car ccs_charge')
-        energy *= self._total_energy  # car['ccs_charge']['%'] in Joule
+    def __copy__(self):
+        batt = Battery.__new__(Battery)
+        batt.model, batt._charge = self.model, self._charge
+        return batt
 
-        time = car['ccs_charge']['time'] * 60  # from hours to minutes
-        self._charge_rate = energy / time  # Joule / minute
+    def __deepcopy__(self, memo):
+        """Return copy of battery sharing its model."""
+        return self.__copy__()
 
     @property
     def charge(self):
@@ -578,32 +1077,33 @@ class Battery(object):
     @charge.setter
     def charge(self, new_energy):
         """Raises BatteryCriticalException if under threshold."""
-        if new_energy <= self._critical * self._total_energy:
+        if new_energy <= self.model.critical * self.model.total_energy:
             raise BatteryCriticalException('Battery critical')
-        self._charge = min(self._total_energy, new_energy)
+        self._charge = min(self.model.total_energy, new_energy)
 
     def recharge_until(self, asked_energy):
         """Return time (min) to charge battery until asked energy is available.
 
            Raises InsufficientBatteryException.
         """
+        model = self.model
         if asked_energy <= 0:
             return 0
-        elif asked_energy > (1 - self._critical) * self._total_energy + 1e4:
+        elif asked_energy > (1 - model.critical) * model.total_energy + 1e4:
             raise InsufficientBatteryException('Battery capacity is not '
                                                'enough to satisfy requested '
                                                'amount of energy')
         self.charge += asked_energy
-        return asked_energy / self._charge_rate
+        return asked_energy / self.model.charge_rate
 
     def recharge(self, percentage=0.8):
         """Return time (min) to charge until % of total energy is available.
 
            Raises InsufficientBatteryException, ValueError.
         """
-        if percentage <= self._critical or percentage > 1 + 1e-6:
+        if percentage <= self.model.critical or percentage > 1 + 1e-6:
             raise ValueError(f'Out of bound percentage level ({percentage})')
-        asked_energy = self._total_energy * percentage - self._charge
+        asked_energy = self.model.total_energy * percentage - self._charge
         return self.recharge_until(asked_energy)
 
     def time_elapsed(self, energy_1, energy_2):
@@ -614,13 +1114,13 @@ class Battery(object):
            Note: internal state of battery is not changed.
         """
         for e in (energy_1, energy_2):
-            if e <= 1e-6 or e >= self._total_energy + 1e-6:
+            if e <= 1e-6 or e >= self.model.total_energy + 1e-6:
                 raise ValueError('Energy argument out of battery bounds')
 
         if energy_1 >= energy_2:
             return 0.0
         else:
-            return (energy_2 - energy_1) / self._charge_rate
+            return (energy_2 - energy_1) / self.model.charge_rate
 
 
 class UnfeasibleRouteException(Exception):
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+""" E-VRP is a project about the routing of a fleet of electrical vehicles.
+
+    E-VRP is a project developed for the Application of Operational Research
+    exam at University of Modena and Reggio Emilia.
+
+    Copyright (C) 2017  Serena Ziviani, Federico Motta
+
+    This file is part of E-VRP.
+
+    E-VRP is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    E-VRP is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with E-VRP.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__authors__ = "Serena Ziviani, Federico Motta"
+__copyright__ = "E-VRP  Copyright (C)  2017"
+__license__ = "GPL3"
+
+import math
+import numpy as np
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from context import IO
+from context import graph
+import test_graph
+
+
+class test_binary_workspace_class(unittest.TestCase):
+
+    def setUp(self):
+        abstract_test = test_graph.test_abstract_graph_class(
+            'test_edge_attributes')
+        self.osm_g = abstract_test.osm_graph(lambda rand: rand.uniform(-50,
+                                                                       50))
+        for src, dest, data in self.osm_g.edges_iter(data=True):
+            data['fclass'] = 'residential'
+            data['Wkb'] = b'geometry'
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.ws = self.temp_dir.name
+        # binary files are newer than the shapefiles
+        for name in ('nodes.shp', 'edges.shp'):
+            open(os.path.join(self.ws, name), 'wb').close()
+        self.nodes = np.zeros(2, dtype=[('lon', float), ('lat', float)])
+        self.edges = np.zeros(1, dtype=[('src', np.int64),
+                                        ('dest', np.int64)])
+        self.edges['dest'] = 1
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        self.osm_g = None
+
+    def test_write_and_read(self):
+        IO.write_binary_workspace(self.osm_g, self.ws)
+        self.assertEqual(sorted(os.listdir(self.ws)),
+                         ['edges.npy', 'edges.shp', 'nodes.npy', 'nodes.shp'])
+        read = IO.read_binary_workspace(self.ws)
+        self.assertEqual(read.nodes(data=True), self.osm_g.nodes(data=True))
+        # geometries are dropped, maxspeed is only in some edges
+        self.assertEqual(read.edges(data=True),
+                         [(src, dest, {tag: value
+                                       for tag, value in data.items()
+                                       if tag != 'Wkb'})
+                          for src, dest, data
+                          in self.osm_g.edges(data=True)])
+        for src, dest, data in read.edges_iter(data=True):
+            self.assertIs(type(data['osm_id']), int)
+            self.assertIs(type(data['oneway']), bool)
+            self.assertIs(type(data['fclass']), str)
+
+    def test_outdated_binary_form(self):
+        self.assertIsNone(IO.read_binary_workspace(self.ws))
+        IO.write_binary_workspace(self.osm_g, self.ws)
+        nodes_shp = os.path.join(self.ws, 'nodes.shp')
+        later = os.path.getmtime(nodes_shp) + 10
+        os.utime(nodes_shp, (later, later))
+        self.assertIsNone(IO.read_binary_workspace(self.ws))
+
+    def test_graph_from_binary_form(self):
+        IO.write_binary_workspace(self.osm_g, self.ws)
+        osm_g = graph.Graph(osm_shapefile=self.ws)
+        self.assertEqual(osm_g.name, graph.Graph._osm_name)
+        self.assertEqual(osm_g.nodes(), self.osm_g.nodes())
+        abstract_g = graph.Graph(from_DiGraph=osm_g)
+        expected = graph.Graph(from_DiGraph=self.osm_g)
+        self.assertEqual(abstract_g.edges(data=True),
+                         expected.edges(data=True))
+
+    def test_altitude_checked_while_reading(self):
+        node = self.osm_g.nodes()[0]
+        del self.osm_g.node[node]['ASTGTM2_de']
+        IO.write_binary_workspace(self.osm_g, self.ws)
+        self.assertRaises(NameError, graph.Graph,
+                          osm_shapefile=self.ws)
+
+        for data in self.osm_g.node.values():
+            data['ASTGTM2_de'] = 'high'
+        IO.write_binary_workspace(self.osm_g, self.ws)
+        self.assertRaises(TypeError, graph.Graph,
+                          osm_shapefile=self.ws)
+
+    def test_interrupted_write_leaves_no_files(self):
+        with unittest.mock.patch.object(IO.np, 'save',
+                                        side_effect=KeyboardInterrupt):
+            self.assertRaises(KeyboardInterrupt, IO._write_binary_tables,
+                              self.ws, self.nodes, self.edges)
+        self.assertEqual(sorted(os.listdir(self.ws)),
+                         ['edges.shp', 'nodes.shp'])
+
+        IO._write_binary_tables(self.ws, self.nodes, self.edges)
+        self.assertEqual(sorted(os.listdir(self.ws)),
+                         ['edges.npy', 'edges.shp', 'nodes.npy', 'nodes.shp'])
+        np.testing.assert_array_equal(
+            np.load(os.path.join(self.ws, 'edges.npy')), self.edges)
+
+    def test_check_workspace_ignores_temporary_files(self):
+        args = IO.utility.CLI.args()
+        with unittest.mock.patch.object(args, 'workspace', self.ws):
+            open(os.path.join(self.ws, '.nodes.npy.x1y2.tmp'), 'wb').close()
+            IO.check_workspace()
+            open(os.path.join(self.ws, 'notes.txt'), 'wb').close()
+            self.assertRaises(FileExistsError, IO.check_workspace)
+
+    def test_workspace_fingerprint(self):
+        args = IO.utility.CLI.args()
+        with unittest.mock.patch.object(args, 'workspace', self.ws):
+            # files are not read
+            with unittest.mock.patch('builtins.open',
+                                     side_effect=AssertionError):
+                fingerprint = IO._workspace_fingerprint(1).hexdigest()
+            # binary files do not change it, shapefiles do
+            IO._write_binary_tables(self.ws, self.nodes, self.edges)
+            self.assertEqual(IO._workspace_fingerprint(1).hexdigest(),
+                             fingerprint)
+            os.utime(os.path.join(self.ws, 'nodes.shp'), ns=(0, 0))
+            self.assertNotEqual(IO._workspace_fingerprint(1).hexdigest(),
+                                fingerprint)
+
+
+class test_elevation_raster_class(unittest.TestCase):
+
+    # cells of 0.5 degrees, centers from lon 10.25 and lat 45.75
+    grid = ('ncols 3\n'
+            'nrows 2\n'
+            'xllcorner 10\n'
+            'yllcorner 45\n'
+            'cellsize 0.5\n'
+            'NODATA_value -9999\n'
+            '10 20 -9999\n'
+            '30 40 50\n')
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.directory.name, 'dem.asc')
+        with open(self.file_name, 'w') as f:
+            f.write(test_elevation_raster_class.grid)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_cell_centers(self):
+        raster = IO.ElevationRaster(self.file_name)
+        self.assertEqual(raster.altitudes([10.25, 10.75, 10.25, 10.75],
+                                          [45.75, 45.75, 45.25, 45.25])
+                         .tolist(), [10, 20, 30, 40])
+
+    def test_bilinear_interpolation(self):
+        raster = IO.ElevationRaster(self.file_name)
+        altitudes = raster.altitudes([10.5, 10.5, 10.375, 10.1],
+                                     [45.5, 45.75, 45.375, 45.25])
+        self.assertEqual(altitudes.tolist(), [25, 15, 27.5, 30])
+
+    def test_cell_center_origin(self):
+        with open(self.file_name, 'w') as f:
+            f.write(test_elevation_raster_class.grid
+                    .replace('xllcorner 10', 'xllcenter 10.25')
+                    .replace('yllcorner 45', 'yllcenter 45.25'))
+        raster = IO.ElevationRaster(self.file_name)
+        self.assertEqual(raster.altitudes([10.5], [45.5]).tolist(), [25])
+
+    def test_points_without_altitude(self):
+        raster = IO.ElevationRaster(self.file_name)
+        altitudes = raster.altitudes([9.9, 10.5, 11.25, 11.2, 11.4],
+                                     [45.5, 46.1, 45.25, 45.6, 45.75])
+        self.assertEqual([math.isnan(a) for a in altitudes],
+                         [True, True, False, True, True])
+        self.assertEqual(altitudes[2], 50)
+
+    def test_missing_file(self):
+        self.assertRaises(FileNotFoundError, IO.ElevationRaster,
+                          os.path.join(self.directory.name, 'missing.asc'))
+
+    def test_blank_header_lines(self):
+        with open(self.file_name, 'w') as f:
+            f.write(test_elevation_raster_class.grid
+                    .replace('cellsize 0.5\n', '\ncellsize 0.5  \n\n'))
+        raster = IO.ElevationRaster(self.file_name)
+        self.assertEqual(raster.altitudes([10.25, 10.75], [45.25, 45.25])
+                         .tolist(), [30, 40])
+
+    def test_nan_nodata(self):
+        with open(self.file_name, 'w') as f:
+            f.write(test_elevation_raster_class.grid
+                    .replace('-9999', 'nan'))
+        raster = IO.ElevationRaster(self.file_name)
+        # the cell without data next to the last one does not weigh
+        altitudes = raster.altitudes([11.25, 11.25, 11], [45.25, 45.75, 45.5])
+        self.assertEqual(altitudes[0], 50)
+        self.assertTrue(math.isnan(altitudes[1]))
+        self.assertTrue(math.isnan(altitudes[2]))
+
+
+class test_import_shapefile_class(unittest.TestCase):
+
+    fields = ('fclass', 'length', 'maxspeed', 'name', 'oneway', 'osm_id')
+    roads = [('primary', [(11.0, 44.0), (11.05, 44.0), (11.1, 44.0)],
+              {'length': 0.1, 'maxspeed': 50, 'osm_id': '1'}),
+             ('footway', [(11.0, 44.0), (11.0, 44.1)],
+              {'length': 0.1, 'osm_id': '2'}),
+             ('residential', [[(11.1, 44.0), (11.2, 44.0)],
+                              [(11.2, 44.0), (11.0, 44.0)]],
+              {'length': 0.3, 'name': 'Via Emilia', 'osm_id': '3'}),
+             ('secondary', None, {'osm_id': '4'}),
+             ('tertiary', (11.3, 44.1), {'osm_id': '5'}),
+             ('primary', [(11.2, 44.0), (11.3, 44.0)],
+              {'maxspeed': 30, 'oneway': 'F', 'osm_id': '6'})]
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.ogr = unittest.mock.MagicMock(wkbPoint=1, wkbLineString=2,
+                                           wkbMultiLineString=5)
+        self.ogr.GT_Flatten.side_effect = lambda kind: kind
+
+        layer = unittest.mock.MagicMock()
+        layer.schema = [unittest.mock.Mock(**{'GetName.return_value': name})
+                        for name in self.fields]
+        layer.__iter__.return_value = [self.feature(*road)
+                                       for road in self.roads]
+        self.ogr.Open.return_value = [layer]
+        self.edges = unittest.mock.Mock()
+        self.ogr.GetDriverByName().CreateDataSource().CreateLayer = \
+            lambda name, *args: self.edges if name == 'edges' \
+            else unittest.mock.Mock()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def feature(self, fclass, geometry, data):
+        """Return mock of an OGR feature of a road."""
+        data = dict(dict.fromkeys(self.fields), fclass=fclass, **data)
+        return unittest.mock.Mock(**{'geometry.return_value':
+                                     self.geometry(geometry),
+                                     'GetField.side_effect': data.get})
+
+    def geometry(self, points):
+        """Return mock of an OGR point, line (list) or multi-line."""
+        if points is None:
+            return None
+        if isinstance(points, tuple):
+            return unittest.mock.Mock(**{'GetGeometryType.return_value':
+                                         self.ogr.wkbPoint})
+        if isinstance(points[0], list):
+            lines = [self.geometry(line) for line in points]
+            return unittest.mock.Mock(**{
+                'GetGeometryType.return_value': self.ogr.wkbMultiLineString,
+                'GetGeometryCount.return_value': len(lines),
+                'GetGeometryRef.side_effect': lines.__getitem__})
+        return unittest.mock.Mock(**{
+            'GetGeometryType.return_value': self.ogr.wkbLineString,
+            'GetPointCount.return_value': len(points),
+            'GetPoint_2D.side_effect': points.__getitem__})
+
+    def test_import(self):
+        args = IO.utility.CLI.args()
+        with unittest.mock.patch.dict('sys.modules', {
+                'osgeo': unittest.mock.Mock(ogr=self.ogr),
+                'osgeo.ogr': self.ogr}), \
+                unittest.mock.patch.object(IO, 'edges_per_chunk', 2), \
+                unittest.mock.patch.multiple(args, dem_file=None,
+                                             import_file='roads.shp',
+                                             workspace=self.temp_dir.name):
+            IO.import_shapefile_to_workspace()
+        ws = self.temp_dir.name
+        self.assertEqual(sorted(os.listdir(ws)), ['edges.npy', 'nodes.npy'])
+        self.assertEqual(self.edges.CreateFeature.call_count, 4)
+        self.assertEqual(
+            sorted(call[0][0].GetName() for call
+                   in self.edges.CreateField.call_args_list),
+            ['length', 'maxspeed', 'oneway', 'osm_id'])
+
+        # endpoints shared by roads are the same node
+        nodes = np.load(os.path.join(ws, 'nodes.npy'))
+        self.assertEqual(list(zip(nodes['lon'], nodes['lat'])),
+                         [(11.0, 44.0), (11.1, 44.0), (11.2, 44.0),
+                          (11.3, 44.0)])
+
+        # chunks with different attributes are concatenated
+        edges = np.load(os.path.join(ws, 'edges.npy'))
+        self.assertEqual(set(edges.dtype.names),
+                         {'src', 'dest', 'length', '?length', 'maxspeed',
+                          '?maxspeed', 'oneway', '?oneway', 'osm_id'})
+        self.assertEqual(edges['src'].tolist(), [0, 1, 2, 2])
+        self.assertEqual(edges['dest'].tolist(), [1, 2, 0, 3])
+        self.assertEqual(edges['osm_id'].tolist(), ['1', '3', '3', '6'])
+        self.assertEqual(edges['?length'].tolist(), [True] * 3 + [False])
+        self.assertEqual(edges['maxspeed'].tolist(), [50, 0, 0, 30])
+        self.assertEqual(edges['?maxspeed'].tolist(),
+                         [True, False, False, True])
+
+        osm_g = IO.read_binary_workspace(ws)
+        self.assertEqual(osm_g.edge[(11.2, 44.0)][(11.3, 44.0)],
+                         {'maxspeed': 30, 'oneway': 'F', 'osm_id': '6'})
+        self.assertEqual(osm_g.edge[(11.2, 44.0)][(11.0, 44.0)],
+                         {'length': 0.3, 'osm_id': '3'})
+
+
+if __name__ == '__main__':
+    unittest.main(failfast=False)
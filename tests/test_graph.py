@@ -0,0 +1,712 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+""" E-VRP is a project about the routing of a fleet of electrical vehicles.
+
+    E-VRP is a project developed for the Application of Operational Research
+    exam at University of Modena and Reggio Emilia.
+
+    Copyright (C) 2017  Serena Ziviani, Federico Motta
+
+    This file is part of E-VRP.
+
+    E-VRP is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    any later version.
+
+    E-VRP is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with E-VRP.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__authors__ = "Serena Ziviani, Federico Motta"
+__copyright__ = "E-VRP  Copyright (C)  2017"
+__license__ = "GPL3"
+
+import math
+import networkx as nx
+import os
+import random
+import tempfile
+import unittest
+import unittest.mock
+
+from context import graph
+
+
+class test_cache_paths_class(unittest.TestCase):
+
+    depot = {'lat': 48, 'lon': 16, 'alt': 0, 'type': 'depot'}
+    customers = [{'lat': 47, 'lon': 15, 'alt': 1, 'type': 'customer'},
+                 {'lat': 49, 'lon': 13, 'alt': 0, 'type': 'customer'},
+                 {'lat': 50, 'lon': 14, 'alt': -3, 'type': 'customer'}]
+    stations = [{'lat': 48, 'lon': 14, 'alt': 3, 'type': 'station'},
+                {'lat': 47, 'lon': 16, 'alt': 2, 'type': 'station'}]
+    other_nodes = [{'lat': 49, 'lon': 15, 'alt': 2, 'type': ''},
+                   {'lat': 50, 'lon': 16, 'alt': -4, 'type': ''}]
+
+    edges = [{'src_lat': 48, 'src_lon': 16, 'dst_lat': 50, 'dst_lon': 16,
+              'speed': 70, 'oneway': False},
+             {'src_lat': 50, 'src_lon': 16, 'dst_lat': 50, 'dst_lon': 14,
+              'speed': 70, 'oneway': False},
+             {'src_lat': 50, 'src_lon': 14, 'dst_lat': 49, 'dst_lon': 15,
+              'speed': 30, 'oneway': True},
+             {'src_lat': 49, 'src_lon': 15, 'dst_lat': 48, 'dst_lon': 14,
+              'speed': 30, 'oneway': True},
+             {'src_lat': 48, 'src_lon': 14, 'dst_lat': 49, 'dst_lon': 13,
+              'speed': 50, 'oneway': False},
+             {'src_lat': 49, 'src_lon': 13, 'dst_lat': 50, 'dst_lon': 14,
+              'speed': 50, 'oneway': True},
+             {'src_lat': 48, 'src_lon': 14, 'dst_lat': 50, 'dst_lon': 14,
+              'speed': 30, 'oneway': True},
+             {'src_lat': 48, 'src_lon': 16, 'dst_lat': 49, 'dst_lon': 15,
+              'speed': 50, 'oneway': True},
+             {'src_lat': 48, 'src_lon': 16, 'dst_lat': 48, 'dst_lon': 14,
+              'speed': 30, 'oneway': False},
+             {'src_lat': 48, 'src_lon': 14, 'dst_lat': 47, 'dst_lon': 15,
+              'speed': 90, 'oneway': False},
+             {'src_lat': 47, 'src_lon': 15, 'dst_lat': 47, 'dst_lon': 16,
+              'speed': 50, 'oneway': False},
+             {'src_lat': 47, 'src_lon': 16, 'dst_lat': 48, 'dst_lon': 16,
+              'speed': 50, 'oneway': False}]
+
+    def setUp(self):
+        alt_lab = 'ASTGTM2_de'
+        stub_graph = nx.DiGraph(name=graph.Graph._osm_name)
+        l = [self.depot] + self.customers + self.stations + self.other_nodes
+        for node in l:
+            # coordinates are (longitude, latitude)
+            stub_graph.add_node((node['lon'], node['lat']),
+                                {alt_lab: node['alt'], 'type': node['type']})
+
+        for idx, e in enumerate(self.edges):
+            s = next(n for n in l
+                     if n['lat'] == e['src_lat'] and n['lon'] == e['src_lon'])
+            d = next(n for n in l
+                     if n['lat'] == e['dst_lat'] and n['lon'] == e['dst_lon'])
+            length = math.sqrt(math.pow(e['src_lat'] - e['dst_lat'], 2) +
+                               math.pow(e['src_lon'] - e['dst_lon'], 2) +
+                               math.pow(s['alt'] - d['alt'], 2))
+
+            # coordinates are (longitude, latitude)
+            stub_graph.add_edge((e['src_lon'], e['src_lat']),
+                                (e['dst_lon'], e['dst_lat']),
+                                {'osm_id': idx, 'length': length,
+                                 'speed': e['speed'], 'oneway': e['oneway']})
+
+        self.graph = graph.Graph(from_DiGraph=stub_graph)
+        """self.graph has now different attributes from stub_graph
+           - nodes have: altitude, type, latitude, longitude
+           - edges have: osm_id, length, rise, speed, energy, slope, time
+           note: nodes coordinates are now in (lat, lon) format
+        """
+
+        self.cache = graph.CachePaths(self.graph)
+        self.nodes = [(n['lat'], n['lon'], n['type'])
+                      for n in [self.depot] + self.customers + self.stations]
+
+    def tearDown(self):
+        self.graph = None
+        self.cache = None
+
+    def test_source_iterator(self):
+        for src in self.nodes:
+            for dest, green, short in self.cache.source_iterator(src):
+                self.assertEqual(green._nodes,
+                                 self.cache.greenest(src, dest)._nodes)
+                self.assertEqual(short._nodes,
+                                 self.cache.shortest(src, dest)._nodes)
+                self.assertEqual(green.first_node(), src)
+                self.assertEqual(green.last_node(), dest)
+
+    def test_destination_iterator(self):
+        for dest in self.nodes:
+            for src, green, short in self.cache.destination_iterator(dest):
+                self.assertEqual(green.time,
+                                 self.cache.greenest(src, dest).time)
+                self.assertEqual(short.time,
+                                 self.cache.shortest(src, dest).time)
+                self.assertEqual(green.first_node(), src)
+                self.assertEqual(green.last_node(), dest)
+
+    def test_iterators_agree(self):
+        pairs_from_src = {(src, dest) for src in self.nodes
+                          for dest, *__ in self.cache.source_iterator(src)}
+        pairs_from_dest = {(src, dest) for dest in self.nodes
+                           for src, *__
+                           in self.cache.destination_iterator(dest)}
+        self.assertEqual(pairs_from_src, pairs_from_dest)
+        self.assertNotIn((self.nodes[0], self.nodes[0]), pairs_from_src)
+
+    def test_matrices(self):
+        reachable = self.cache.reachable
+        self.assertEqual(reachable.shape, (len(self.nodes), len(self.nodes)))
+        for src in self.cache.nodes:
+            i = self.cache.node_id(src)
+            self.assertFalse(reachable[i, i])
+            for dest, green, short in self.cache.source_iterator(src):
+                j = self.cache.node_id(dest)
+                self.assertTrue(reachable[i, j])
+                for label in ('energy', 'length', 'time'):
+                    green_m = self.cache.matrix(label, greenest=True)
+                    short_m = self.cache.matrix(label, greenest=False)
+                    self.assertEqual(green_m[i, j], getattr(green, label))
+                    self.assertEqual(short_m[i, j], getattr(short, label))
+        self.assertEqual(reachable.sum(),
+                         sum(len(list(self.cache.source_iterator(src)))
+                             for src in self.nodes))
+        self.assertRaises(ValueError, self.cache.matrix, 'slope')
+
+    def assert_greenest_engine(self, compact):
+        potential = graph.CachePaths._greenest_potential(compact)
+        self.assertIsNotNone(potential)
+        weights = compact.reduced_weights('energy', potential)
+        for src in self.graph.nodes_iter():
+            __, expected = nx.bellman_ford(self.graph, src, weight='energy')
+            i = compact.node_id(src)
+            __, __, dist = compact.dijkstra(i, weights)
+            energy = {compact.coordinates[j]: d - potential[i] + potential[j]
+                      for j, d in enumerate(dist) if d < math.inf}
+            self.assertEqual(set(energy), set(expected))
+            for node in expected:
+                self.assertAlmostEqual(energy[node], expected[node],
+                                       delta=1e-6 * abs(expected[node]))
+
+    def test_greenest_engine(self):
+        self.assert_greenest_engine(graph.CompactGraph(self.graph))
+
+    def test_greenest_engine_with_negative_energies(self):
+        # a regenerative car gets back all the energy spent to climb
+        factor = graph.IO.load_problem_file()['car'][1]['weight'] * 9.81
+        for src, dest, data in self.graph.edges_iter(data=True):
+            data['energy'] = data['length'] + factor * data['rise']
+        self.assertTrue(any(data['energy'] < 0 for *__, data
+                            in self.graph.edges_iter(data=True)))
+        self.assert_greenest_engine(graph.CompactGraph(self.graph))
+
+    def test_bellman_ford(self):
+        compact = graph.CompactGraph(self.graph)
+        weights = compact.edge_values('energy').tolist()
+        for src in self.graph.nodes_iter():
+            pred, expected = nx.bellman_ford(self.graph, src, weight='energy')
+            compact_pred, __, dist = compact.bellman_ford(
+                compact.node_id(src), weights)
+            for node in expected:
+                j = compact.node_id(node)
+                self.assertEqual(dist[j], expected[node])
+                self.assertEqual(pred[node], None if compact_pred[j] < 0
+                                 else compact.coordinates[compact_pred[j]])
+
+    def test_parallel_build(self):
+        parallel = graph.CachePaths(self.graph, workers=2)
+        self.assertEqual(parallel.nodes, self.cache.nodes)
+        for src in self.nodes:
+            for record, expected in zip(parallel.source_iterator(src),
+                                        self.cache.source_iterator(src)):
+                self.assertEqual(record[0], expected[0])
+                self.assertEqual(record[1]._nodes, expected[1]._nodes)
+                self.assertEqual(record[2]._nodes, expected[2]._nodes)
+        self.assertTrue((parallel.matrix('energy') ==
+                         self.cache.matrix('energy')).all())
+
+    def test_lazy_build(self):
+        # a budget of one byte keeps only the last searched source
+        lazy = graph.CachePaths(self.graph, memory_budget=1)
+        self.assertEqual(len(lazy._lru), 0)
+        # matrices of all sources are not allocated
+        self.assertIsNone(lazy._values)
+        for src in self.nodes:
+            expected = list(self.cache.source_iterator(src))
+            records = list(lazy.source_iterator(src))
+            self.assertEqual([d for d, *__ in records],
+                             [d for d, *__ in expected])
+            for record, expected_record in zip(records, expected):
+                dest, green, short = record
+                __, expected_green, expected_short = expected_record
+                self.assertEqual(green._nodes, expected_green._nodes)
+                self.assertEqual(short._nodes, expected_short._nodes)
+                self.assertEqual(green.energy, lazy.greenest(src, dest).energy)
+            self.assertEqual(list(lazy._lru), [lazy.node_id(src)])
+            # values of the row are counted in the budget
+            self.assertGreaterEqual(lazy._lru_size,
+                                    2 * 3 * len(self.nodes) * 8)
+
+        for dest in self.nodes:
+            self.assertEqual(
+                [s for s, *__ in lazy.destination_iterator(dest)],
+                [s for s, *__ in self.cache.destination_iterator(dest)])
+        for label in ('energy', 'length', 'time'):
+            self.assertTrue((lazy.matrix(label) ==
+                             self.cache.matrix(label)).all())
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            directory = os.path.join(temp_dir, 'cache')
+            self.cache.save(directory)
+            loaded = graph.CachePaths.load(self.graph, directory)
+
+            self.assertEqual(loaded.nodes, self.cache.nodes)
+            for src in self.nodes:
+                records = list(self.cache.source_iterator(src))
+                loaded_records = list(loaded.source_iterator(src))
+                self.assertEqual(len(loaded_records), len(records))
+                for record, loaded_record in zip(records, loaded_records):
+                    for path, loaded_path in zip(record[1:],
+                                                 loaded_record[1:]):
+                        self.assertEqual(loaded_path.last_node(),
+                                         path.last_node())
+                        self.assertEqual(loaded_path.time, path.time)
+                        self.assertEqual(loaded_path.energy, path.energy)
+                        self.assertEqual(loaded_path._nodes, path._nodes)
+            self.assertTrue((loaded.reachable == self.cache.reachable).all())
+
+            self.graph.node[self.graph.depot[:2]]['type'] = ''
+            self.assertRaises(ValueError, graph.CachePaths.load,
+                              self.graph, directory)
+
+    def test_paths_from_trees(self):
+        uncontracted = graph.CachePaths(self.graph, contract=False)
+        for src in self.nodes:
+            shortest = nx.single_source_dijkstra_path(self.graph, src[:2],
+                                                      weight='lenght')
+            __, energy = nx.bellman_ford(self.graph, src[:2], weight='energy')
+            for dest, green, short in self.cache.source_iterator(src):
+                # contracted chains may break ties in another way
+                self.assertEqual(len(short._nodes), len(shortest[dest[:2]]))
+                self.assertEqual([node[:2] for node
+                                  in uncontracted.shortest(src, dest)],
+                                 shortest[dest[:2]])
+                self.assertAlmostEqual(green.energy, energy[dest[:2]])
+
+                # aggregates must not change when paths are unrolled
+                for path in (green, short):
+                    unrolled = graph.solution.Path(self.graph, path._nodes)
+                    for label in ('energy', 'length', 'time'):
+                        self.assertEqual(getattr(path, label),
+                                         getattr(unrolled, label))
+
+    def test_missing_path(self):
+        other = (self.other_nodes[0]['lat'], self.other_nodes[0]['lon'], '')
+        self.assertRaises(ValueError, self.cache.greenest,
+                          self.nodes[0], other)
+        self.assertEqual(list(self.cache.source_iterator(other)), list())
+
+
+class test_abstract_graph_class(unittest.TestCase):
+
+    def osm_graph(self, random_altitude):
+        alt_lab = 'ASTGTM2_de'
+        rand = random.Random(0)
+        osm_g = nx.DiGraph(name=graph.Graph._osm_name)
+        for lon in range(10):
+            for lat in range(10):
+                osm_g.add_node((lon, lat), {alt_lab: random_altitude(rand),
+                                            'type': ''})
+        nodes = osm_g.nodes()
+        for idx in range(300):
+            src, dest = rand.sample(nodes, 2)
+            attr = {'osm_id': idx, 'length': rand.uniform(1, 3000),
+                    'speed': rand.choice((0, 30, 50.5)),
+                    'oneway': rand.random() < 0.5}
+            if rand.random() < 0.5:
+                attr['maxspeed'] = rand.choice((0, 70))
+            osm_g.add_edge(src, dest, attr)
+        return osm_g
+
+    def assert_edge_attributes(self, osm_g):
+        car = graph.IO.load_problem_file()['car'][1]
+        expected = nx.DiGraph()
+        for (src_lon, src_lat), (dest_lon, dest_lat), data \
+                in osm_g.edges_iter(data=True):
+            attr = {'osm_id': data['osm_id'], 'length': data['length']}
+            attr['rise'] = osm_g.node[(dest_lon, dest_lat)]['ASTGTM2_de']
+            attr['rise'] -= osm_g.node[(src_lon, src_lat)]['ASTGTM2_de']
+            if data['speed'] > 0:
+                attr['speed'] = data['speed']
+            elif data.get('maxspeed', 0) > 0:
+                attr['speed'] = data['maxspeed']
+            else:
+                attr['speed'] = 50
+            attr['energy'] = graph.utility.energy(**attr, **car)
+            attr['slope'] = math.atan2(attr['rise'], attr['length'])
+            attr['time'] = (attr['length'] / attr['speed']) * 0.06
+            expected.add_edge((src_lat, src_lon), (dest_lat, dest_lon),
+                              attr_dict=attr)
+            if not data['oneway']:
+                attr['rise'] *= -1
+                attr['slope'] *= -1
+                attr['energy'] = graph.utility.energy(**attr, **car)
+                expected.add_edge((dest_lat, dest_lon), (src_lat, src_lon),
+                                  attr_dict=attr)
+
+        abstract_g = graph.Graph(from_DiGraph=osm_g)
+        self.assertEqual(sorted(abstract_g.edges()), sorted(expected.edges()))
+        for src, dest, data in expected.edges_iter(data=True):
+            self.assertEqual(abstract_g.edge[src][dest], data)
+            for label, value in data.items():
+                self.assertIs(type(abstract_g.edge[src][dest][label]),
+                              type(value))
+
+    def test_edge_attributes(self):
+        # the batched computation must match the per-edge formulas
+        self.assert_edge_attributes(
+            self.osm_graph(lambda rand: rand.uniform(-50, 50)))
+        self.assert_edge_attributes(
+            self.osm_graph(lambda rand: rand.randint(-50, 50)))
+
+    def test_release_osm_graph(self):
+        osm_g = self.osm_graph(lambda rand: rand.uniform(-50, 50))
+        expected = graph.Graph(from_DiGraph=osm_g.copy())
+        abstract_g = graph.Graph(from_DiGraph=osm_g, release=True)
+        self.assertEqual(abstract_g.nodes(data=True),
+                         expected.nodes(data=True))
+        self.assertEqual(abstract_g.edges(data=True),
+                         expected.edges(data=True))
+        self.assertEqual(osm_g.number_of_nodes(), 0)
+        self.assertEqual(len(osm_g.pred), 0)
+        self.assertEqual(osm_g.name, graph.Graph._osm_name)
+
+
+class test_contraction_hierarchy_class(unittest.TestCase):
+
+    def setUp(self):
+        fixture = test_cache_paths_class('test_matrices')
+        fixture.setUp()
+        self.graph, self.nodes = fixture.graph, fixture.nodes
+
+    def tearDown(self):
+        self.graph = None
+
+    def assert_matrix(self, abstract_g):
+        compact = graph.CompactGraph(abstract_g)
+        nodes = abstract_g.nodes()
+        ids = [compact.node_id(node) for node in nodes]
+        for label in ('energy', 'hops', 'length', 'time'):
+            hierarchy = graph.ContractionHierarchy(compact, label)
+            self.assertEqual(hierarchy.label, label)
+            matrix = hierarchy.matrix(ids, ids)
+            values = hierarchy.values(ids, ids)
+            for i, src in enumerate(nodes):
+                # edges without hops attribute weight 1
+                __, expected = nx.bellman_ford(abstract_g, src, weight=label)
+                for j, dest in enumerate(nodes):
+                    if dest not in expected:
+                        self.assertEqual(matrix[i, j], math.inf)
+                        self.assertIsNone(hierarchy.path(ids[i], ids[j]))
+                        continue
+                    self.assertAlmostEqual(
+                        matrix[i, j], expected[dest],
+                        delta=1e-6 * max(1, abs(expected[dest])))
+                    # values are the sums over the roads of the path
+                    path = [compact.coordinates[node] for node
+                            in hierarchy.path(ids[i], ids[j])]
+                    self.assertEqual((path[0], path[-1]), (src, dest))
+                    self.assertAlmostEqual(len(path) - 1 if label == 'hops'
+                                           else self.path_sum(abstract_g,
+                                                              path, label),
+                                           matrix[i, j], delta=1e-6 * max(
+                                               1, abs(matrix[i, j])))
+                    for index, name in enumerate(('energy', 'length',
+                                                  'time')):
+                        self.assertAlmostEqual(
+                            values[index, i, j],
+                            self.path_sum(abstract_g, path, name),
+                            delta=1e-6 * max(1, abs(values[index, i, j])))
+
+    @staticmethod
+    def path_sum(abstract_g, path, label):
+        """Return sum of label values of the edges of path."""
+        return math.fsum(abstract_g.edge[src][dest][label]
+                         for src, dest in zip(path, path[1:]))
+
+    def test_matrix(self):
+        self.assert_matrix(self.graph)
+
+    def test_matrix_of_random_graph(self):
+        osm_g = test_abstract_graph_class('test_edge_attributes').osm_graph(
+            lambda rand: rand.uniform(-50, 50))
+        self.assert_matrix(graph.Graph(from_DiGraph=osm_g))
+
+    def test_add_nodes_of_interests(self):
+        compact = graph.CompactGraph(self.graph)
+        hierarchy = graph.ContractionHierarchy(compact, 'time')
+        ids = [compact.node_id(node[:2]) for node in self.nodes]
+        matrix = hierarchy.matrix(ids, ids)
+        # a new node only needs its own row and column
+        other = compact.node_id((49, 15))
+        row = hierarchy.matrix([other], ids + [other])
+        column = hierarchy.matrix(ids, [other])
+        self.assertEqual(row[0, -1], 0)
+        self.assertTrue((hierarchy.matrix(ids + [other], ids)[:-1] ==
+                         matrix).all())
+        self.assertEqual(hierarchy.matrix(ids + [other], ids + [other])
+                         .tolist(),
+                         [r + c for r, c in zip(matrix.tolist(),
+                                                column.tolist())]
+                         + row.tolist())
+
+    def test_cache_from_hierarchies(self):
+        compact = graph.CompactGraph(self.graph)
+        hierarchies = {label: graph.ContractionHierarchy(compact, label)
+                       for label in ('energy', 'hops')}
+        cache = graph.CachePaths.from_hierarchies(compact, hierarchies)
+        searched = graph.CachePaths(compact)
+        self.assertEqual(cache.nodes, self.nodes)
+        self.assertEqual(cache.reachable.tolist(),
+                         searched.reachable.tolist())
+        for src in self.nodes:
+            expected = {dest: (green, short) for dest, green, short
+                        in searched.source_iterator(src)}
+            for dest, green, short in cache.source_iterator(src):
+                # the same energies and number of roads of searched paths
+                self.assertAlmostEqual(green.energy, expected[dest][0].energy)
+                self.assertEqual(len(short._nodes),
+                                 len(expected[dest][1]._nodes))
+                for path in (green, short):
+                    # nodes are unpacked when the path is unrolled
+                    nodes = [node[:2] for node in path._nodes]
+                    self.assertEqual((path._nodes[0], path._nodes[-1]),
+                                     (src, dest))
+                    for label in ('energy', 'length', 'time'):
+                        self.assertAlmostEqual(
+                            getattr(path, label),
+                            self.path_sum(self.graph, nodes, label))
+        self.assertFalse(cache.reachable.diagonal().any())
+        self.assertRaises(ValueError, graph.CachePaths.from_hierarchies,
+                          compact, {'energy': hierarchies['energy']})
+
+    def test_save_and_load(self):
+        compact = graph.CompactGraph(self.graph)
+        hierarchy = graph.ContractionHierarchy(compact, 'energy')
+        ids = list(range(len(compact)))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            directory = os.path.join(temp_dir, 'energy')
+            hierarchy.save(directory)
+            loaded = graph.ContractionHierarchy.load(compact, directory)
+            self.assertEqual(loaded.label, 'energy')
+            self.assertEqual(loaded.number_of_shortcuts(),
+                             hierarchy.number_of_shortcuts())
+            self.assertTrue((loaded.matrix(ids, ids) ==
+                             hierarchy.matrix(ids, ids)).all())
+
+            self.graph.remove_node((50, 16))
+            self.assertRaises(ValueError, graph.ContractionHierarchy.load,
+                              graph.CompactGraph(self.graph), directory)
+            self.assertRaises(FileNotFoundError,
+                              graph.ContractionHierarchy.load, compact,
+                              os.path.join(temp_dir, 'missing'))
+
+    def test_unknown_label(self):
+        self.assertRaises(ValueError, graph.ContractionHierarchy,
+                          graph.CompactGraph(self.graph), 'slope')
+
+
+class test_osm_graph_class(unittest.TestCase):
+
+    def setUp(self):
+        # coordinates are (longitude, latitude)
+        self.osm_g = graph.Graph.__new__(graph.Graph)
+        nx.DiGraph.__init__(self.osm_g, name=graph.Graph._osm_name)
+        for coor, kind in (((0, 0), 'depot'), ((1, 0), 'customer'),
+                           ((2, 0), 'customer'), ((3, 0), 'customer'),
+                           ((0, 1), 'station'), ((0, 2), 'station'),
+                           ((1, 1), '')):
+            self.osm_g.add_node(coor, type=kind)
+        for src, dest in (((0, 0), (1, 0)), ((1, 0), (0, 0)),
+                          ((1, 0), (2, 0)), ((1, 0), (1, 1)),
+                          ((1, 1), (0, 1)), ((0, 1), (0, 0)),
+                          ((0, 2), (0, 0))):
+            self.osm_g.add_edge(src, dest)
+
+    def tearDown(self):
+        self.osm_g = None
+
+    def test_crop(self):
+        # nodes of interests are in the box (0, 0) - (3, 2)
+        before = self.osm_g._connections()
+        far = [(lon / 100, 5) for lon in range(300)]
+        self.osm_g.add_nodes_from(far, type='')
+        self.osm_g.add_path([(0, 2)] + far)
+        self.assertEqual(self.osm_g.crop(100), len(far))
+        self.assertEqual(self.osm_g._connections(), before)
+        self.assertIn((1, 1), self.osm_g)
+
+        # the customer at (3, 0) is reachable only out of the box
+        self.osm_g.add_node((10, 10), type='')
+        self.osm_g.add_path([(1, 0), (10, 10), (3, 0)])
+        self.assertEqual(self.osm_g.crop(100), 0)
+        self.assertIn((10, 10), self.osm_g)
+
+    def test_check_problem_solvability(self):
+        expected = list()
+        depot = self.osm_g.depot[:2]
+        for *c, __ in self.osm_g.customers:
+            c = tuple(c)
+            if not nx.has_path(self.osm_g, depot, c):
+                expected.append(f'Customer {c} is not reachable from the '
+                                'depot')
+            if not nx.has_path(self.osm_g, c, depot):
+                expected.append(f'Depot is not reachable from customer {c}')
+        test_coor = [tuple(n[:2])
+                     for n in [self.osm_g.depot] + self.osm_g.customers]
+        for *s, __ in self.osm_g.stations:
+            s = tuple(s)
+            if not any(nx.has_path(self.osm_g, t, s) for t in test_coor):
+                expected.append(f'Refueling station {s} is not reachable '
+                                'from any customer or depot')
+            if not any(nx.has_path(self.osm_g, s, t) for t in test_coor):
+                expected.append('No customer or depot reachable from '
+                                f'refueling station {s}')
+        self.assertEqual(len(expected), 4)
+
+        with self.assertLogs('E-VRP', level='WARNING') as logs:
+            self.assertRaises(RuntimeError,
+                              self.osm_g.check_problem_solvability)
+        self.assertEqual([record.getMessage() for record in logs.records],
+                         expected)
+
+        # without unreachable customers only stations are reported
+        self.osm_g.remove_nodes_from([(2, 0), (3, 0)])
+        self.osm_g._customer = [(1, 0, 'customer')]
+        with self.assertLogs('E-VRP', level='WARNING') as logs:
+            self.osm_g.check_problem_solvability()
+        self.assertEqual(len(logs.records), 1)
+
+
+class test_grid_index_class(unittest.TestCase):
+
+    def setUp(self):
+        rand = random.Random(0)
+        self.points = [(11 + rand.uniform(0, 0.01), 44 + rand.uniform(0, 0.01))
+                       for __ in range(500)]
+        self.index = graph.GridIndex(self.points, tolerance=50)
+
+    def tearDown(self):
+        self.index = None
+
+    def test_nearest(self):
+        rand = random.Random(1)
+        for __ in range(200):
+            lon, lat = 11 + rand.uniform(0, 0.01), 44 + rand.uniform(0, 0.01)
+            shrink = math.cos(math.radians(lat))
+            distances = [math.hypot((p_lon - lon) * shrink, p_lat - lat)
+                         * graph.GridIndex._meters_per_degree
+                         for p_lon, p_lat in self.points]
+            best = min(range(len(self.points)), key=distances.__getitem__)
+            expected = self.points[best] if distances[best] <= 50 else None
+            self.assertEqual(self.index.nearest(lon, lat), expected)
+
+    def test_exact_and_far_points(self):
+        for point in self.points[:10]:
+            self.assertEqual(self.index.nearest(*point), point)
+        self.assertIsNone(self.index.nearest(12, 45))
+        self.assertIsNone(graph.GridIndex(list(), 50).nearest(11, 44))
+
+    def test_label_nodes(self):
+        osm_g = graph.Graph.__new__(graph.Graph)
+        nx.DiGraph.__init__(osm_g, name=graph.Graph._osm_name)
+        osm_g.add_nodes_from(self.points)
+        depot, customer = self.points[0], self.points[1]
+        problem = {'depot': [{'longitude': depot[0], 'latitude': depot[1]}],
+                   'customer': [{'longitude': customer[0] + 1e-5,
+                                 'latitude': customer[1]}],
+                   'station': list()}
+        args = graph.utility.CLI.args()
+        with unittest.mock.patch.object(graph.IO, 'load_problem_file',
+                                        return_value=problem):
+            with unittest.mock.patch.object(args, 'snap_tolerance', 0):
+                self.assertRaises(NameError, osm_g.label_nodes)
+            with unittest.mock.patch.object(args, 'snap_tolerance', 5):
+                osm_g.label_nodes()
+        self.assertEqual(osm_g.depot, (*depot, 'depot'))
+        self.assertEqual(osm_g.customers, [(*customer, 'customer')])
+        self.assertEqual(osm_g.node[customer]['type'], 'customer')
+
+
+class test_compact_graph_class(test_cache_paths_class):
+    """Run the tests of CachePaths over the CSR form of the graph."""
+
+    def setUp(self):
+        super().setUp()
+        self.compact = graph.CompactGraph(self.graph)
+        self.cache = graph.CachePaths(self.compact)
+
+    def tearDown(self):
+        super().tearDown()
+        self.compact = None
+
+    def test_views(self):
+        self.assertEqual(list(self.compact), self.graph.nodes())
+        self.assertEqual(list(self.compact.nodes_iter(data=True)),
+                         list(self.graph.nodes_iter(data=True)))
+        self.assertEqual(list(self.compact.edges_iter(data=True)),
+                         list(self.graph.edges_iter(data=True)))
+        for src, adjacency_dict in self.compact.adjacency_iter():
+            self.assertEqual(dict(adjacency_dict), self.graph.adj[src])
+            for dest in adjacency_dict:
+                self.assertEqual(self.compact.edge[src][dest],
+                                 self.graph.edge[src][dest])
+        self.assertEqual(self.compact.depot, self.graph.depot)
+        self.assertEqual(self.compact.customers, self.graph.customers)
+        self.assertEqual(self.compact.stations, self.graph.stations)
+        self.assertNotIn((0, 0), self.compact)
+        self.assertRaises(KeyError, self.compact.node.__getitem__, (0, 0))
+
+    def test_shortest_engine(self):
+        for src in self.graph.nodes_iter():
+            expected = nx.single_source_dijkstra_path(self.graph, src,
+                                                      weight='lenght')
+            pred, __, dist = self.compact.dijkstra(self.compact.node_id(src))
+            for node, path in expected.items():
+                j = self.compact.node_id(node)
+                self.assertEqual(dist[j], len(path) - 1)
+                unrolled = list()
+                while j >= 0:
+                    unrolled.insert(0, self.compact.coordinates[j])
+                    j = pred[j]
+                self.assertEqual(unrolled, path)
+
+    def test_contract_chains(self):
+        keep = [self.compact.node_id(node[:2]) for node in self.nodes]
+        contracted = self.compact.contract_chains(keep)
+        self.assertIsNone(self.compact.origin())
+        self.assertEqual(self.compact.hops(), None)
+
+        # the two-way road through (50, 16) is a chain
+        chain = self.compact.node_id((50, 16))
+        self.assertEqual(contracted.number_of_edges(),
+                         self.compact.number_of_edges() - 2)
+        self.assertNotIn(chain, contracted.indices)
+        self.assertEqual(contracted.indptr[chain],
+                         contracted.indptr[chain + 1])
+
+        origin_indptr, origin_edges, original_indices = contracted.origin()
+        sources = contracted.edge_sources()
+        for edge, dest in enumerate(contracted.indices):
+            edges = origin_edges[origin_indptr[edge]:origin_indptr[edge + 1]]
+            node = sources[edge]
+            for original in edges:
+                self.assertIn(original, range(self.compact.indptr[node],
+                                              self.compact.indptr[node + 1]))
+                node = original_indices[original]
+            self.assertEqual(node, dest)
+            self.assertEqual(contracted.hops()[edge], len(edges))
+            self.assertEqual(contracted.edge_values('length')[edge],
+                             sum(self.compact.edge_values('length')[edges]))
+
+        # nodes to keep are never contracted
+        self.assertEqual(self.compact.contract_chains(keep + [chain])
+                         .number_of_edges(), self.compact.number_of_edges())
+
+    def test_abstract_only(self):
+        self.graph.name = graph.Graph._osm_name
+        self.assertRaises(TypeError, graph.CompactGraph, self.graph)
+
+
+if __name__ == '__main__':
+    unittest.main(failfast=False)
@@ -29,6 +29,7 @@ __copyright__ = "E-VRP  Copyright (C)  2017"
 __license__ = "GPL3"
 
 import unittest
+import unittest.mock
 import networkx as nx
 import math
 
@@ -195,5 +196,92 @@ class test_greedy_metaheuristic(unittest.TestCase):
     def test_metaheuristic(self):
         heuristic.metaheuristic(self.heuristic.create_feasible_solution())
 
+    def test_find_nearest_in_lazy_cache(self):
+        lazy = graph.CachePaths(self.graph, memory_budget=1)
+        depot = self.graph.depot
+        for kind in ('customer', 'station'):
+            self.assertEqual(
+                heuristic.find_nearest(solution.Solution(self.graph, lazy),
+                                       depot, kind),
+                heuristic.find_nearest(solution.Solution(self.graph,
+                                                         self.cache),
+                                       depot, kind))
+        # only the paths from the depot are searched
+        self.assertEqual(lazy._searched.sum(), 1)
+
+    def test_score_move(self):
+        sol = self.heuristic.create_feasible_solution()
+        cost = sol.time, sol.energy
+        for moves in heuristic.neighborhoods.values():
+            for move in moves(sol):
+                try:
+                    neighbor = heuristic.apply_move(sol, move)
+                except solution.UnfeasibleRouteException:
+                    self.assertIsNone(heuristic.score_move(sol, move))
+                else:
+                    self.assertEqual(heuristic.score_move(sol, move),
+                                     (neighbor.time, neighbor.energy))
+        # moves are only tried on drafts of routes
+        self.assertEqual((sol.time, sol.energy), cost)
+
+    def test_estimate_move(self):
+        sol = self.heuristic.create_feasible_solution()
+        for moves in heuristic.neighborhoods.values():
+            for move in moves(sol):
+                score = heuristic.score_move(sol, move)
+                estimate = heuristic.estimate_move(sol, move)
+                if score is None:
+                    self.assertIsNone(estimate)
+                else:
+                    for value, estimated in zip(score, estimate):
+                        self.assertAlmostEqual(value, estimated, places=6)
+
+    def test_cross_moves(self):
+        sol = solution.Solution(self.graph, self.cache)
+        customers = [(node['lat'], node['lon'], node['type'])
+                     for node in self.customers]
+        for nodes in (customers[:1], customers[1:]):
+            route = solution.Route(self.cache, greenest=True)
+            for node in nodes + [self.graph.depot]:
+                route.append(node)
+            sol.routes.append(route)
+        moves = list(heuristic.cross_moves(sol))
+        # depots are never moved and no route is left empty
+        self.assertEqual(len(moves), 7)
+        # segments of the other route are estimated without drafts
+        with unittest.mock.patch.object(heuristic, 'score_move',
+                                        side_effect=AssertionError):
+            estimates = [heuristic.estimate_move(sol, move)
+                         for move in moves]
+        for move, estimate in zip(moves, estimates):
+            neighbor = heuristic.apply_move(sol, move)
+            self.assertEqual(sorted(path.last_node() for route
+                                    in neighbor.routes
+                                    for path in route._paths[:-1]),
+                             sorted(customers))
+            for value, estimated in zip((neighbor.time, neighbor.energy),
+                                        estimate):
+                self.assertAlmostEqual(value, estimated, places=6)
+
+    def test_swap_moves(self):
+        sol = solution.Solution(self.graph, self.cache)
+        customers = [(node['lat'], node['lon'], node['type'])
+                     for node in self.customers]
+        for nodes in (customers[:1], customers[1:]):
+            route = solution.Route(self.cache, greenest=True)
+            for node in nodes + [self.graph.depot]:
+                route.append(node)
+            sol.routes.append(route)
+        moves = list(heuristic.swap_moves(sol))
+        # the depot paths ending the routes are never swapped
+        self.assertEqual(len(moves), len(customers[1:]))
+        for move in moves:
+            for r, position in zip(move.routes, move.positions):
+                self.assertLess(position, len(sol.routes[r]._paths) - 1)
+            neighbor = heuristic.apply_move(sol, move)
+            for route in neighbor.routes:
+                self.assertEqual(route.last_node(), self.graph.depot)
+
+
 if __name__ == '__main__':
     unittest.main(failfast=False)
@@ -28,6 +28,7 @@ __authors__ = "Serena Ziviani, Federico Motta"
 __copyright__ = "E-VRP  Copyright (C)  2017"
 __license__ = "GPL3"
 
+import copy
 import math
 import networkx as nx
 import unittest
@@ -188,6 +189,143 @@ class test_route_class(unittest.TestCase):
         route.substitute(rm, new_node)
         self.assertEqual(len(self.route._paths), len(self.route._batteries))
 
+    def test_replace_nodes(self):
+        nodes = [(node['lat'], node['lon'], node['type'])
+                 for node in self.customers + [self.depot]]
+        for node in nodes:
+            self.route.append(node)
+        station = self.stations[1]['lat'], self.stations[1]['lon'], 'station'
+        self.route.replace(1, 3, [station])
+        self.assertEqual([path.last_node() for path in self.route._paths],
+                         [nodes[0], station, nodes[3]])
+        self.assertEqual(len(self.route._paths), len(self.route._batteries))
+
+    def test_deepcopy(self):
+        sol = solution.Solution(self.graph, self.cache)
+        sol.routes.append(self.route)
+        for node in (self.customers[0], self.stations[0], self.depot):
+            self.route.append((node['lat'], node['lon'], node['type']))
+        sol_copy = copy.deepcopy(sol)
+        route_copy = sol_copy.routes[0]
+        # graph and cache are shared, paths and batteries are copied
+        self.assertIs(sol_copy._graph, sol._graph)
+        self.assertIs(route_copy._graph_cache, self.route._graph_cache)
+        for path, path_copy in zip(self.route._paths, route_copy._paths):
+            self.assertIsNot(path_copy, path)
+            self.assertIs(path_copy._graph, path._graph)
+            self.assertEqual(list(path_copy), list(path))
+            self.assertEqual(path_copy.energy, path.energy)
+        for batt, batt_copy in zip(self.route._batteries,
+                                   route_copy._batteries):
+            self.assertIsNot(batt_copy, batt)
+            self.assertEqual(batt_copy.charge, batt.charge)
+
+        # changes of the copy do not affect the original
+        node = self.customers[2]['lat'], self.customers[2]['lon'], 'customer'
+        route_copy.insert(node, 1)
+        route_copy._paths[0].append(*node)
+        self.assertEqual(len(self.route._paths), 3)
+        self.assertNotIn(node, list(self.route._paths[0]))
+        self.assertEqual(self.route.visited_customers(),
+                         {(self.customers[0]['lat'],
+                           self.customers[0]['lon'], 'customer')})
+
+    def test_aggregates(self):
+        sol = solution.Solution(self.graph, self.cache)
+        nodes = [(node['lat'], node['lon'], node['type'])
+                 for node in self.customers + [self.depot]]
+        other = solution.Route(self.cache, greenest=True)
+        for route, visited in ((self.route, nodes[:1]), (other, nodes[1:2])):
+            sol.routes.append(route)
+            for node in visited + nodes[-1:]:
+                route.append(node)
+
+        def check(sol):
+            self.assertEqual(sol.time, max(r.time for r in sol.routes))
+            self.assertEqual(sol.energy,
+                             math.fsum(r.energy for r in sol.routes))
+            self.assertEqual(sol.missing_customers(),
+                             set(self.graph.customers).difference(
+                                 *[r.visited_customers()
+                                   for r in sol.routes]))
+
+        check(sol)
+        self.assertEqual(sol.missing_customers(), {nodes[2]})
+        self.assertIsInstance(sol.missing_customers(), frozenset)
+        # it is not copied again while customers are the same
+        missing = sol.missing_customers()
+        self.route.append(nodes[1])
+        self.assertIs(sol.missing_customers(), missing)
+        self.route.remove(nodes[1])
+        # changes of routes and of copies are followed
+        sol_copy = copy.deepcopy(sol)
+        sol_copy.routes[1].insert(nodes[2], 1)
+        check(sol_copy)
+        self.assertFalse(sol_copy.missing_customers())
+        check(sol)
+        self.route.remove(nodes[0])
+        check(sol)
+        sol.routes.pop()
+        check(sol)
+        self.assertEqual(len(sol.missing_customers()), 3)
+
+    def test_segment(self):
+        batt = solution.Battery()
+        full = batt.charge
+        customer = self.customers[0]['lat'], self.customers[0]['lon'], \
+            'customer'
+        station = self.stations[0]['lat'], self.stations[0]['lon'], 'station'
+        to_customer = solution.Segment.leg(full / 2, 1, customer,
+                                           batt.model)
+        to_station = solution.Segment.leg(full / 2, 2, station, batt.model)
+        self.assertIsNone((to_customer + to_customer).charge(full))
+        # the station recharges the battery enough for the second leg
+        legs = to_station + to_customer
+        self.assertEqual((legs.time, legs.recharges), (3, 1))
+        batt.charge -= full / 2
+        batt.recharge()
+        batt.charge -= full / 2
+        self.assertAlmostEqual(legs.charge(full), batt.charge)
+
+        for node in (self.customers[0], self.stations[0], self.customers[1],
+                     self.depot):
+            self.route.append((node['lat'], node['lon'], node['type']))
+        size = len(self.route._paths)
+        whole = self.route.segment(0, size)
+        self.assertAlmostEqual(whole.time, self.route.time)
+        self.assertAlmostEqual(whole.charge(full),
+                               self.route.last_battery().charge)
+        for k in range(size + 1):
+            for value, concatenated in zip(whole, self.route.segment(0, k)
+                                           + self.route.segment(k, size)):
+                self.assertAlmostEqual(value, concatenated)
+        # interior ranges are concatenated from blocks of paths
+        for start in range(1, size):
+            for stop in range(start + 1, size):
+                legs = solution.Segment.empty
+                for k in range(start, stop):
+                    legs += self.route.segment(k, k + 1)
+                for value, concatenated in zip(legs, self.route.segment(
+                        start, stop)):
+                    self.assertAlmostEqual(value, concatenated)
+        # paths of other routes can be estimated in a route
+        other = solution.Route(self.cache, greenest=True)
+        for value, estimated in zip((self.route.time, self.route.energy),
+                                    other.estimate([solution.Stretch(
+                                        self.route, range(size))])):
+            self.assertAlmostEqual(value, estimated)
+
+    def test_battery_model(self):
+        batt = solution.Battery()
+        self.assertIs(batt.model, solution.BatteryModel.load())
+        self.assertEqual(batt.charge, batt.model.total_energy)
+        batt.charge -= batt.model.total_energy / 2
+        batt_copy = copy.deepcopy(batt)
+        self.assertIs(batt_copy.model, batt.model)
+        self.assertEqual(batt_copy.charge, batt.charge)
+        batt_copy.recharge()
+        self.assertNotEqual(batt_copy.charge, batt.charge)
+
     def test_raise(self):
         self.assertRaises(solution.UnfeasibleRouteException, raiser)
 
@@ -25,6 +25,7 @@
 """
 
 import argparse
+import numpy as np
 import random
 import sys
 
@@ -59,6 +60,18 @@ def energy(rise, length, consumption, weight, **kwargs):
     return consumption * length + theta * weight * 9.81 * rise
 
 
+def energies(rise, length, consumption, weight, **kwargs):
+    """Return array of energies spent to raise a car (in Joule).
+
+       Vectorized energy() over arrays of rises and lengths; operations
+       are the same and in the same order, so results are identical.
+    """
+    length = length / 10**3  # m to km
+    theta = np.where(rise < 0, -2 / 3, 1)
+    consumption *= 36000  # kW⋅h/100km  to  J/km
+    return consumption * length + theta * weight * 9.81 * rise
+
+
 def shuffled_range(*args):
     """Return iterator over a range shuffled randomly."""
     l = list(range(*args))
@@ -83,6 +96,7 @@ class CLI(object):
         '                           https://pypi.python.org/pypi/graphviz\n'  \
         '              Matplotlib   https://matplotlib.org\n'                 \
         '              Networkx     https://networkx.github.io\n'             \
+        '              NumPy        http://www.numpy.org\n'                   \
         '              PyYAML       http://pyyaml.org/wiki/PyYAML\n'
 
     def args(self=None):
@@ -105,6 +119,43 @@ class CLI(object):
                                      'in node.shp\n(default=ASTGTM2_de)',
                                 metavar='tag',
                                 type=str)
+            parser.add_argument('-B', '--crop',
+                                dest='crop_buffer',
+                                help='drop the part of workspace out of the '
+                                     'bounding box\nof nodes of interests '
+                                     'enlarged by m meters',
+                                metavar='m',
+                                type=float)
+            parser.add_argument('-C', '--cache-dir',
+                                dest='cache_dir',
+                                help='directory where paths between nodes '
+                                     'of interests\nare saved and reused '
+                                     'across runs',
+                                metavar='dir',
+                                type=str)
+            parser.add_argument('-D', '--dem',
+                                dest='dem_file',
+                                help='elevation raster (GeoTIFF or ESRI ASCII '
+                                     'grid .asc)\nused by the import to add '
+                                     'the altitude tag to nodes',
+                                metavar='file',
+                                type=str)
+            parser.add_argument('-H', '--hierarchy',
+                                action='store_true',
+                                dest='hierarchy',
+                                help='query paths in contraction '
+                                     'hierarchies of energy\nand number of '
+                                     'roads (saved next to the\nworkspace) '
+                                     'instead of searching them\n'
+                                     '(default=False)')
+            parser.add_argument('-M', '--cache-memory',
+                                dest='cache_memory',
+                                help='search paths between nodes of '
+                                     'interests only when\nneeded, keeping '
+                                     'at most MB megabytes of them\n'
+                                     '(a cache dir is then only read)',
+                                metavar='MB',
+                                type=float)
             parser.add_argument('-c', '--csv-solution',
                                 action='store_true',
                                 dest='csv_solution',
@@ -126,6 +177,22 @@ class CLI(object):
                                 help='import shapefile to workspace',
                                 metavar='file.shp',
                                 type=str)
+            parser.add_argument('-j', '--jobs',
+                                default=1,
+                                dest='jobs',
+                                help='number of processes computing paths '
+                                     'between nodes\nof interests '
+                                     '(default=1)',
+                                metavar='N',
+                                type=int)
+            parser.add_argument('-S', '--snap',
+                                default=0,
+                                dest='snap_tolerance',
+                                help='move nodes of interests which are not '
+                                     'in workspace\nto the nearest node '
+                                     'within m meters (default=0)',
+                                metavar='m',
+                                type=float)
             parser.add_argument('-s', '--solve',
                                 default='problem.yaml',
                                 dest='problem_file',